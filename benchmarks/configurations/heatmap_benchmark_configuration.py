@@ -3,6 +3,7 @@ from typing import Dict, Any, List
 
 from benchmarks.dataclasses.geolimits import GeoLimits
 from etl.helper_functions import get_staging_cell_sizes
+from etl.rollup.heatmap_levels import coarsest_temporal_resolution
 
 
 class HeatmapBenchmarkConfiguration:
@@ -40,10 +41,11 @@ class HeatmapBenchmarkConfiguration:
                              f'Only <{get_staging_cell_sizes()}> are supported')
 
     def get_parameters(self) -> Dict[str, Any]:
-        """Return query parameters based on configuration."""
+        """Return query parameters based on configuration, querying the coarsest heatmap level covering the dates."""
         return {
             'START_ID': self.start_date_id,
             'END_ID': self.end_date_id,
+            'TEMPORAL_RESOLUTION': coarsest_temporal_resolution(self.start_date_id, self.end_date_id),
             'SPATIAL_RESOLUTION': self.resolution,
             'XMIN': self.geolimits.xmin,
             'YMIN': self.geolimits.ymin,
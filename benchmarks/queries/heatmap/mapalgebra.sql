@@ -17,6 +17,7 @@ SELECT
             JOIN dim_ship_type dst on fch.ship_type_id = dst.ship_type_id
             WHERE fch.spatial_resolution = :SPATIAL_RESOLUTION
             AND fch.heatmap_type_id = (SELECT heatmap_type_id FROM dim_heatmap_type WHERE slug = :HEATMAP_TYPE)
+            AND fch.temporal_resolution_sec = :TEMPORAL_RESOLUTION -- coarsest heatmap level covering the dates
             AND timestamp_from_date_time_id(fch.date_id, fch.time_id) <= timestamp_from_date_time_id(:END_ID, 235959) -- end_timestamp
             AND timestamp_from_date_time_id(fch.date_id, fch.time_id) >= timestamp_from_date_time_id(:START_ID, 0) -- start_timestamp
             AND dst.ship_type = ANY(:SHIP_TYPES_A)
@@ -45,6 +46,7 @@ SELECT
             JOIN dim_ship_type dst on fch.ship_type_id = dst.ship_type_id
             WHERE fch.spatial_resolution = :SPATIAL_RESOLUTION
             AND fch.heatmap_type_id = (SELECT heatmap_type_id FROM dim_heatmap_type WHERE slug = :HEATMAP_TYPE)
+            AND fch.temporal_resolution_sec = :TEMPORAL_RESOLUTION -- coarsest heatmap level covering the dates
             AND timestamp_from_date_time_id(fch.date_id, fch.time_id) <= timestamp_from_date_time_id(:END_ID, 235959) -- end_timestamp
             AND timestamp_from_date_time_id(fch.date_id, fch.time_id) >= timestamp_from_date_time_id(:START_ID, 0) -- start_timestamp
             AND dst.ship_type = ANY(:SHIP_TYPES_B)
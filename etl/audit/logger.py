@@ -8,6 +8,12 @@ import pandas as pd
 STATS_KEY = 'statistics'
 ROWS_KEY = 'rows'
 TIMINGS_KEY = 'timings'
+BATCHES_KEY = 'batches'
+ACCESS_METHODS_KEY = 'access_methods'
+ROLLUP_CRITICAL_PATH_KEY = 'rollup_critical_path'
+ROLLED_UP_DATES_KEY = 'rolled_up_dates'
+# Number of bytes read at a time when counting the rows of a file
+ROW_COUNT_CHUNK_SIZE = 16 * 1024 * 1024
 
 
 class AuditLogger:
@@ -20,6 +26,7 @@ class AuditLogger:
         reset_logs(): reset the logs
         to_df(): return a dataframe containing the logs
         get_logs_dict(): return the dictionary containing the logs
+        set_logs_dict(log_dict): continue logging on a dictionary of logs, e.g. from another process
     """
 
     def __init__(self):
@@ -56,13 +63,22 @@ class AuditLogger:
     def _get_file_rows(file_path):
         """Return the number of rows of a given file.
 
+        The file is read in binary chunks and newlines are counted, avoiding decoding and splitting every line.
+
         Keyword arguments:
             file_path: path to the file
         """
-        with open(file_path, 'r') as f:
-            for count, lines in enumerate(f):
-                pass
-        return count + 1
+        rows = 0
+        last_byte = b'\n'
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(ROW_COUNT_CHUNK_SIZE):
+                rows += chunk.count(b'\n')
+                last_byte = chunk[-1:]
+
+        # A last line without a trailing newline is still a row
+        if last_byte != b'\n':
+            rows += 1
+        return rows
 
     def _log_requirements(self, requirements_path='requirements.txt'):
         """Log the requirements of the ETL process.
@@ -85,6 +101,9 @@ class AuditLogger:
             STATS_KEY: {
                 TIMINGS_KEY: {},
                 ROWS_KEY: {},
+                BATCHES_KEY: {},
+                ACCESS_METHODS_KEY: {},
+                ROLLUP_CRITICAL_PATH_KEY: {},
             },
         }
         self._log_requirements()
@@ -106,6 +125,15 @@ class AuditLogger:
         """Return a dictionary containing the logs."""
         return self._log_dict
 
+    def set_logs_dict(self, log_dict):
+        """
+        Replace the dictionary containing the logs, e.g. with the logs of a stage run in another process.
+
+        Keyword arguments:
+            log_dict: the dictionary of logs to continue logging on
+        """
+        self._log_dict = log_dict
+
     def __getitem__(self, key):
         """
         Return the value of a given key in the log dictionary.
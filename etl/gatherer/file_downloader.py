@@ -1,15 +1,30 @@
 """Module for download missing AIS files on demand."""
+import json
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-import wget
+from time import perf_counter
 import zipfile
 import patoolib
 import requests
 from bs4 import BeautifulSoup
-from etl.helper_functions import wrap_with_timings
-from typing import List
+from etl.gatherer.file_index import get_local_file_index
+from etl.helper_functions import wrap_with_timings, wrap_with_retry_and_timing
+from typing import List, Dict, Tuple
+
+PARTIAL_DOWNLOAD_SUFFIX = '.part'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT_SECONDS = 60
+DOWNLOAD_RETRIES = 5
+DEFAULT_DOWNLOAD_WORKERS = 4
+INDEX_CACHE_FILENAME = '.dma_index_cache.json'
+DEFAULT_INDEX_CACHE_TTL_SECONDS = 24 * 60 * 60  # 1 day
+
+# In-process cache of the DMA archive index, keyed by url, with the epoch time the index was fetched.
+_remote_index_cache: Dict[str, Tuple[float, Dict[datetime, 'AisFile']]] = {}
 
 
 @dataclass
@@ -27,20 +42,6 @@ class AisFile:
     url: str
 
 
-def check_file_exists(*paths: List[str]) -> str:
-    """
-    Return first existing path.
-
-    As such, order of arguments matter
-
-    Arguments:
-        *paths: list of file pats
-    """
-    for path in paths:
-        if os.path.isfile(path):
-            return path
-
-
 def ensure_file_for_date(date: datetime, config) -> str:
     """
     Ensure that the file for the given date exists and return the file path.
@@ -52,35 +53,135 @@ def ensure_file_for_date(date: datetime, config) -> str:
         config: the application configuration
     """
     rename_extracted_files(config)
-    expected_filename = f'aisdk-{date.year}-{date.month:02d}-{date.day:02d}.csv'
-    path = os.path.join(config['DataSource']['ais_path'], expected_filename)
 
     # First, check if a file exists.
-    pickle_path = path.replace('.csv', '.pkl')
-    file_path = check_file_exists(pickle_path, path)
+    file_path = _existing_file_for_date(date, config)
     if file_path is not None:
         print(f'File already exists: {file_path}')
         return file_path
 
-    # The file does not exist, check what files are available from DMA.
-    file_names = get_file_names(config['DataSource']['ais_url'])
+    # The file does not exist, check what files are available from DMA and download it.
+    [file] = _find_files_for_dates([date], config)
+    ensure_file(file, config)
+    extract(file, config)
+
+    return _ensure_extracted_file_for_date(date, config)
+
+
+def ensure_files_for_dates(dates: List[datetime], config) -> None:
+    """
+    Ensure that the files for all the given dates exist, downloading the missing archives concurrently.
+
+    Archives are downloaded using a bounded pool of threads, and extracted one at a time once all downloads finish.
+    Raises exception if a file has not already been downloaded and cannot be found on AIS website.
+
+    Keyword arguments:
+        dates: the dates to ensure the files for
+        config: the application configuration
+    """
+    rename_extracted_files(config)
+    missing_dates = [date for date in dates if _existing_file_for_date(date, config) is None]
+    if not missing_dates:
+        print('All files already exist')
+        return
+
+    # Several dates can be contained in the same monthly archive, so only download each archive once.
+    files = {file.name: file for file in _find_files_for_dates(missing_dates, config)}
+
+    download_workers = int(config['DataSource'].get('download_workers', DEFAULT_DOWNLOAD_WORKERS))
+    with ThreadPoolExecutor(max_workers=download_workers) as pool:
+        # Consume the results to re-raise any exception from the downloads
+        list(pool.map(lambda file: ensure_file(file, config), files.values()))
+
+    for file in files.values():
+        wrap_with_timings(f'Extracting file: {file.name}', lambda: extract(file, config))
+
+    for date in missing_dates:
+        _ensure_extracted_file_for_date(date, config)
+
+
+def _expected_path_for_date(date: datetime, config) -> str:
+    """
+    Return the path of the extracted csv file for the given date.
+
+    Keyword arguments:
+        date: the date to get the path for
+        config: the application configuration
+    """
+    expected_filename = f'aisdk-{date.year}-{date.month:02d}-{date.day:02d}.csv'
+    return os.path.join(config['DataSource']['ais_path'], expected_filename)
+
+
+def _existing_file_for_date(date: datetime, config) -> str | None:
+    """
+    Return the path of the pickle or csv file for the given date, or None if neither exist.
+
+    Keyword arguments:
+        date: the date to find the file for
+        config: the application configuration
+    """
+    index = get_local_file_index(config)
+    path = _expected_path_for_date(date, config)
+    pickle_path = path.replace('.csv', '.pkl')
+    for candidate in [pickle_path, path]:
+        if index.contains(os.path.basename(candidate)):
+            return candidate
+    return None
+
+
+def _find_files_for_dates(dates: List[datetime], config) -> List[AisFile]:
+    """
+    Return the archives containing the given dates, using the cached DMA index.
+
+    If a date is not found in the cached index, the index is fetched again in case the archive was published since.
+
+    Keyword arguments:
+        dates: the dates to find the archives for
+        config: the application configuration
+    """
+    try:
+        file_names = get_cached_file_names(config)
+        return [_find_file_for_date(date, file_names) for date in dates]
+    except FileNotFoundError:
+        file_names = get_cached_file_names(config, refresh=True)
+        return [_find_file_for_date(date, file_names) for date in dates]
+
+
+def _find_file_for_date(date: datetime, file_names: Dict[datetime, AisFile]) -> AisFile:
+    """
+    Return the archive containing the given date.
+
+    Falls back to the monthly archive if no archive exists for the specific date.
+    Raises exception if neither can be found.
 
+    Keyword arguments:
+        date: the date to find the archive for
+        file_names: the available archives, as returned by get_file_names
+    """
     # Check if our current date is in the list of available files.
     # If not, check if the month is in the list of available files.
     if date not in file_names:
         print(f'File not found for date: {date}. Trying first day of month.')
         date = datetime(year=date.year, month=date.month, day=1)
         if date not in file_names:
-            raise Exception(f'File for {date} not found as existing on Danish Maritime Authority website.')
+            raise FileNotFoundError(f'File for {date} not found as existing on Danish Maritime Authority website.')
 
-    # The file exists, download it.
-    file = file_names[date]
-    ensure_file(file, config)
-    extract(file, config)
+    return file_names[date]
+
+
+def _ensure_extracted_file_for_date(date: datetime, config) -> str:
+    """
+    Return the path of the extracted csv file for the given date, raising an exception if it does not exist.
+
+    Keyword arguments:
+        date: the date to check the file for
+        config: the application configuration
+    """
+    path = _expected_path_for_date(date, config)
 
     # In case the downloaded file did not actually contain the desired date, raise an exception.
-    if not os.path.isfile(os.path.join(config['DataSource']['ais_path'], expected_filename)):
-        raise Exception(f"Expected file {expected_filename} was not found in {config['DataSource']['ais_path']}")
+    if not get_local_file_index(config).contains(os.path.basename(path)):
+        raise Exception(f"Expected file {os.path.basename(path)} was not found in {config['DataSource']['ais_path']}")
 
     return path
 
@@ -139,6 +240,70 @@ def get_file_names(ais_url: str) -> dict:
     return ais_files
 
 
+def get_cached_file_names(config, refresh: bool = False) -> Dict[datetime, AisFile]:
+    """
+    Return AIS filenames from the DMA webpage, using an in-process and on-disk cache of the index.
+
+    The on-disk cache is stored in the AIS data folder, and is considered fresh for index_cache_ttl_seconds.
+
+    Keyword arguments:
+        config: the application configuration
+        refresh: whether to ignore the cached index and fetch it again (default: False)
+    """
+    ais_url = config['DataSource']['ais_url']
+    ttl_seconds = int(config['DataSource'].get('index_cache_ttl_seconds', DEFAULT_INDEX_CACHE_TTL_SECONDS))
+    cache_path = os.path.join(config['DataSource']['ais_path'], INDEX_CACHE_FILENAME)
+
+    if not refresh and ais_url not in _remote_index_cache:
+        cached = _read_index_cache(cache_path, ais_url)
+        if cached is not None:
+            _remote_index_cache[ais_url] = cached
+
+    if refresh or ais_url not in _remote_index_cache or \
+            time.time() - _remote_index_cache[ais_url][0] > ttl_seconds:
+        file_names = wrap_with_timings('Fetching DMA archive index', lambda: get_file_names(ais_url))
+        _remote_index_cache[ais_url] = (time.time(), file_names)
+        _write_index_cache(cache_path, ais_url, file_names)
+
+    return _remote_index_cache[ais_url][1]
+
+
+def _read_index_cache(cache_path: str, ais_url: str) -> Tuple[float, Dict[datetime, AisFile]] | None:
+    """
+    Read the on-disk DMA index cache, returning None if it does not exist or is for another url.
+
+    Keyword arguments:
+        cache_path: the path of the cache file
+        ais_url: the url the index was fetched from
+    """
+    if not os.path.isfile(cache_path):
+        return None
+    with open(cache_path, 'r') as f:
+        cache = json.load(f)
+    if cache['url'] != ais_url:
+        return None
+    return cache['fetched_at'], {date_from_filename(name): AisFile(name, url) for name, url in cache['files'].items()}
+
+
+def _write_index_cache(cache_path: str, ais_url: str, file_names: Dict[datetime, AisFile]) -> None:
+    """
+    Atomically write the on-disk DMA index cache.
+
+    Keyword arguments:
+        cache_path: the path of the cache file
+        ais_url: the url the index was fetched from
+        file_names: the fetched index
+    """
+    cache = {
+        'url': ais_url,
+        'fetched_at': time.time(),
+        'files': {file.name: file.url for file in file_names.values()},
+    }
+    with open(cache_path + PARTIAL_DOWNLOAD_SUFFIX, 'w') as f:
+        json.dump(cache, f)
+    os.replace(cache_path + PARTIAL_DOWNLOAD_SUFFIX, cache_path)
+
+
 def extract(file: AisFile, config):
     """
     Extract the AIS file from its archieve.
@@ -146,12 +311,16 @@ def extract(file: AisFile, config):
     Keyword arguments:
         file: name and url of the AIS file
     """
+    index = get_local_file_index(config)
     path = os.path.join(config['DataSource']['ais_path'], file.name)
     if path.endswith('.zip'):
         with zipfile.ZipFile(path, 'r') as zip_ref:
             zip_ref.extractall(config['DataSource']['ais_path'])
+            index.add(*[name for name in zip_ref.namelist() if not name.endswith('/')])
     elif path.endswith('.rar'):
         patoolib.extract_archive(path, config['DataSource']['ais_path'])
+        # The names of the extracted files are not known, so list the folder again
+        index.refresh()
 
     rename_extracted_files(config)
 
@@ -170,13 +339,13 @@ def rename_extracted_files(config):
         (r'aisdk_(\d{4})(\d{2})(\d{2}).csv', r'aisdk-\1-\2-\3.csv'),
     ]
 
-    path = config['DataSource']['ais_path']
+    index = get_local_file_index(config)
 
-    for file in os.listdir(path):
+    for file in index.names():
         for regex, repl in rename_regex:
             if re.match(regex, file):
                 new_name = re.sub(regex, repl, file)
-                os.rename(os.path.join(path, file), os.path.join(path, new_name))
+                index.rename(file, new_name)
 
 
 def ensure_file(file: AisFile, config):
@@ -190,8 +359,90 @@ def ensure_file(file: AisFile, config):
         config: the application configuration
     """
     # Download the file if it does not exist.
+    index = get_local_file_index(config)
     path = os.path.join(config['DataSource']['ais_path'], file.name)
-    if not os.path.isfile(path):
-        wrap_with_timings(f"Downloading file: {file.name}", lambda: wget.download(file.url, out=path))
+    if not index.contains(file.name):
+        # Every retry resumes from the partially downloaded file.
+        wrap_with_retry_and_timing(f"Downloading file: {file.name}", lambda: download_file(file.url, path),
+                                   retries=DOWNLOAD_RETRIES)
+        index.add(file.name)
     else:
         print(f"File already exists: {path}")
+
+
+def download_file(url: str, path: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> None:
+    """
+    Download a file, resuming a previous partial download of it if one exists.
+
+    The file is streamed to a temporary file next to the path, which is atomically renamed once complete.
+    A partial download is resumed using a HTTP Range request, and restarted if the server does not support ranges.
+    The download is complete when the temporary file has the size announced by the server. Otherwise, such as when the
+    connection is closed early, the temporary file is kept to be resumed and an IOError is raised.
+
+    Keyword arguments:
+        url: the url to download the file from
+        path: the path to store the downloaded file at
+        chunk_size: the number of bytes to write at a time (default: 1 MiB)
+    """
+    part_path = path + PARTIAL_DOWNLOAD_SUFFIX
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+
+    start = perf_counter()
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+        downloaded = _write_response(response, part_path, offset, chunk_size)
+        expected_size = _expected_size(response)
+    seconds_elapsed = perf_counter() - start
+
+    if expected_size is not None and os.path.getsize(part_path) != expected_size:
+        raise IOError(f'Incomplete download of {os.path.basename(path)}: {os.path.getsize(part_path)} of '
+                      f'{expected_size} bytes written to {part_path}')
+    os.replace(part_path, path)
+    throughput = downloaded / (1024 * 1024) / max(seconds_elapsed, 1e-6)
+    print(f'Downloaded {downloaded} bytes of {os.path.basename(path)} in {seconds_elapsed:.2f} seconds '
+          f'({throughput:.2f} MiB/s), resumed at byte {offset}')
+
+
+def _write_response(response: requests.Response, part_path: str, offset: int, chunk_size: int) -> int:
+    """
+    Write the body of a download response to the partial file and return the number of bytes written.
+
+    Keyword arguments:
+        response: the streamed response of the download request
+        part_path: the path of the partial file
+        offset: the number of bytes requested to be skipped using a Range request
+        chunk_size: the number of bytes to write at a time
+    """
+    # 416 Range Not Satisfiable is returned when the partial file is already complete.
+    if offset > 0 and response.status_code == requests.codes.requested_range_not_satisfiable:
+        return 0
+    response.raise_for_status()
+
+    # Append when the server honours the range request, otherwise start over with the full body.
+    mode = 'ab' if response.status_code == requests.codes.partial_content else 'wb'
+    written = 0
+    with open(part_path, mode) as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def _expected_size(response: requests.Response) -> int | None:
+    """
+    Return the size of the complete file announced by a download response, or None if it is not announced.
+
+    The size is the total of the Content-Range of partial and unsatisfiable range responses, and otherwise the
+    Content-Length of the body. Encoded bodies are decoded while streamed, so their Content-Length is not used.
+
+    Keyword arguments:
+        response: the streamed response of the download request
+    """
+    content_range = response.headers.get('Content-Range')
+    if content_range is not None:
+        total = content_range.rsplit('/', 1)[-1].strip()
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get('Content-Length')
+    if content_length is None or 'Content-Encoding' in response.headers:
+        return None
+    return int(content_length)
@@ -0,0 +1,102 @@
+"""Module keeping an in-process index of the files in the AIS data folder."""
+import os
+from threading import Lock
+from typing import Dict, Set, Iterable, List
+
+
+class LocalFileIndex:
+    """
+    Class representing the names of the files in a folder, kept up to date as the ETL creates and renames files.
+
+    The folder is only listed once, on first use, after which lookups are set lookups.
+    Files created, renamed or removed outside the ETL after the first use are not reflected unless refreshed.
+
+    Methods
+    -------
+    contains(name): whether a file with the given name exists in the folder
+    names(): the names of all files in the folder
+    add(*names): register files as created in the folder
+    rename(old_name, new_name): rename a file in the folder
+    refresh(): re-list the folder
+    """
+
+    def __init__(self, folder: str):
+        """
+        Construct an instance of the LocalFileIndex class.
+
+        Keyword arguments:
+            folder: the folder to index
+        """
+        self.folder = folder
+        self._names: Set[str] | None = None
+        # Downloads register their files from multiple threads
+        self._lock = Lock()
+
+    def _ensure_listed(self) -> Set[str]:
+        """Return the indexed names, listing the folder if it has not been listed yet."""
+        if self._names is None:
+            self._names = {name for name in os.listdir(self.folder)
+                           if os.path.isfile(os.path.join(self.folder, name))}
+        return self._names
+
+    def contains(self, name: str) -> bool:
+        """
+        Return whether a file with the given name exists in the folder.
+
+        Keyword arguments:
+            name: the name of the file
+        """
+        with self._lock:
+            return name in self._ensure_listed()
+
+    def names(self) -> List[str]:
+        """Return the names of all files in the folder."""
+        with self._lock:
+            return list(self._ensure_listed())
+
+    def add(self, *names: Iterable[str]) -> None:
+        """
+        Register files as created in the folder.
+
+        Keyword arguments:
+            *names: the names of the created files
+        """
+        with self._lock:
+            self._ensure_listed().update(names)
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        """
+        Rename a file in the folder and in the index.
+
+        Keyword arguments:
+            old_name: the current name of the file
+            new_name: the new name of the file
+        """
+        with self._lock:
+            os.rename(os.path.join(self.folder, old_name), os.path.join(self.folder, new_name))
+            names = self._ensure_listed()
+            names.discard(old_name)
+            names.add(new_name)
+
+    def refresh(self) -> None:
+        """Re-list the folder, used when files are created without knowing their names."""
+        with self._lock:
+            self._names = None
+            self._ensure_listed()
+
+
+# Indices of the folders used in this process, keyed by folder path.
+_local_file_indices: Dict[str, LocalFileIndex] = {}
+
+
+def get_local_file_index(config) -> LocalFileIndex:
+    """
+    Return the index of the AIS data folder.
+
+    Keyword arguments:
+        config: the application configuration
+    """
+    folder = config['DataSource']['ais_path']
+    if folder not in _local_file_indices:
+        _local_file_indices[folder] = LocalFileIndex(folder)
+    return _local_file_indices[folder]
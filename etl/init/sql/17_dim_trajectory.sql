@@ -15,3 +15,7 @@ CREATE TABLE dim_trajectory
 -- Use gist as it is potentially overlappping.
 CREATE INDEX dim_trajectory_trajectory_idx ON dim_trajectory USING gist (trajectory);
 
+
+-- Every value reserves a block of 65536 trajectory sub ids, such that concurrent loaders never allocate the same ids.
+-- The 32768 blocks cover all non-negative integers, after which the ids are reused.
+CREATE SEQUENCE trajectory_sub_id_block_seq AS integer MINVALUE 0 MAXVALUE 32767 START 0 CYCLE;
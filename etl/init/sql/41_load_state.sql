@@ -0,0 +1,6 @@
+-- The load state of every date, such that dates left partially loaded by a failed load are detected
+CREATE TABLE IF NOT EXISTS load_state (
+    date_id INTEGER PRIMARY KEY,
+    state text NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
@@ -1,7 +1,9 @@
 -- Create schema staging
 CREATE SCHEMA IF NOT EXISTS staging;
--- Create a staging table for trajectories split into 5km.
-CREATE TABLE IF NOT EXISTS staging.split_trajectories (
+-- Recreate the staging table, as it is transient and was not partitioned in warehouses initialized before
+DROP TABLE IF EXISTS staging.split_trajectories;
+-- Create a staging table for trajectories split into 5km, partitioned by the rolled up date ranges.
+CREATE TABLE staging.split_trajectories (
     trajectory_sub_id int,
     ship_id int,
     nav_status_id int,
@@ -10,7 +12,8 @@ CREATE TABLE IF NOT EXISTS staging.split_trajectories (
     trajectory tgeompoint,
     heading tfloat,
     draught tfloat,
-    partition_id SMALLINT
-);
+    partition_id SMALLINT,
+    date_id int
+) PARTITION BY RANGE (date_id);
 
 SELECT create_distributed_table('staging.split_trajectories', 'partition_id', colocate_with => 'fact_cell_5000m');
\ No newline at end of file
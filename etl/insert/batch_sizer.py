@@ -0,0 +1,145 @@
+"""Module choosing batch sizes for parameterized inserts based on the measured throughput."""
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from etl.insert.copy_stream import format_copy_value
+
+# PostgreSQL does not accept more bind parameters in a single statement
+MAX_QUERY_PARAMETERS = 65535
+# Upper bound on the estimated size of the parameters of a single batch
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+# Number of rows rendered to estimate the byte size of a row of a table
+ROW_BYTES_SAMPLE_ROWS = 100
+# Factor the batch size is initially grown or shrunk by between batches
+INITIAL_STEP = 2.0
+# The batch size is considered converged once the step is smaller than this factor
+CONVERGED_STEP = 1.05
+
+
+class AdaptiveBatchSizer:
+    """
+    Class choosing the batch size of a table by hill climbing on the measured rows per second.
+
+    The batch size is grown while the throughput improves. When a batch is slower than the previous, the direction is
+    reversed and the step halved, until the step converges and the size with the best throughput is used.
+    The size is always limited by the parameter limit of PostgreSQL and the estimated byte size of the batch.
+
+    Methods
+    -------
+    limit(entries): limit the batch size based on the width of the entries
+    next_size(): the size of the next batch
+    record(rows, seconds): record the time taken to insert a batch
+    statistics(): the chosen batch size and its throughput
+    """
+
+    def __init__(self, table_name: str, initial_size: int):
+        """
+        Construct an instance of the AdaptiveBatchSizer class.
+
+        Keyword arguments:
+            table_name: the name of the table the batches are inserted into
+            initial_size: the size of the first batch
+        """
+        self.table_name = table_name
+        self.size = initial_size
+        self.max_size = MAX_QUERY_PARAMETERS
+        self.step = INITIAL_STEP
+        self.growing = True
+        self.last_throughput: float | None = None
+        self.best_size = initial_size
+        self.best_throughput: float | None = None
+        self.batches = 0
+        self.row_bytes: int | None = None
+
+    @property
+    def converged(self) -> bool:
+        """Return whether the batch size has converged."""
+        return self.step < CONVERGED_STEP
+
+    def limit(self, entries: pd.DataFrame) -> None:
+        """
+        Limit the batch size by the number of parameters and the estimated byte size of a row of the entries.
+
+        The byte size of a row is estimated once per table, from the text rendering of a sample of the entries, which
+        is how values such as MobilityDB and WKB values are sent.
+
+        Keyword arguments:
+            entries: the entries to insert, with a column per query parameter
+        """
+        column_count = max(1, len(entries.columns))
+        if self.row_bytes is None and not entries.empty:
+            self.row_bytes = estimate_row_bytes(entries)
+        self.max_size = max(1, min(MAX_QUERY_PARAMETERS // column_count, MAX_BATCH_BYTES // (self.row_bytes or 1)))
+
+    def next_size(self) -> int:
+        """Return the size of the next batch."""
+        size = self.best_size if self.converged else self.size
+        return max(1, min(size, self.max_size))
+
+    def record(self, rows: int, seconds: float) -> None:
+        """
+        Record the time taken to insert a batch, and choose the size of the next batch.
+
+        Batches smaller than the chosen size, e.g. the last batch, are not used for tuning.
+
+        Keyword arguments:
+            rows: the number of rows in the batch
+            seconds: the time taken to insert the batch
+        """
+        self.batches += 1
+        if rows < self.next_size() or seconds <= 0:
+            return
+
+        throughput = rows / seconds
+        if self.best_throughput is None or throughput > self.best_throughput:
+            self.best_size, self.best_throughput = rows, throughput
+        if self.converged:
+            return
+
+        if self.last_throughput is not None and throughput < self.last_throughput:
+            self.growing = not self.growing
+            self.step = 1 + (self.step - 1) / 2
+        self.last_throughput = throughput
+        self.size = max(1, round(rows * self.step if self.growing else rows / self.step))
+
+    def statistics(self) -> Dict[str, float | int | bool]:
+        """Return the chosen batch size, its throughput and whether it has converged, for the audit statistics."""
+        return {
+            'batch_size': self.next_size(),
+            'rows_per_second': self.best_throughput,
+            'batches': self.batches,
+            'converged': self.converged,
+        }
+
+
+def estimate_row_bytes(entries: pd.DataFrame) -> int:
+    """
+    Return the average byte size of the text rendering of the values of a sample of rows, spread over the entries.
+
+    Keyword arguments:
+        entries: the entries to estimate the row size of
+    """
+    positions = np.unique(np.linspace(0, len(entries) - 1, min(len(entries), ROW_BYTES_SAMPLE_ROWS)).astype(int))
+    sample = entries.iloc[positions]
+    sample_bytes = sum(len(format_copy_value(value).encode()) + 1
+                       for row in sample.itertuples(index=False, name=None) for value in row)
+    return max(1, sample_bytes // len(sample))
+
+
+# Batch sizers used in this process, keyed by table name, such that tuning continues across days.
+_batch_sizers: Dict[str, AdaptiveBatchSizer] = {}
+
+
+def get_batch_sizer(table_name: str, initial_size: int) -> AdaptiveBatchSizer:
+    """
+    Return the batch sizer of a table, creating it on first use.
+
+    Keyword arguments:
+        table_name: the name of the table the batches are inserted into
+        initial_size: the size of the first batch, if the sizer is created
+    """
+    if table_name not in _batch_sizers:
+        _batch_sizers[table_name] = AdaptiveBatchSizer(table_name, initial_size)
+    return _batch_sizers[table_name]
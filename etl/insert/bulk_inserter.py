@@ -1,11 +1,20 @@
 """Class implementing bulk insertion of data into a database."""
-from math import ceil
+from typing import Callable, Dict, List
 
 import pandas as pd
-from etl.audit.logger import global_audit_logger as gal, ROWS_KEY, TIMINGS_KEY
-from etl.helper_functions import measure_time
+from etl.audit.logger import global_audit_logger as gal, ROWS_KEY, TIMINGS_KEY, BATCHES_KEY
+from etl.helper_functions import measure_time, get_config, T
+from etl.insert.batch_sizer import get_batch_sizer
+from etl.insert.copy_stream import CopyStream
+from etl.insert.dimension_key_cache import get_dimension_key_cache, hash_natural_key, KEY_HASH_COL
 from sqlalchemy import Connection
 
+# Number of bytes sent to the database at a time when streaming rows using COPY
+COPY_BUFFER_SIZE = 1024 * 1024
+# Dimension resolution modes, see the dimension_resolution configuration
+DIMENSION_RESOLUTION_SELECT_INSERT = 'select_insert'
+DIMENSION_RESOLUTION_STAGED = 'staged'
+
 
 class BulkInserter:
     """
@@ -15,7 +24,7 @@ class BulkInserter:
 
     Attributes
     ----------
-    bulk_size: number of rows to insert in a single transaction
+    bulk_size: number of rows in the first batch, after which the batch size is tuned per table
 
     """
 
@@ -49,7 +58,7 @@ class BulkInserter:
 
         Keyword arguments:
             dimension_name: the table name of the dimension being inserted into
-            bulk_size: the number of rows to insert in a single transaction (default: 1000)
+            bulk_size: the number of rows in the first batch of the dimension (default: 10000)
             id_col_name: the name of the column containing the id of the dimension (default: None)
         """
         self.bulk_size = bulk_size
@@ -66,12 +75,169 @@ class BulkInserter:
             insert_query: the query used to insert into the database
             select_query: the query used to select from the database
         """
-        num_batches = ceil(len(entries) / self.bulk_size)
-        batches = [entries[i * self.bulk_size:(i + 1) * self.bulk_size] for i in range(num_batches)]
-        inserted_data = [self.__select_insert(batch, conn, insert_query, select_query) for batch in batches]
+        inserted_data = self._batched(entries, lambda batch: self.__select_insert(batch, conn, insert_query,
+                                                                                  select_query))
 
         return pd.concat(inserted_data)
 
+    def _batched(self, entries: pd.DataFrame, insert_batch: Callable[[pd.DataFrame], T]) -> List[T]:
+        """
+        Split entries into batches and insert them one at a time, tuning the batch size on the measured throughput.
+
+        The batch size is limited by the parameter limit and the row width, and is logged in the GAL with its
+        throughput.
+
+        Keyword arguments:
+            entries: dataframe containing rows to be inserted, with a column per query parameter
+            insert_batch: function inserting a single batch
+        """
+        sizer = get_batch_sizer(self.dimension_name, self.bulk_size)
+        sizer.limit(entries)
+
+        results = []
+        start = 0
+        while start < len(entries):
+            batch = entries.iloc[start:start + sizer.next_size()]
+            (result, seconds_elapsed) = measure_time(lambda: insert_batch(batch))
+            sizer.record(len(batch), seconds_elapsed)
+            results.append(result)
+            start += len(batch)
+
+        gal[BATCHES_KEY][self.dimension_name] = sizer.statistics()
+        return results
+
+    def _cached_select_insert(self, entries: pd.DataFrame, conn, insert_query: str, select_query: str,
+                              warm_query: str, key_columns: Dict[str, str],
+                              nullable_columns: List[str] = (),
+                              key_hash_columns: List[str] | None = None) -> pd.DataFrame:
+        """
+        Resolve ids of entries using the dimension key cache, and resolve only the entries not cached in the database.
+
+        Entries not cached are resolved using select-insert, or using a staged upsert if the dimension_resolution
+        configuration is 'staged'.
+
+        Keyword arguments:
+            entries: dataframes containing rows to be inserted
+            conn: database connection used for insertion
+            insert_query: the query used to insert into the database
+            select_query: the query used to select from the database
+            warm_query: the query used to select all rows of the dimension when warming the cache
+            key_columns: mapping from the entries columns to the dimension columns, used by the staged upsert
+            nullable_columns: the entries columns that can be null, used by the staged upsert (default: none)
+            key_hash_columns: the natural key columns hashed into the KEY_HASH_COL column of the entries, used to
+                look up entries in the cache instead of all the natural key columns (default: None)
+        """
+        cache = get_dimension_key_cache(self.dimension_name, self.id_col_name, warm_query, key_hash_columns)
+        cache.ensure_warm(conn)
+
+        result = cache.lookup(entries)
+        hits = result[result[self.id_col_name].notna()]
+        misses = result[result[self.id_col_name].isna()].drop(columns=[self.id_col_name])
+        gal[ROWS_KEY][f"{self.dimension_name}_cache_hits"] = len(hits)
+        if misses.empty:
+            return hits
+
+        resolved = self._resolve_misses(misses, conn, insert_query, select_query, key_columns, nullable_columns,
+                                        key_hash_columns)
+        resolved = resolved[entries.columns.tolist() + [self.id_col_name]]
+        cache.add(resolved)
+
+        return pd.concat([hits, resolved])
+
+    def _resolve_misses(self, misses: pd.DataFrame, conn, insert_query: str, select_query: str,
+                        key_columns: Dict[str, str], nullable_columns: List[str],
+                        key_hash_columns: List[str] | None) -> pd.DataFrame:
+        """
+        Resolve the ids of entries not in the dimension key cache, using the configured dimension resolution.
+
+        Keyword arguments:
+            misses: dataframe containing the entries not in the cache
+            conn: database connection used for insertion
+            insert_query: the query used to insert into the database
+            select_query: the query used to select from the database
+            key_columns: mapping from the entries columns to the dimension columns, used by the staged upsert
+            nullable_columns: the entries columns that can be null, used by the staged upsert
+            key_hash_columns: the natural key columns hashed into the KEY_HASH_COL column, or None if not used
+        """
+        # The hash is not part of the dimension, so it is recomputed for the resolved entries
+        natural_keys = misses.drop(columns=[KEY_HASH_COL]) if key_hash_columns is not None else misses
+
+        resolution = get_config()['Database'].get('dimension_resolution', DIMENSION_RESOLUTION_SELECT_INSERT)
+        if resolution == DIMENSION_RESOLUTION_STAGED:
+            resolved = self._staged_upsert(natural_keys, conn, key_columns, nullable_columns)
+        else:
+            resolved = self._bulk_select_insert(natural_keys, conn, insert_query, select_query)
+
+        if key_hash_columns is not None:
+            resolved = resolved.assign(**{KEY_HASH_COL: hash_natural_key(resolved, key_hash_columns)})
+        return resolved
+
+    def _staged_upsert(self, entries: pd.DataFrame, conn: Connection, key_columns: Dict[str, str],
+                       nullable_columns: List[str] = ()) -> pd.DataFrame:
+        """
+        Ensure the existence of entries and return them with their ids, using a temporary staging table.
+
+        The distinct entries are copied into a temporary table, from which a single statement inserts the missing rows
+        and returns the ids of both the inserted and the existing rows, instead of a select and insert round trip per
+        batch. Creating the temporary table and the copy are exchanges of their own.
+
+        Keyword arguments:
+            entries: dataframe containing the distinct natural keys to resolve
+            conn: database connection used for insertion
+            key_columns: mapping from the entries columns to the dimension columns
+            nullable_columns: the entries columns that can be null, which are compared null-safe (default: none)
+        """
+        staging_table = f'staging_{self.dimension_name}'
+        table_columns = ', '.join(key_columns.values())
+
+        # The staging table only lives for the current transaction, and is emptied if reused within it.
+        conn.exec_driver_sql(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging_table} ON COMMIT DROP AS
+                SELECT {table_columns} FROM {self.dimension_name} WITH NO DATA;
+            TRUNCATE {staging_table}
+        """)
+        self._copy(entries[list(key_columns.keys())].rename(columns=key_columns), conn, staging_table)
+
+        # Null-safe comparison prevents hash joins, so only use it for the columns that can be null.
+        join_condition = ' AND '.join(
+            f'dim.{column} IS NOT DISTINCT FROM staged.{column}' if entries_column in nullable_columns
+            else f'dim.{column} = staged.{column}'
+            for entries_column, column in key_columns.items()
+        )
+        select_columns = ', '.join(f'dim.{column} AS {entries_column}'
+                                   for entries_column, column in key_columns.items())
+        staged_columns = ', '.join(f'staged.{column}' for column in key_columns.values())
+        existing_query = f"""
+            SELECT dim.{self.id_col_name}, {select_columns}
+            FROM {staging_table} staged
+            JOIN {self.dimension_name} dim ON {join_condition}
+        """
+        # The existing rows are selected with the snapshot of the statement, so they exclude the inserted rows
+        query = f"""
+            WITH inserted AS (
+                INSERT INTO {self.dimension_name} ({table_columns})
+                SELECT {staged_columns} FROM {staging_table} staged
+                WHERE NOT EXISTS (SELECT 1 FROM {self.dimension_name} dim WHERE {join_condition})
+                ON CONFLICT DO NOTHING
+                RETURNING *
+            )
+            SELECT dim.{self.id_col_name}, {select_columns} FROM inserted dim
+            UNION ALL
+            {existing_query}
+        """
+        resolved = pd.read_sql_query(query, conn)
+        if len(resolved) < len(entries):
+            # Rows inserted concurrently after the snapshot conflict without being returned, so select them again
+            resolved = pd.read_sql_query(existing_query, conn)
+        gal[ROWS_KEY][f"{self.dimension_name}_staged"] = len(entries)
+
+        if len(resolved) != len(entries):
+            raise Exception(f'Resolved {len(resolved)} of {len(entries)} staged entries for {self.dimension_name}, '
+                            f'entries conflicting with an existing row on other columns are not resolved.')
+
+        # Merge onto the entries to keep their dtypes for the natural keys
+        return entries.merge(resolved, on=list(key_columns.keys()), how='left')
+
     def __select_insert(self, batch: pd.DataFrame, conn: Connection,
                         insert_query: str, select_query: str) -> pd.DataFrame:
         """
@@ -122,15 +288,52 @@ class BulkInserter:
             query: the query used to insert into the database
             fetch: whether to fetch the result from executing the query (default True)
         """
-        num_batches = ceil(len(entries) / self.bulk_size)
-        batches = [entries[i * self.bulk_size:(i + 1) * self.bulk_size] for i in range(num_batches)]
-        fetched_dataframe = [self.__insert(batch, conn, query, fetch=fetch) for batch in batches]
+        fetched_dataframe = self._batched(entries, lambda batch: self.__insert(batch, conn, query, fetch=fetch))
 
         if not fetch:
             return
 
         return pd.concat(fetched_dataframe)
 
+    def _bulk_copy(self, entries: pd.DataFrame, conn: Connection, table_name: str) -> None:
+        """
+        Stream entries into a table using COPY FROM STDIN, using the dataframe column names as table columns.
+
+        The rows are formatted as they are sent, so the whole payload is never built in memory.
+        The copy is part of the current transaction of the connection.
+
+        Keyword arguments:
+            entries: dataframe containing the rows to be inserted
+            conn: database connection used for insertion
+            table_name: the table to insert into
+        """
+        print(f"Copying {len(entries)} rows into {table_name}...")
+        self._copy(entries, conn, table_name)
+
+        # Log the number of rows inserted in the GAL
+        if self.dimension_name not in gal[ROWS_KEY]:
+            gal[ROWS_KEY][self.dimension_name] = 0
+        gal[ROWS_KEY][self.dimension_name] += len(entries)
+
+    @staticmethod
+    def _copy(entries: pd.DataFrame, conn: Connection, table_name: str) -> None:
+        """
+        Stream entries into a table using COPY FROM STDIN, using the dataframe column names as table columns.
+
+        Keyword arguments:
+            entries: dataframe containing the rows to be inserted
+            conn: database connection used for insertion
+            table_name: the table to insert into
+        """
+        # Begin the transaction in SQLAlchemy, such that the copy is committed by conn.commit()
+        if not conn.in_transaction():
+            conn.begin()
+
+        columns = ', '.join(entries.columns)
+        query = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT text)"
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(query, CopyStream(entries), size=COPY_BUFFER_SIZE)
+
     def __insert(self, batch: pd.DataFrame, conn: Connection, query: str, fetch: bool) -> pd.DataFrame:
         """
         Insert a batch into the database and returns database IDs.
@@ -0,0 +1,98 @@
+"""Module for streaming dataframes to PostgreSQL using COPY in the text format."""
+import io
+from datetime import timedelta
+from typing import Iterator, Tuple
+
+import pandas as pd
+
+COPY_NULL = '\\N'
+# Characters with special meaning in the COPY text format, and their escaped representation.
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def format_copy_value(value) -> str:
+    """
+    Return the COPY text format representation of a single value.
+
+    Values are converted the same way they are converted when passed as query parameters.
+    Types without special handling, such as MobilityDB temporal types, use their string representation.
+
+    Keyword arguments:
+        value: the value to format
+    """
+    if value is None or value is pd.NA or value is pd.NaT:
+        return COPY_NULL
+    # Ids become floats when merged with missing values, and must be accepted by integer columns
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, timedelta):
+        return f'{value.days} days {value.seconds}.{value.microseconds:06d} seconds'
+    if isinstance(value, (list, tuple)):
+        return _format_array(value).translate(COPY_ESCAPES)
+    return str(value).translate(COPY_ESCAPES)
+
+
+def _format_array(values) -> str:
+    """
+    Return the PostgreSQL array literal of a list of values.
+
+    Keyword arguments:
+        values: the values of the array
+    """
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append('NULL')
+            continue
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        elements.append(f'"{escaped}"')
+    return '{' + ','.join(elements) + '}'
+
+
+class CopyStream(io.RawIOBase):
+    """
+    Class representing a dataframe as a readable stream in the COPY text format.
+
+    Rows are formatted lazily as they are read, so the full payload is never held in memory.
+
+    Methods
+    -------
+    readinto(buffer): read the next bytes of the stream into the buffer
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Construct an instance of the CopyStream class.
+
+        Keyword arguments:
+            df: the dataframe to stream, in the column order of the COPY statement
+        """
+        self._rows: Iterator[Tuple] = df.itertuples(index=False, name=None)
+        self._pending = b''
+
+    def readable(self) -> bool:
+        """Return that the stream is readable."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        Read the next bytes of the stream into the buffer, returning the number of bytes read.
+
+        Keyword arguments:
+            buffer: the writable buffer to read into
+        """
+        chunks = [self._pending]
+        available = len(self._pending)
+        while available < len(buffer):
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ('\t'.join(format_copy_value(value) for value in row) + '\n').encode('utf-8')
+            chunks.append(line)
+            available += len(line)
+
+        pending = b''.join(chunks)
+        size = min(len(buffer), available)
+        buffer[:size] = pending[:size]
+        self._pending = pending[size:]
+        return size
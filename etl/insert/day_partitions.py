@@ -0,0 +1,146 @@
+"""Load days into standalone tables, which are attached as day partitions once loaded and indexed."""
+from typing import Dict, List, Tuple
+
+from etl.helper_functions import get_config
+from sqlalchemy import Connection, text
+
+# The day loaded tables, with the column they are range partitioned on and the column they are distributed on.
+# The trajectory dimension is attached before the trajectory facts, as the facts reference it.
+DAY_PARTITIONED_TABLES: Dict[str, Tuple[str, str]] = {
+    'dim_trajectory': ('date_id', 'trajectory_sub_id'),
+    'fact_trajectory': ('start_date_id', 'trajectory_sub_id'),
+    'fact_cell_5000m': ('entry_date_id', 'partition_id'),
+    'fact_cell_1000m': ('entry_date_id', 'partition_id'),
+    'fact_cell_200m': ('entry_date_id', 'partition_id'),
+    'fact_cell_50m': ('entry_date_id', 'partition_id'),
+}
+# Heatmaps are aggregated from the attached cell facts, so they are deleted when a day is reloaded
+DAY_DELETED_TABLES: Dict[str, str] = {
+    'fact_cell_heatmap': 'date_id',
+}
+
+
+def day_partition_loading_enabled(config=None) -> bool:
+    """
+    Return whether days are loaded into standalone tables attached as day partitions.
+
+    Keyword arguments:
+        config: the application configuration (default: the configuration read by get_config)
+    """
+    config = config if config is not None else get_config()
+    return config['Database'].get('day_partition_loading', 'false').lower() == 'true'
+
+
+def day_partition_name(table_name: str, date_id: int) -> str:
+    """
+    Return the name of the day partition of a table containing the given date.
+
+    Keyword arguments:
+        table_name: the name of the partitioned table
+        date_id: the smart date id of the day
+    """
+    return f"{table_name}_{date_id // 10000}_{str(date_id // 100 % 100).zfill(2)}_{str(date_id % 100).zfill(2)}"
+
+
+def target_table(table_name: str, date_id: int) -> str:
+    """
+    Return the table rows of a day are loaded into, being the day partition when day partition loading is enabled.
+
+    Keyword arguments:
+        table_name: the name of the partitioned table
+        date_id: the smart date id of the day
+    """
+    if table_name in DAY_PARTITIONED_TABLES and day_partition_loading_enabled():
+        return day_partition_name(table_name, date_id)
+    return table_name
+
+
+def prepare_day_partitions(conn: Connection, date_id: int, reload: bool = False) -> None:
+    """
+    Create the empty standalone tables the day is loaded into, and commit them.
+
+    The tables are distributed and colocated like their partitioned table, but have no indexes or foreign keys.
+    A check constraint on the partition column lets the tables be attached without scanning them.
+    Tables left behind by an interrupted load of the day are dropped.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the day
+        reload: whether an already loaded day is detached and dropped, rather than rejected (default: False)
+    """
+    attached = _attached_day_partitions(conn, date_id)
+    if attached and not reload:
+        raise ValueError(f'The day {date_id} is already loaded into {", ".join(attached)}, reload to replace it')
+
+    for table_name, (date_col, distribution_col) in DAY_PARTITIONED_TABLES.items():
+        _create_day_partition(conn, table_name, date_col, distribution_col, date_id, table_name in attached)
+
+    if attached:
+        for table_name, date_col in DAY_DELETED_TABLES.items():
+            conn.execute(text(f"DELETE FROM {table_name} WHERE {date_col} = :date_id"), {'date_id': date_id})
+    conn.commit()
+
+
+def attach_day_partitions(conn: Connection, date_id: int) -> None:
+    """
+    Attach the loaded standalone tables of a day as day partitions, and commit them.
+
+    Attaching builds the indexes of the partitioned tables on the loaded tables in bulk, and validates their
+    foreign keys with a single scan per table.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the day
+    """
+    conn.execute(text("SET LOCAL citus.multi_shard_modify_mode TO 'sequential'"))
+    for table_name in DAY_PARTITIONED_TABLES:
+        day_table = day_partition_name(table_name, date_id)
+        conn.execute(text(f"""
+            ALTER TABLE {table_name} ATTACH PARTITION {day_table} FOR VALUES FROM ({date_id}) TO ({date_id + 1})
+        """))
+        conn.execute(text(f"ALTER TABLE {day_table} DROP CONSTRAINT {day_table}_day_check"))
+    conn.commit()
+
+
+def _attached_day_partitions(conn: Connection, date_id: int) -> List[str]:
+    """
+    Return the names of the tables the day partition of the given date is attached to.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the day
+    """
+    query = """
+        SELECT parent.relname FROM pg_inherits
+        JOIN pg_class parent            ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child             ON pg_inherits.inhrelid  = child.oid
+        WHERE child.relname = ANY(:relation_names)
+    """
+    day_tables = [day_partition_name(table_name, date_id) for table_name in DAY_PARTITIONED_TABLES]
+    attached = set(conn.execute(text(query), parameters={'relation_names': day_tables}).scalars())
+    return [table_name for table_name in DAY_PARTITIONED_TABLES if table_name in attached]
+
+
+def _create_day_partition(conn: Connection, table_name: str, date_col: str, distribution_col: str, date_id: int,
+                          attached: bool) -> None:
+    """
+    Create the standalone table of a day, replacing the existing day partition or leftover table.
+
+    Keyword arguments:
+        conn: the database connection
+        table_name: the name of the partitioned table
+        date_col: the column the table is range partitioned on
+        distribution_col: the column the table is distributed on
+        date_id: the smart date id of the day
+        attached: whether the day partition is attached and must be detached before being dropped
+    """
+    day_table = day_partition_name(table_name, date_id)
+    if attached:
+        conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {day_table}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {day_table}"))
+    conn.execute(text(f"""
+        CREATE TABLE {day_table} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING GENERATED,
+            CONSTRAINT {day_table}_day_check CHECK ({date_col} >= {date_id} AND {date_col} < {date_id + 1}))
+    """))
+    conn.execute(text("SELECT create_distributed_table(:day_table, :distribution_col, colocate_with => :table_name)"),
+                 {'day_table': day_table, 'distribution_col': distribution_col, 'table_name': table_name})
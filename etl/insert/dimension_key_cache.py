@@ -0,0 +1,176 @@
+"""Module caching the surrogate keys of dimensions client-side, keyed by their natural keys."""
+import os
+from typing import Dict, List
+
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+from sqlalchemy import Connection
+
+from etl.helper_functions import get_config, wrap_with_timings
+
+# Column containing the hash of the natural key, for caches looking up entries on the hash
+KEY_HASH_COL = 'key_hash'
+
+
+def hash_natural_key(entries: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """
+    Return a 64-bit hash of the natural key of every entry, such that entries can be matched on a single column.
+
+    Numeric columns are hashed as floats and other columns as strings, so the hash of a value does not depend on
+    whether it was read from the database or computed client-side, nor on whether the column contains missing values.
+
+    Keyword arguments:
+        entries: dataframe containing the natural key columns
+        columns: the natural key columns to hash
+    """
+    canonical = pd.DataFrame({
+        column: entries[column].astype('float64') if is_numeric_dtype(entries[column]) else
+        entries[column].astype('string')
+        for column in columns
+    }, index=entries.index)
+    return pd.util.hash_pandas_object(canonical, index=False)
+
+
+class DimensionKeyCache:
+    """
+    Class caching the mapping from natural keys to surrogate ids of a dimension.
+
+    The cache is warmed once per run, either from a file persisted by a previous run or by selecting the whole
+    dimension. A persisted cache is only used if its newest entry still exists in the dimension with the same id.
+    Entries must only be persisted once the transaction that inserted them has been committed.
+    If key hash columns are given, the cache stores the hash of those columns of every entry, and entries
+    containing the hash column are looked up on the hash only.
+
+    Methods
+    -------
+    ensure_warm(conn): warm the cache if it has not been warmed yet
+    lookup(entries): merge the cached ids onto entries
+    add(entries): add resolved entries to the cache
+    persist(): store the cache on disk, if a cache folder is configured
+    """
+
+    def __init__(self, dimension_name: str, id_col_name: str, warm_query: str, cache_folder: str | None = None,
+                 key_hash_columns: List[str] | None = None):
+        """
+        Construct an instance of the DimensionKeyCache class.
+
+        Keyword arguments:
+            dimension_name: the table name of the dimension
+            id_col_name: the name of the column containing the id of the dimension
+            warm_query: query selecting the id and natural key columns of all rows in the dimension
+            cache_folder: the folder to persist the cache in, or None to not persist the cache (default: None)
+            key_hash_columns: the natural key columns to hash, or None to look up entries on all natural key
+                columns (default: None)
+        """
+        self.dimension_name = dimension_name
+        self.id_col_name = id_col_name
+        self.warm_query = warm_query
+        self.cache_folder = cache_folder
+        self.key_hash_columns = key_hash_columns
+        self.entries: pd.DataFrame | None = None
+
+    @property
+    def _cache_path(self) -> str | None:
+        """Return the path of the persisted cache, or None if the cache is not persisted."""
+        if not self.cache_folder:
+            return None
+        return os.path.join(self.cache_folder, f'{self.dimension_name}_keys.pkl')
+
+    def ensure_warm(self, conn: Connection) -> None:
+        """
+        Warm the cache from disk or from the database, if it has not been warmed yet.
+
+        Keyword arguments:
+            conn: database connection used to warm or validate the cache
+        """
+        if self.entries is not None:
+            return
+
+        persisted = self._read_persisted()
+        if persisted is not None and self._is_valid(persisted, conn):
+            print(f'Using persisted {self.dimension_name} key cache with {len(persisted)} entries')
+            self.entries = persisted
+        else:
+            self.entries = wrap_with_timings(f'Warming {self.dimension_name} key cache',
+                                             lambda: pd.read_sql_query(self.warm_query, conn))
+
+        if self.key_hash_columns is not None and KEY_HASH_COL not in self.entries.columns:
+            self.entries[KEY_HASH_COL] = hash_natural_key(self.entries, self.key_hash_columns)
+
+    def _read_persisted(self) -> pd.DataFrame | None:
+        """Return the persisted cache, or None if it does not exist."""
+        if self._cache_path is None or not os.path.isfile(self._cache_path):
+            return None
+        return pd.read_pickle(self._cache_path)
+
+    def _is_valid(self, persisted: pd.DataFrame, conn: Connection) -> bool:
+        """
+        Return whether the newest entry of the persisted cache exists in the dimension with the same id.
+
+        Protects against using a cache persisted for another, e.g. re-initialized, data warehouse.
+
+        Keyword arguments:
+            persisted: the persisted cache
+            conn: database connection used to validate the cache
+        """
+        if persisted.empty:
+            return False
+        newest = persisted.loc[[persisted[self.id_col_name].idxmax()]]
+        query = f"SELECT * FROM ({self.warm_query}) dim WHERE {self.id_col_name} = %(id)s"
+        stored = pd.read_sql_query(query, conn, params={'id': int(newest[self.id_col_name].iat[0])})
+        return len(newest.merge(stored, on=stored.columns.tolist())) == 1
+
+    def lookup(self, entries: pd.DataFrame) -> pd.DataFrame:
+        """
+        Return the entries with the cached id merged on, which is missing for entries not in the cache.
+
+        Keyword arguments:
+            entries: dataframe containing the natural key columns, or the natural key hash column
+        """
+        key = [KEY_HASH_COL] if KEY_HASH_COL in entries.columns else entries.columns.tolist()
+        return entries.merge(self.entries[key + [self.id_col_name]], on=key, how='left')
+
+    def add(self, entries: pd.DataFrame) -> None:
+        """
+        Add resolved entries to the cache.
+
+        Keyword arguments:
+            entries: dataframe containing the natural key columns, the id column and the hash column if used
+        """
+        self.entries = pd.concat([self.entries, entries[self.entries.columns]], ignore_index=True)
+
+    def persist(self) -> None:
+        """Atomically store the cache on disk, if a cache folder is configured and the cache is warm."""
+        if self._cache_path is None or self.entries is None:
+            return
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self.entries.to_pickle(self._cache_path + '.tmp')
+        os.replace(self._cache_path + '.tmp', self._cache_path)
+
+
+# Dimension key caches used in this process, keyed by dimension name.
+_dimension_key_caches: Dict[str, DimensionKeyCache] = {}
+
+
+def get_dimension_key_cache(dimension_name: str, id_col_name: str, warm_query: str,
+                            key_hash_columns: List[str] | None = None) -> DimensionKeyCache:
+    """
+    Return the key cache of a dimension, creating it on first use.
+
+    Keyword arguments:
+        dimension_name: the table name of the dimension
+        id_col_name: the name of the column containing the id of the dimension
+        warm_query: query selecting the id and natural key columns of all rows in the dimension
+        key_hash_columns: the natural key columns to hash, if entries are looked up on the hash (default: None)
+    """
+    if dimension_name not in _dimension_key_caches:
+        cache_folder = get_config()['Database'].get('dimension_key_cache_path', None)
+        _dimension_key_caches[dimension_name] = DimensionKeyCache(dimension_name, id_col_name, warm_query,
+                                                                  cache_folder, key_hash_columns)
+    return _dimension_key_caches[dimension_name]
+
+
+def persist_dimension_key_caches() -> None:
+    """Persist all dimension key caches used in this process."""
+    for cache in _dimension_key_caches.values():
+        cache.persist()
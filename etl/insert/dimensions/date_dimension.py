@@ -1,19 +1,116 @@
-"""Responsible for ensuring the ship dimension."""
+"""Responsible for ensuring the date dimension."""
+from typing import List, Set, Tuple
+
+import numpy as np
 import pandas as pd
 
-from etl.constants import T_ETA_DATE_COL, T_START_DATE_COL, T_END_DATE_COL
+from etl.constants import T_ETA_DATE_COL, T_START_DATE_COL, T_END_DATE_COL, UNKNOWN_INT_VALUE
 from sqlalchemy import Connection, text
 
+DATE_DIMENSION_COLUMNS = [
+    'date_id', 'date', 'day_of_week', 'day_of_month', 'day_of_year', 'week_of_year', 'month_of_year',
+    'quarter_of_year', 'year', 'iso_year', 'day_name', 'month_name', 'weekday', 'season', 'holiday'
+]
+# The other easter holidays offset from easter sunday
+EASTER_HOLIDAY_OFFSETS = [0, 1, -2, -3, -7, 40]
+
+
+def calculate_easter_holidays(year: int) -> List[Tuple[int, int]]:
+    """
+    Return the month and day of the easter holidays of a year.
+
+    Matches the calculate_easter_holidays database function, including its handling of offsets crossing a month.
+    Based on: https://www.rmg.co.uk/stories/topics/when-easter, works for years between 1900 and 2099.
+
+    Keyword arguments:
+        year: the year to calculate the easter holidays of
+    """
+    d = 225 - 11 * (year % 19)
+    # Subtract a multiple of 30 until D is less than 51
+    while d >= 51:
+        d -= 30
+    if d > 48:
+        d -= 1
+    e = (year + year // 4 + d + 1) % 7
+    q = d + 7 - e
+    # If Q is less than 32 then Easter is in March, otherwise Q - 31 is its date in April
+    easter_month, easter_day = (3, q) if q < 32 else (4, q - 31)
+
+    return [_offset_month_day(easter_month, easter_day, offset) for offset in EASTER_HOLIDAY_OFFSETS]
+
+
+def _offset_month_day(month: int, day: int, offset: int) -> Tuple[int, int]:
+    """
+    Return the month and day offset by a number of days, counting every month as 31 days like the database function.
+
+    Keyword arguments:
+        month: the month to offset
+        day: the day of the month to offset
+        offset: the number of days to offset by
+    """
+    day += offset
+    while day > 31:
+        day -= 31
+        month += 1
+    if day < 1:
+        month -= 1
+        day += 31
+    return month, day
+
+
+def build_date_rows(date_ids: np.ndarray, day_num_map: pd.DataFrame, month_num_map: pd.DataFrame,
+                    fixed_holidays: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the date dimension rows of smart date ids, as they would be generated by the database.
+
+    Keyword arguments:
+        date_ids: the smart date ids to build rows for
+        day_num_map: the staging.day_num_map table
+        month_num_map: the staging.month_num_map table
+        fixed_holidays: the staging.fixed_holidays table
+    """
+    dates = pd.Series(pd.to_datetime(pd.Series(date_ids).astype(str), format='%Y%m%d'))
+    iso = dates.dt.isocalendar()
+    rows = pd.DataFrame({
+        'date_id': date_ids,
+        'date': dates.dt.date,
+        # Sunday is 0, as EXTRACT(DOW FROM date)
+        'day_of_week': (dates.dt.dayofweek.to_numpy() + 1) % 7,
+        'day_of_month': dates.dt.day.to_numpy(),
+        'day_of_year': dates.dt.dayofyear.to_numpy(),
+        'week_of_year': iso['week'].to_numpy(dtype=int),
+        'month_of_year': dates.dt.month.to_numpy(),
+        'quarter_of_year': dates.dt.quarter.to_numpy(),
+        'year': dates.dt.year.to_numpy(),
+        'iso_year': iso['year'].to_numpy(dtype=int),
+    })
+    rows = rows.merge(day_num_map, left_on='day_of_week', right_on='day_num').drop(columns='day_num')
+    rows = rows.merge(month_num_map, left_on='month_of_year', right_on='month_num').drop(columns='month_num')
+
+    fixed_month_days = (fixed_holidays['month'] * 100 + fixed_holidays['day']).tolist()
+    holiday_ids = {year * 10000 + month_day for year in rows['year'].unique() for month_day in fixed_month_days}
+    holiday_ids |= {year * 10000 + month * 100 + day
+                    for year in rows['year'].unique() for month, day in calculate_easter_holidays(int(year))}
+    rows['holiday'] = np.where(rows['date_id'].isin(holiday_ids), 'holiday', 'non-holiday')
+    return rows[DATE_DIMENSION_COLUMNS].sort_values('date_id', ignore_index=True)
+
 
 class DateDimensionInserter:
     """
     Class responsible for ensuring the existence of dates in the date dimension.
 
+    The date rows are built client-side, and only dates not yet in the dimension are sent to the database.
+    The known date ids and the day, month and holiday mappings are read once per process.
+
     Methods
     -------
     ensure(df, conn): ensure the existence of dates in the date dimension
     """
 
+    # Shared by all instances, as an instance is created per loaded day
+    _known_date_ids: Set[int] | None = None
+    _mappings: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame] | None = None
+
     def ensure(self, df: pd.DataFrame, conn: Connection) -> pd.DataFrame:
         """
         Ensure the existence of ETA, start and end dates in the date dimension.
@@ -24,56 +121,45 @@ class DateDimensionInserter:
         """
         # collect all unique dates from T_ETA_DATE_COL, T_START_DATE_COL, T_END_DATE_COL
         dates = df[[T_ETA_DATE_COL, T_START_DATE_COL, T_END_DATE_COL]].stack().unique()
+        dates = dates[dates != UNKNOWN_INT_VALUE].astype(int)
 
-        # remove entries of -1
-        dates = dates[dates != -1]
+        known_date_ids = self._ensure_known_date_ids(conn)
+        missing = np.array(sorted(set(dates.tolist()) - known_date_ids), dtype=int)
+        if len(missing) == 0:
+            return
 
-        # to array
-        dates = dates.tolist()
+        rows = build_date_rows(missing, *self._ensure_mappings(conn))
+        columns = ', '.join(DATE_DIMENSION_COLUMNS)
+        values = ', '.join(f':{column}' for column in DATE_DIMENSION_COLUMNS)
+        query = f"INSERT INTO dim_date ({columns}) VALUES ({values}) ON CONFLICT DO NOTHING"
+        conn.execute(text(query), rows.astype(object).to_dict('records'))
+        conn.commit()
+        known_date_ids.update(missing.tolist())
 
-        query = """
-            INSERT INTO dim_date (
-                date_id, date, day_of_week, day_of_month,
-                day_of_year, week_of_year, month_of_year, quarter_of_year, year, iso_year,
-                day_name, month_name, weekday, season, holiday
-            )
-            SELECT
-                i1.*,
-                dm.day_name,
-                mm.month_name,
-                dm.weekday,
-                mm.season,
-                (CASE WHEN EXISTS (
-                    SELECT 1 FROM (
-                        SELECT fh.month, fh.day FROM staging.fixed_holidays fh
-                        UNION
-                        SELECT eh.month, eh.day FROM calculate_easter_holidays(i1.year::SMALLINT) eh
-                    ) AS holidays
-                    WHERE holidays.month = i1.month_of_year
-                    AND holidays.day = i1.day_of_month)
-                THEN 'holiday'
-                ELSE 'non-holiday'
-                END) AS holiday
-            FROM (
-                     SELECT
-                         -- create smart id such that 2022-09-01 gets id 20220901
-                         (EXTRACT(YEAR FROM date) * 10000) + (EXTRACT(MONTH FROM date) * 100) + (EXTRACT(DAY FROM date))
-                         AS date_id,
-                         date AS date,
-                         EXTRACT(DOW FROM date)     AS day_of_week,
-                         EXTRACT(DAY FROM date)     AS day_of_month,
-                         EXTRACT(DOY FROM date)     AS day_of_year,
-                         EXTRACT(WEEK FROM date)    AS week_of_year,
-                         EXTRACT(MONTH FROM date)   AS month_of_year,
-                         EXTRACT(QUARTER FROM date) AS quarter_of_year,
-                         EXTRACT(YEAR FROM date)    AS year,
-                         EXTRACT(ISOYEAR FROM date) AS iso_year
-                     FROM (SELECT TO_DATE(unnest(:dates)::text, 'YYYYMMDD') AS date) sq
-                 ) i1
-            INNER JOIN staging.day_num_map dm ON dm.day_num = i1.day_of_week
-            INNER JOIN staging.month_num_map mm ON mm.month_num = i1.month_of_year
-            ON CONFLICT DO NOTHING
+    @classmethod
+    def _ensure_known_date_ids(cls, conn: Connection) -> Set[int]:
         """
+        Return the ids of the dates in the dimension, reading them if not read yet.
 
-        conn.execute(text(query), dict(dates=dates))
-        conn.commit()
+        Keyword arguments:
+            conn: database connection used to read the date ids
+        """
+        if cls._known_date_ids is None:
+            cls._known_date_ids = set(conn.execute(text("SELECT date_id FROM dim_date")).scalars())
+        return cls._known_date_ids
+
+    @classmethod
+    def _ensure_mappings(cls, conn: Connection) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Return the day, month and fixed holiday mappings, reading them if not read yet.
+
+        Keyword arguments:
+            conn: database connection used to read the mappings
+        """
+        if cls._mappings is None:
+            cls._mappings = (
+                pd.read_sql_query("SELECT day_num, day_name, weekday FROM staging.day_num_map", conn),
+                pd.read_sql_query("SELECT month_num, month_name, season FROM staging.month_num_map", conn),
+                pd.read_sql_query("SELECT month, day FROM staging.fixed_holidays", conn),
+            )
+        return cls._mappings
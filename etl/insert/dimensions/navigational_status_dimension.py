@@ -43,7 +43,15 @@ class NavigationalStatusDimensionInserter (BulkInserter):
             WHERE (nav_status) IN {}
         """
 
-        nav_statuses = self._bulk_select_insert(nav_statuses, conn, insert_query, select_query)
+        warm_query = """
+            SELECT nav_status_id, nav_status
+            FROM dim_nav_status
+        """
+
+        key_columns = {T_NAVIGATIONAL_STATUS_COL: 'nav_status'}
+
+        nav_statuses = self._cached_select_insert(nav_statuses, conn, insert_query, select_query, warm_query,
+                                                  key_columns)
 
         nav_statuses.rename(columns={'nav_status_id': T_SHIP_NAVIGATIONAL_STATUS_ID_COL}, inplace=True)
 
@@ -1,9 +1,28 @@
 """Responsible for ensuring the ship dimension."""
+import numpy as np
 import pandas as pd
+from sqlalchemy import Connection
 
 from etl.constants import T_MMSI_COL, T_IMO_COL, T_SHIP_NAME_COL, T_SHIP_CALLSIGN_COL, T_A_COL, T_B_COL, T_C_COL, \
-    T_D_COL, T_SHIP_TYPE_ID_COL, T_LOCATION_SYSTEM_TYPE_COL, MID_COL, UNKNOWN_STRING_VALUE, T_WIDTH_COL, T_LENGTH_COL
+    T_D_COL, T_SHIP_TYPE_ID_COL, T_LOCATION_SYSTEM_TYPE_COL, MID_COL, UNKNOWN_STRING_VALUE, T_WIDTH_COL, \
+    T_LENGTH_COL
 from etl.insert.bulk_inserter import BulkInserter
+from etl.insert.dimension_key_cache import hash_natural_key, KEY_HASH_COL
+
+# Powers of ten, used to count the digits of MMSIs
+POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def extract_mid(mmsi: pd.Series) -> np.ndarray:
+    """
+    Return the Maritime Identification Digits of MMSIs, being the first three digits of the MMSI.
+
+    Keyword arguments:
+        mmsi: the MMSIs to extract the MID from
+    """
+    values = mmsi.to_numpy(dtype=np.int64)
+    digits = np.searchsorted(POWERS_OF_TEN, values, side='right')
+    return values // POWERS_OF_TEN[np.maximum(digits - 3, 0)]
 
 
 class ShipDimensionInserter (BulkInserter):
@@ -17,6 +36,22 @@ class ShipDimensionInserter (BulkInserter):
     ensure(df, conn): ensures the existence of a ship in the ship dimension
     """
 
+    # Shared by all instances, as an instance is created per loaded day
+    _mid_map: pd.DataFrame | None = None
+
+    @classmethod
+    def _ensure_mid_map(cls, conn: Connection) -> pd.DataFrame:
+        """
+        Return the MID map indexed by MID, reading it if not read yet.
+
+        Keyword arguments:
+            conn: database connection used to read the map
+        """
+        if cls._mid_map is None:
+            cls._mid_map = pd.read_sql_query("SELECT mid, flag_region, flag_state FROM staging.mid_map", conn) \
+                .set_index(MID_COL)
+        return cls._mid_map
+
     def ensure(self, df: pd.DataFrame, conn) -> pd.DataFrame:
         """
         Ensure the existence of a ship in the ship dimension.
@@ -31,23 +66,16 @@ class ShipDimensionInserter (BulkInserter):
             T_LOCATION_SYSTEM_TYPE_COL,
         ]
 
-        ships = df[unique_columns].drop_duplicates()
+        # Ships are matched on a single hash of their natural key, instead of on all the natural key columns
+        key_hashes = hash_natural_key(df, unique_columns)
+        ships = df[unique_columns][~key_hashes.duplicated()].copy()
 
         # Add the 'mid', 'flag_region', and 'flag_state' contextual attributes to the ship dataframe
-        map_query = """
-            SELECT *
-            FROM staging.mid_map
-        """
-        mid_map_df = pd.read_sql_query(map_query, conn)
-
-        # Extract mid from mmsi
-        ships[MID_COL] = ships.apply(
-            func=lambda row: int(str(row[T_MMSI_COL])[:3]),
-            axis='columns'
-        )
-
-        ships = ships.merge(mid_map_df, on=[MID_COL], how='left') \
-            .fillna({'flag_region': UNKNOWN_STRING_VALUE, 'flag_state': UNKNOWN_STRING_VALUE})
+        mid_map = self._ensure_mid_map(conn)
+        ships[MID_COL] = extract_mid(ships[T_MMSI_COL])
+        ships['flag_region'] = ships[MID_COL].map(mid_map['flag_region']).fillna(UNKNOWN_STRING_VALUE)
+        ships['flag_state'] = ships[MID_COL].map(mid_map['flag_state']).fillna(UNKNOWN_STRING_VALUE)
+        ships[KEY_HASH_COL] = key_hashes[ships.index]
 
         insert_query = """
             INSERT INTO dim_ship (mmsi, imo, name, callsign, a, b, c, d, length, width,
@@ -66,6 +94,26 @@ class ShipDimensionInserter (BulkInserter):
                 flag_region, flag_state) IN {}
             """
 
-        ships = self._bulk_select_insert(ships, conn, insert_query, select_query)
+        warm_query = """
+            SELECT
+                ship_id, mmsi, imo, name ship_name, callsign ship_callsign, a, b, c, d, length, width,
+                ship_type_id, location_system_type, mid, flag_region, flag_state
+            FROM dim_ship
+            """
+
+        key_columns = {
+            T_MMSI_COL: 'mmsi', T_IMO_COL: 'imo', T_SHIP_NAME_COL: 'name', T_SHIP_CALLSIGN_COL: 'callsign',
+            T_A_COL: 'a', T_B_COL: 'b', T_C_COL: 'c', T_D_COL: 'd', T_LENGTH_COL: 'length', T_WIDTH_COL: 'width',
+            T_SHIP_TYPE_ID_COL: 'ship_type_id', T_LOCATION_SYSTEM_TYPE_COL: 'location_system_type', MID_COL: 'mid',
+            'flag_region': 'flag_region', 'flag_state': 'flag_state',
+        }
+        nullable_columns = [T_SHIP_NAME_COL, T_SHIP_CALLSIGN_COL, T_A_COL, T_B_COL, T_C_COL, T_D_COL, T_LENGTH_COL,
+                            T_WIDTH_COL]
+
+        ships = self._cached_select_insert(ships, conn, insert_query, select_query, warm_query, key_columns,
+                                           nullable_columns, unique_columns)
 
-        return df.merge(ships, on=unique_columns, how='left')
+        ship_columns = [column for column in ships.columns if column not in unique_columns]
+        return df.assign(**{KEY_HASH_COL: key_hashes}) \
+            .merge(ships[ship_columns], on=KEY_HASH_COL, how='left') \
+            .drop(columns=[KEY_HASH_COL])
@@ -42,6 +42,14 @@ class ShipTypeDimensionInserter(BulkInserter):
             WHERE (mobile_type, ship_type) IN {}
         """
 
-        ship_types = self._bulk_select_insert(ship_types, conn, insert_query, select_query)
+        warm_query = """
+            SELECT ship_type_id, mobile_type, ship_type
+            FROM dim_ship_type
+        """
+
+        key_columns = {T_MOBILE_TYPE_COL: 'mobile_type', T_SHIP_TYPE_COL: 'ship_type'}
+
+        ship_types = self._cached_select_insert(ship_types, conn, insert_query, select_query, warm_query,
+                                                key_columns)
 
         return df.merge(ship_types, on=unique_columns, how='left')
@@ -4,6 +4,7 @@ import pandas as pd
 from etl.constants import T_TRAJECTORY_COL, T_ROT_COL, T_HEADING_COL, T_DRAUGHT_COL, T_DESTINATION_COL, \
     T_START_DATE_COL, T_TRAJECTORY_SUB_ID_COL
 from etl.insert.bulk_inserter import BulkInserter
+from etl.insert.day_partitions import target_table
 
 
 class TrajectoryDimensionInserter(BulkInserter):
@@ -15,17 +16,18 @@ class TrajectoryDimensionInserter(BulkInserter):
     Methods
     -------
     ensure(df, conn): ensures the existence of a trajectory in the trajectory dimension
+    rows(df): the trajectory dimension rows of the trajectories
     """
 
-    def ensure(self, df: pd.DataFrame, conn) -> pd.DataFrame:
+    @staticmethod
+    def rows(df: pd.DataFrame) -> pd.DataFrame:
         """
-        Ensure the existence of a trajectory in the trajectory dimension.
+        Return the trajectory dimension rows of the trajectories, named after the columns of the dimension.
 
         Keyword arguments:
             df: dataframe containing trajectory information
-            conn: database connection used for insertion
         """
-        trajectories = df[[
+        return df[[
             T_START_DATE_COL,
             T_TRAJECTORY_SUB_ID_COL,
             T_TRAJECTORY_COL,
@@ -33,19 +35,15 @@ class TrajectoryDimensionInserter(BulkInserter):
             T_HEADING_COL,
             T_DRAUGHT_COL,
             T_DESTINATION_COL
-        ]]
-
-        query = """
-            INSERT INTO dim_trajectory (
-                date_id,
-                trajectory_sub_id,
-                trajectory,
-                rot,
-                heading,
-                draught,
-                destination
-            )
-            VALUES {}
+        ]].rename(columns={T_START_DATE_COL: 'date_id'})
+
+    def ensure(self, df: pd.DataFrame, conn) -> pd.DataFrame:
+        """
+        Ensure the existence of a trajectory in the trajectory dimension.
+
+        Keyword arguments:
+            df: dataframe containing trajectory information
+            conn: database connection used for insertion
         """
-        self._bulk_insert(trajectories, conn, query, fetch=False)
+        self._bulk_copy(self.rows(df), conn, target_table('dim_trajectory', int(df[T_START_DATE_COL].iloc[0])))
         return df
@@ -1,58 +1,185 @@
 """Ensure that the date entry exists and partitions for the given date exists in partitioned tables."""
-from etl.helper_functions import extract_date_from_smart_date_id
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set, Tuple
+
+from etl.helper_functions import extract_smart_date_id_from_date, get_connection, get_config
+from etl.insert.day_partitions import DAY_PARTITIONED_TABLES, day_partition_loading_enabled
 from sqlalchemy import Connection, text
 
+DATE_PARTITIONED_TABLE_NAMES = [
+    "fact_cell_5000m",
+    "fact_cell_1000m",
+    "fact_cell_200m",
+    "fact_cell_50m",
+    "fact_trajectory",
+    "dim_trajectory",
+    "fact_cell_heatmap"
+]
 
-def ensure_partitions_for_partitioned_tables(conn, date_id: int):
+
+class PartitionCatalog:
     """
-    Ensure that partitions for the given date exists in partitioned tables.
+    Class caching the monthly partitions of the date partitioned tables.
+
+    The existing partitions are read once per process, after which checking whether a partition exists is a lookup
+    in memory. Missing partitions are created together in a single transaction.
+    Partitions created or dropped outside this process after the catalog has been read are not reflected.
+
+    Methods
+    -------
+    ensure(conn, date_ids, table_names): ensure the monthly partitions of the given dates exist in partitioned tables
+    existing(conn, date_id, table_names): the partitioned tables having the monthly partition of the given date
+    """
+
+    def __init__(self, table_names: List[str]):
+        """
+        Construct an instance of the PartitionCatalog class.
+
+        Keyword arguments:
+            table_names: the names of the partitioned tables
+        """
+        self.table_names = table_names
+        self._partitions: Set[Tuple[str, str]] | None = None
+
+    def _ensure_read(self, conn: Connection) -> Set[Tuple[str, str]]:
+        """
+        Return the existing partitions as (table name, partition name) pairs, reading them if not read yet.
+
+        Keyword arguments:
+            conn: the database connection
+        """
+        if self._partitions is None:
+            query = """
+                SELECT parent.relname, child.relname FROM pg_inherits
+                JOIN pg_class parent            ON pg_inherits.inhparent = parent.oid
+                JOIN pg_class child             ON pg_inherits.inhrelid  = child.oid
+                WHERE parent.relname = ANY(:relation_names)
+            """
+            result = conn.execute(text(query), parameters={"relation_names": self.table_names})
+            self._partitions = {(parent, child) for parent, child in result}
+        return self._partitions
+
+    def ensure(self, conn: Connection, date_ids: Iterable[int], table_names: List[str] | None = None) -> None:
+        """
+        Ensure the monthly partitions of the given dates exist in the partitioned tables.
+
+        All missing partitions are created and committed in a single transaction.
+        Nothing is executed if all partitions are known to exist.
+
+        Keyword arguments:
+            conn: the database connection
+            date_ids: the smart date ids to ensure partitions for
+            table_names: the partitioned tables to ensure partitions in (default: all tables of the catalog)
+        """
+        partitions = self._ensure_read(conn)
+        month_ids = sorted({date_id - (date_id % 100) for date_id in date_ids})
+        table_names = table_names if table_names is not None else self.table_names
+        missing = [(table_name, month_id) for month_id in month_ids for table_name in table_names
+                   if (table_name, partition_name(table_name, month_id)) not in partitions]
+        if not missing:
+            return
+
+        conn.execute(text("SET LOCAL citus.multi_shard_modify_mode TO 'sequential'"))
+        for table_name, month_id in missing:
+            _create_partition(conn, table_name, month_id)
+        conn.commit()
+        partitions.update((table_name, partition_name(table_name, month_id)) for table_name, month_id in missing)
+
+    def existing(self, conn: Connection, date_id: int, table_names: Iterable[str]) -> List[str]:
+        """
+        Return the partitioned tables having the monthly partition of the given date.
+
+        Keyword arguments:
+            conn: the database connection
+            date_id: the smart date id in the partition
+            table_names: the partitioned tables to check
+        """
+        partitions = self._ensure_read(conn)
+        return [table_name for table_name in table_names
+                if (table_name, partition_name(table_name, date_id)) in partitions]
+
+
+def partition_name(table_name: str, date_id: int) -> str:
+    """
+    Return the name of the monthly partition of a table containing the given date.
+
+    Args:
+        table_name: The name of the partitioned table
+        date_id: The smart date id in the partition, the day may be 00
+    """
+    # Partition name is the year and month of the smart date id. The month is 0 padded to 2 digits.
+    return f"{table_name}_{date_id // 10000}_{str(date_id // 100 % 100).zfill(2)}"
+
+
+def _create_partition(conn: Connection, table_name: str, month_id: int):
+    """
+    Create the monthly partition of a table, as part of the current transaction.
 
     Args:
         conn: The database connection
-        date_id: The smarte date id to ensure exists
+        table_name: The name of the table to create a partition for
+        month_id: The smart date id of the month, with the day being 00
+    """
+    print(f"Creating partition {partition_name(table_name, month_id)}")
+    conn.execute(text(f"""
+        CREATE TABLE {partition_name(table_name, month_id)} PARTITION OF {table_name}
+            FOR VALUES FROM ({month_id}) TO ({month_id + 99})
+    """))
+
+
+# Catalog of the partitions of the date partitioned tables, read on first use in this process.
+_partition_catalog = PartitionCatalog(DATE_PARTITIONED_TABLE_NAMES)
+
+
+def monthly_partitioned_table_names(config) -> List[str]:
     """
-    date_partitioned_table_names = [
-        "fact_cell_5000m",
-        "fact_cell_1000m",
-        "fact_cell_200m",
-        "fact_cell_50m",
-        "fact_trajectory",
-        "dim_trajectory",
-        "fact_cell_heatmap"
-    ]
+    Return the date partitioned tables partitioned by month, which excludes the day loaded tables in day partition mode.
 
-    for table_name in date_partitioned_table_names:
-        _ensure_partition_for_table(conn, table_name, date_id)
+    Args:
+        config: The application configuration
+    """
+    if day_partition_loading_enabled(config):
+        return [table_name for table_name in DATE_PARTITIONED_TABLE_NAMES if table_name not in DAY_PARTITIONED_TABLES]
+    return DATE_PARTITIONED_TABLE_NAMES
 
 
-def _ensure_partition_for_table(conn: Connection, table_name: str, date_id: int):
+def ensure_partitions_for_partitioned_tables(conn, date_id: int):
     """
-    Ensure that a partition for the given date exists in the given table.
+    Ensure that partitions for the given date exists in partitioned tables.
+
+    When loading days into day partitions, the day loaded tables must not be partitioned by month in the month.
 
     Args:
         conn: The database connection
-        table_name: The name of the table to ensure a partition exists for
-        date_id: The smart date id to ensure exists
+        date_id: The smarte date id to ensure exists
+    """
+    config = get_config()
+    _partition_catalog.ensure(conn, [date_id], monthly_partitioned_table_names(config))
+
+    if day_partition_loading_enabled(config):
+        monthly = _partition_catalog.existing(conn, date_id, DAY_PARTITIONED_TABLES)
+        if monthly:
+            raise ValueError(f'The month of {date_id} is partitioned by month in {", ".join(monthly)}, '
+                             'so it can not be loaded into day partitions')
+
+
+def ensure_partitions_for_date_range(date_from: datetime, date_to: datetime, config):
     """
-    rounded_smart_date_id = date_id - (date_id % 100)
+    Ensure that partitions for all months in the given date range exists in partitioned tables.
 
-    exist_query = """
-        SELECT 1 FROM pg_inherits
-        JOIN pg_class parent            ON pg_inherits.inhparent = parent.oid
-        JOIN pg_class child             ON pg_inherits.inhrelid  = child.oid
-        WHERE parent.relname = :relation_name
-        AND child.relname = :partition_name
+    Args:
+        date_from: The first date of the range
+        date_to: The last date of the range
+        config: The application configuration
     """
-    # Partition name is the year and month of the smart date id. The month is 0 padded to 2 digits.
-    date = extract_date_from_smart_date_id(date_id)
-    partition_name = f"{table_name}_{date.year}_{str(date.month).zfill(2)}"
+    months = []
+    month = date_from.replace(day=1)
+    while month <= date_to:
+        months.append(extract_smart_date_id_from_date(month))
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
 
-    cursor = conn.execute(text(exist_query), parameters={"relation_name": table_name, "partition_name": partition_name})
-    if cursor.fetchone() is None:
-        query = f"""
-            SET LOCAL citus.multi_shard_modify_mode TO 'sequential';
-            CREATE TABLE {partition_name} PARTITION OF {table_name}
-                FOR VALUES FROM ({rounded_smart_date_id}) TO ({rounded_smart_date_id + 99})
-        """
-        conn.execute(text(query))
-        conn.commit()
+    conn = get_connection(config)
+    try:
+        _partition_catalog.ensure(conn, months, monthly_partitioned_table_names(config))
+    finally:
+        conn.close()
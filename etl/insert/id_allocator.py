@@ -0,0 +1,106 @@
+"""Module allocating unique trajectory sub ids from blocks reserved in the database."""
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import Connection, text
+
+# Ids are non-negative 32-bit integers
+ID_BITS = 31
+ID_MASK = (1 << ID_BITS) - 1
+# Number of ids reserved by a single call to the block sequence
+ID_BLOCK_SIZE = 1 << 16
+TRAJECTORY_SUB_ID_BLOCK_SEQUENCE = 'trajectory_sub_id_block_seq'
+# Odd multipliers, such that multiplication is invertible modulo 2^31
+MIX_MULTIPLIER_1 = 0x5BD1E995 & ID_MASK
+MIX_MULTIPLIER_2 = 0x27D4EB2F & ID_MASK
+
+
+def mix_ids(ids: np.ndarray) -> np.ndarray:
+    """
+    Return the ids mapped by a bijection on the non-negative 32-bit integers, spreading consecutive ids.
+
+    Every step is invertible modulo 2^31, so distinct ids stay distinct.
+
+    Keyword arguments:
+        ids: the ids to mix, between 0 and 2^31 - 1
+    """
+    mixed = ids.astype(np.uint64) & ID_MASK
+    mixed = (mixed * MIX_MULTIPLIER_1) & ID_MASK
+    mixed ^= mixed >> 15
+    mixed = (mixed * MIX_MULTIPLIER_2) & ID_MASK
+    mixed ^= mixed >> 13
+    return mixed.astype(np.int32)
+
+
+class IdAllocator:
+    """
+    Class handing out unique ids from blocks reserved using a database sequence.
+
+    Every value of the sequence reserves a block of ids, so concurrent loaders never receive the same ids, and a
+    loader only contacts the database once per block. The ids handed out are mixed, such that they are spread over
+    the whole id range and the hash distribution of the tables they are distributed on.
+
+    Methods
+    -------
+    allocate(conn, count): allocate a number of unique ids
+    """
+
+    def __init__(self, sequence_name: str, block_size: int = ID_BLOCK_SIZE):
+        """
+        Construct an instance of the IdAllocator class.
+
+        Keyword arguments:
+            sequence_name: the sequence counting the reserved blocks
+            block_size: the number of ids in a block (default: 65536)
+        """
+        self.sequence_name = sequence_name
+        self.block_size = block_size
+        # The reserved and not yet handed out ids are [next_id, end_id)
+        self.next_id = 0
+        self.end_id = 0
+
+    def allocate(self, conn: Connection, count: int) -> np.ndarray:
+        """
+        Return a number of unique mixed ids, reserving new blocks if the current block is exhausted.
+
+        Keyword arguments:
+            conn: database connection used to reserve blocks
+            count: the number of ids to allocate
+        """
+        ranges = []
+        while count > 0:
+            if self.next_id == self.end_id:
+                self._reserve_block(conn)
+            taken = min(count, self.end_id - self.next_id)
+            ranges.append(np.arange(self.next_id, self.next_id + taken, dtype=np.int64))
+            self.next_id += taken
+            count -= taken
+        return mix_ids(np.concatenate(ranges)) if ranges else np.empty(0, dtype=np.int32)
+
+    def _reserve_block(self, conn: Connection) -> None:
+        """
+        Reserve the next block of ids.
+
+        Keyword arguments:
+            conn: database connection used to reserve the block
+        """
+        block = conn.execute(text(f"SELECT nextval('{self.sequence_name}')")).scalar_one()
+        self.next_id = block * self.block_size
+        self.end_id = self.next_id + self.block_size
+
+
+# Id allocators used in this process, keyed by sequence name, such that blocks are used across days.
+_id_allocators: Dict[str, IdAllocator] = {}
+
+
+def allocate_trajectory_sub_ids(conn: Connection, count: int) -> np.ndarray:
+    """
+    Return a number of unique trajectory sub ids.
+
+    Keyword arguments:
+        conn: database connection used to reserve blocks
+        count: the number of ids to allocate
+    """
+    if TRAJECTORY_SUB_ID_BLOCK_SEQUENCE not in _id_allocators:
+        _id_allocators[TRAJECTORY_SUB_ID_BLOCK_SEQUENCE] = IdAllocator(TRAJECTORY_SUB_ID_BLOCK_SEQUENCE)
+    return _id_allocators[TRAJECTORY_SUB_ID_BLOCK_SEQUENCE].allocate(conn, count)
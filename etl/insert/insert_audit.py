@@ -21,12 +21,5 @@ class AuditInserter(BulkInserter):
         """
         df = gal.to_dataframe().convert_dtypes()
 
-        query = """
-            INSERT INTO audit_log (
-                import_datetime, statistics, requirements, etl_version,
-                file_name, file_size, date_id, total_delta_time
-            )
-            VALUES {}
-            """
-
-        self._bulk_insert(df, conn, query, fetch=False)
+        # The columns of the dataframe are named after the audit_log columns
+        self._bulk_copy(df, conn, 'audit_log')
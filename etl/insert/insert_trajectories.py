@@ -1,14 +1,18 @@
 """Module for inserting trajectories in bulk."""
-import random
-
 import pandas as pd
 from etl.constants import T_SHIP_ID_COL, \
     T_SHIP_NAVIGATIONAL_STATUS_ID_COL, T_START_DATE_COL, T_START_TIME_COL, T_END_DATE_COL, T_END_TIME_COL, \
-    T_ETA_DATE_COL, T_ETA_TIME_COL, T_DURATION_COL, T_INFER_STOPPED_COL, T_TRAJECTORY_SUB_ID_COL, INT32_MAX, \
+    T_ETA_DATE_COL, T_ETA_TIME_COL, T_DURATION_COL, T_INFER_STOPPED_COL, T_TRAJECTORY_SUB_ID_COL, \
     T_SHIP_TYPE_ID_COL
-from etl.helper_functions import get_connection
+from etl.helper_functions import get_connection, wrap_with_timings
 from etl.insert.bulk_inserter import BulkInserter
+from etl.insert.id_allocator import allocate_trajectory_sub_ids
+from etl.insert.day_partitions import day_partition_loading_enabled, prepare_day_partitions, target_table
+from etl.insert.load_state import begin_load
+from etl.insert.partition_lifecycle import check_reloadable
 from etl.insert.ensure_partitions import ensure_partitions_for_partitioned_tables
+from etl.insert.pipelined_inserter import insert_pipelined, INSERT_EXECUTOR_SEQUENTIAL, INSERT_EXECUTOR_PIPELINED
+from etl.insert.shard_inserter import insert_by_shard, SHARD_INSERTION_DISABLED, SHARD_INSERTION_WORKERS
 from etl.insert.dimensions.date_dimension import DateDimensionInserter
 from etl.insert.dimensions.navigational_status_dimension import NavigationalStatusDimensionInserter
 from etl.insert.dimensions.ship_dimension import ShipDimensionInserter
@@ -24,47 +28,35 @@ class TrajectoryInserter(BulkInserter):
 
     Methods
     -------
-    persist(df, config): persist trajectory data into a database
+    persist(df, config, reload, track_load_state): persist trajectory data into a database
+    rows(df): the fact_trajectory rows of the trajectories
     """
 
-    @staticmethod
-    def generate_unique_random_series(df, max, sampler=random.sample):
-        """
-        Generate a unique random series with length equal to the length of the dataframe.
-
-        This method can become very computationally heavy if the dataframe length is approaching the max value.
-
-        Args:
-            df: dataframe to generate a random series for
-            max: maximum value of the random series
-            sampler: function used to generate a random series
-        """
-        initial = pd.Series(sampler(range(max), len(df)))
-        # remove duplicates
-        initial = initial[~initial.duplicated()]
-
-        # if there were duplicates, make sure to match length of dataframe
-        while len(initial) < len(df):
-            initial = pd.concat([initial, pd.Series(sampler(range(max), len(df) - len(initial)))])
-            initial = initial[~initial.duplicated()]
-        return initial
-
-    def persist(self, df: pd.DataFrame, config):
+    def persist(self, df: pd.DataFrame, config, reload: bool = False, track_load_state: bool = False):
         """
         Persist trajectory data into a database.
 
         Keyword arguments:
             df: dataframe containing trajectory to insert
             config: the application configuration
+            reload: whether an already loaded or partially loaded day is replaced (default: False)
+            track_load_state: whether the load state of the day is recorded in load_state (default: False)
         """
         # rebuild index to be able to loop over it.
         df = df.reset_index()
-        df[T_TRAJECTORY_SUB_ID_COL] = self.generate_unique_random_series(df, INT32_MAX)
 
         conn = get_connection(config)
+        date_id = int(df[T_START_DATE_COL].iloc[0])
+        if reload:
+            check_reloadable(conn, date_id)
+        # The day is recorded as being loaded first, when its rows are committed in several transactions
+        begin_load(conn, date_id, reload, track_load_state)
+        df[T_TRAJECTORY_SUB_ID_COL] = allocate_trajectory_sub_ids(conn, len(df))
 
         # Ensure date id and partitions exists
-        ensure_partitions_for_partitioned_tables(conn, int(df[T_START_DATE_COL].iloc[0]))
+        ensure_partitions_for_partitioned_tables(conn, date_id)
+        if day_partition_loading_enabled(config):
+            prepare_day_partitions(conn, date_id, reload)
 
         DateDimensionInserter().ensure(df, conn)
         df = ShipTypeDimensionInserter('dim_ship_type', bulk_size=self.bulk_size,
@@ -72,30 +64,55 @@ class TrajectoryInserter(BulkInserter):
         df = ShipDimensionInserter("dim_ship", bulk_size=500, id_col_name=T_SHIP_ID_COL).ensure_with_timings(df, conn)
         df = NavigationalStatusDimensionInserter("dim_nav_status", bulk_size=self.bulk_size,
                                                  id_col_name="nav_status_id").ensure_with_timings(df, conn)
-        df = TrajectoryDimensionInserter("dim_trajectory", bulk_size=500).ensure_with_timings(df, conn)
-
-        self.ensure_with_timings(df, conn)
 
+        self._insert_trajectories(df, conn, config)
         return conn
 
-    def ensure(self, df: pd.DataFrame, conn):
+    def _insert_trajectories(self, df: pd.DataFrame, conn, config) -> None:
         """
-        Insert trajectories into database.
+        Insert the trajectory dimension and fact rows, using the configured shard insertion or insert executor.
 
         Keyword arguments:
-            df: dataframe containing trajectory data
-            conn: database connection
+            df: dataframe containing trajectory data with resolved dimension ids
+            conn: database connection of the day
+            config: the application configuration
         """
-        query = """
-            INSERT INTO fact_trajectory (
-                ship_id, trajectory_sub_id, nav_status_id,
-                start_date_id, start_time_id, end_date_id, end_time_id,
-                eta_date_id, eta_time_id,
-                duration, infer_stopped
+        date_id = int(df[T_START_DATE_COL].iloc[0])
+        tables = {
+            target_table('dim_trajectory', date_id): TrajectoryDimensionInserter.rows(df),
+            target_table('fact_trajectory', date_id): self.rows(df),
+        }
+        shard_insertion = config['Database'].get('shard_insertion', SHARD_INSERTION_DISABLED)
+        insert_executor = config['Database'].get('insert_executor', INSERT_EXECUTOR_SEQUENTIAL)
+
+        if shard_insertion != SHARD_INSERTION_DISABLED:
+            # The shards are loaded using separate connections, which must see the dimension rows referenced.
+            # The day stays recorded as being loaded until it is committed as loaded.
+            conn.commit()
+            wrap_with_timings(
+                'Inserting trajectories by shard',
+                lambda: insert_by_shard(conn, tables, T_TRAJECTORY_SUB_ID_COL, config,
+                                        to_workers=shard_insertion == SHARD_INSERTION_WORKERS),
+                audit_etl_stage='shard_inserter_trajectories'
             )
-            VALUES {}
+        elif insert_executor == INSERT_EXECUTOR_PIPELINED:
+            # The batches are loaded using separate connections, which must see the dimension rows referenced.
+            # The day stays recorded as being loaded until it is committed as loaded.
+            conn.commit()
+            wrap_with_timings('Inserting trajectories pipelined', lambda: insert_pipelined(tables, config),
+                              audit_etl_stage='pipelined_inserter_trajectories')
+        else:
+            TrajectoryDimensionInserter("dim_trajectory", bulk_size=500).ensure_with_timings(df, conn)
+            self.ensure_with_timings(df, conn)
+
+    @staticmethod
+    def rows(df: pd.DataFrame) -> pd.DataFrame:
         """
+        Return the fact_trajectory rows of the trajectories, named after the columns of the fact table.
 
+        Keyword arguments:
+            df: dataframe containing trajectory data
+        """
         columns = [
             T_SHIP_ID_COL,
             T_TRAJECTORY_SUB_ID_COL,
@@ -109,5 +126,14 @@ class TrajectoryInserter(BulkInserter):
             T_DURATION_COL,
             T_INFER_STOPPED_COL
         ]
+        return df[columns].rename(columns={T_SHIP_NAVIGATIONAL_STATUS_ID_COL: 'nav_status_id'})
 
-        self._bulk_insert(df[columns], conn, query, fetch=False)
+    def ensure(self, df: pd.DataFrame, conn):
+        """
+        Insert trajectories into database.
+
+        Keyword arguments:
+            df: dataframe containing trajectory data
+            conn: database connection
+        """
+        self._bulk_copy(self.rows(df), conn, target_table('fact_trajectory', int(df[T_START_DATE_COL].iloc[0])))
@@ -0,0 +1,151 @@
+"""Record the load state of every date, so dates left partially loaded by a failed load are detected."""
+from calendar import monthrange
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import Connection, text
+
+from etl.helper_functions import extract_smart_date_id_from_date, get_staging_cell_sizes
+from etl.init.sqlrunner import run_sql_file_with_timings
+from etl.insert.day_partitions import day_partition_loading_enabled
+from etl.insert.pipelined_inserter import INSERT_EXECUTOR_PIPELINED, INSERT_EXECUTOR_SEQUENTIAL
+from etl.insert.shard_inserter import SHARD_INSERTION_DISABLED
+from etl.rollup.rollup_dag import ROLLUP_EXECUTOR_DAG, ROLLUP_EXECUTOR_SEQUENTIAL
+
+LOAD_STATE_INSERTING = 'inserting'
+LOAD_STATE_LOADED = 'loaded'
+
+
+def load_state_tracking_enabled(config, rollup_batch_days: int = 1) -> bool:
+    """
+    Return whether the load state of every date is recorded.
+
+    The load state is recorded when the rows of a date are committed in several transactions, by inserting
+    trajectories by shard or pipelined, rolling up with the DAG executor or batching days, and when converting closed
+    months, which are closed once all their dates are recorded as loaded.
+
+    Keyword arguments:
+        config: the application configuration
+        rollup_batch_days: the number of days rolled up together (default: 1)
+    """
+    database = config['Database']
+    return any([
+        database.get('shard_insertion', SHARD_INSERTION_DISABLED) != SHARD_INSERTION_DISABLED,
+        database.get('insert_executor', INSERT_EXECUTOR_SEQUENTIAL) == INSERT_EXECUTOR_PIPELINED,
+        database.get('rollup_executor', ROLLUP_EXECUTOR_SEQUENTIAL) == ROLLUP_EXECUTOR_DAG,
+        # Read like columnar_conversion_enabled of partition_lifecycle, which depends on this module
+        database.get('columnar_closed_months', 'false').lower() == 'true',
+        rollup_batch_days > 1,
+    ])
+
+
+def ensure_load_state_table(config) -> None:
+    """
+    Create the load_state table if it does not exist, as in data warehouses initialized before it was added.
+
+    Keyword arguments:
+        config: the application configuration
+    """
+    run_sql_file_with_timings('etl/init/sql/41_load_state.sql', config)
+
+
+def begin_load(conn: Connection, date_id: int, reload: bool = False, track_load_state: bool = True) -> None:
+    """
+    Record a date as being loaded and commit it, before any rows of the date are committed.
+
+    When the load state is tracked, the rows of a date are committed in several transactions. A date still being
+    loaded was therefore left partially loaded by a failed load, and is rejected unless reloaded. When not loading into
+    day partitions, the rows of a reloaded date are deleted, as the day partitions of a reloaded date are otherwise
+    replaced when prepared. Without tracking, the deletion is left uncommitted in the transaction of the date.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the date
+        reload: whether the rows of the date are replaced (default: False)
+        track_load_state: whether the load state of the date is recorded (default: True)
+    """
+    if track_load_state:
+        state = conn.execute(text("SELECT state FROM load_state WHERE date_id = :date_id"),
+                             {'date_id': date_id}).scalar()
+        if state == LOAD_STATE_INSERTING and not reload:
+            raise ValueError(f'The date {date_id} was left partially loaded by a failed load, reload to replace it')
+    if reload and not day_partition_loading_enabled():
+        delete_date(conn, date_id)
+    if not track_load_state:
+        return
+
+    conn.execute(text("""
+        INSERT INTO load_state (date_id, state) VALUES (:date_id, :state)
+        ON CONFLICT (date_id) DO UPDATE SET state = EXCLUDED.state, updated_at = now()
+    """), {'date_id': date_id, 'state': LOAD_STATE_INSERTING})
+    conn.commit()
+
+
+def finish_load(conn: Connection, date_ids: List[int]) -> None:
+    """
+    Record dates as loaded, in the transaction committing the last rows of the dates.
+
+    Keyword arguments:
+        conn: the database connection
+        date_ids: the smart date ids of the loaded dates
+    """
+    conn.execute(text("UPDATE load_state SET state = :state, updated_at = now() WHERE date_id = ANY(:date_ids)"),
+                 {'state': LOAD_STATE_LOADED, 'date_ids': date_ids})
+
+
+def is_month_loaded(conn: Connection, date: datetime) -> bool:
+    """
+    Return whether every date of the month of the date has been loaded, in any order.
+
+    Keyword arguments:
+        conn: the database connection
+        date: a date of the month
+    """
+    days_in_month = monthrange(date.year, date.month)[1]
+    first_date_id = extract_smart_date_id_from_date(date.replace(day=1))
+    query = "SELECT count(*) FROM load_state WHERE state = :state AND date_id BETWEEN :first_date_id AND :last_date_id"
+    loaded_days = conn.execute(text(query), {
+        'state': LOAD_STATE_LOADED, 'first_date_id': first_date_id, 'last_date_id': first_date_id + days_in_month - 1
+    }).scalar()
+    return loaded_days == days_in_month
+
+
+def delete_date(conn: Connection, date_id: int) -> None:
+    """
+    Delete the trajectories of a date, their cell facts and the heatmaps of the date.
+
+    The cell facts of the trajectories are found by the key of their trajectory, the trajectory_sub_id and the start
+    date, and only on the dates of the trajectory, as trajectory_sub_ids are only unique within a date. The heatmaps of
+    the month are merged again when the date is rolled up. The heatmaps of the later dates the trajectories entered
+    cells on are not deleted, as they also aggregate the cell facts of other dates, so they keep counting the deleted
+    cell facts until those dates are reloaded. These dates are printed.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the date
+    """
+    params = {'date_id': date_id}
+    later_date_ids = conn.execute(text("""
+        SELECT DISTINCT dd.date_id FROM fact_trajectory ft
+        JOIN dim_date dd ON dd.date_id > ft.start_date_id AND dd.date_id <= ft.end_date_id
+        WHERE ft.start_date_id = :date_id
+        ORDER BY dd.date_id
+    """), params).scalars().all()
+    if later_date_ids:
+        print(f'The heatmaps of the dates {later_date_ids} count cell facts of the reloaded date {date_id}, '
+              f'reload these dates to update them')
+
+    for cell_size in get_staging_cell_sizes():
+        # The trajectories of the date are matched on their dates, as fact_trajectory is not colocated with the cells
+        conn.execute(text(f"""
+            DELETE FROM fact_cell_{cell_size}m
+            WHERE entry_date_id >= :date_id
+            AND (trajectory_sub_id, entry_date_id) IN (
+                SELECT ft.trajectory_sub_id, dd.date_id FROM fact_trajectory ft
+                JOIN dim_date dd ON dd.date_id BETWEEN ft.start_date_id AND ft.end_date_id
+                WHERE ft.start_date_id = :date_id
+            )
+        """), params)
+    conn.execute(text("DELETE FROM fact_cell_heatmap WHERE date_id = :date_id"), params)
+    conn.execute(text("DELETE FROM fact_trajectory WHERE start_date_id = :date_id"), params)
+    conn.execute(text("DELETE FROM dim_trajectory WHERE date_id = :date_id"), params)
@@ -0,0 +1,148 @@
+"""Convert the partitions of fully loaded months to columnar storage."""
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from etl.audit.logger import global_audit_logger as gal, TIMINGS_KEY, ACCESS_METHODS_KEY
+from etl.helper_functions import extract_smart_date_id_from_date, measure_time
+from etl.insert.day_partitions import day_partition_loading_enabled
+from etl.insert.ensure_partitions import partition_name
+from etl.insert.load_state import is_month_loaded
+from sqlalchemy import Connection, text
+
+COLUMNAR_ACCESS_METHOD = 'columnar'
+# Columnar storage only supports btree and hash indexes, which rules out dim_trajectory with its GiST index and the
+# cell facts with their SP-GiST indexes. The heatmaps are excluded as their levels are replaced when a date is reloaded.
+COLUMNAR_TABLE_NAMES = ['fact_trajectory']
+
+
+def columnar_conversion_enabled(config) -> bool:
+    """
+    Return whether the partitions of fully loaded months are converted to columnar storage.
+
+    Keyword arguments:
+        config: the application configuration
+    """
+    return config['Database'].get('columnar_closed_months', 'false').lower() == 'true'
+
+
+def is_month_converted(conn: Connection, date_id: int) -> bool:
+    """
+    Return whether the month of the date has been converted to columnar storage, so its rows can not be deleted.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of a date of the month
+    """
+    query = """
+        SELECT am.amname FROM pg_class
+        JOIN pg_am am ON pg_class.relam = am.oid
+        WHERE pg_class.relname = :partition
+    """
+    partition = partition_name(COLUMNAR_TABLE_NAMES[0], date_id)
+    return conn.execute(text(query), parameters={'partition': partition}).scalar() == COLUMNAR_ACCESS_METHOD
+
+
+def check_reloadable(conn: Connection, date_id: int) -> None:
+    """
+    Raise if the rows of a date to reload can not be deleted, as its month has been converted to columnar storage.
+
+    The day partitions of a date are replaced rather than deleted from, so they are reloadable once converted.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the date to reload
+    """
+    if not day_partition_loading_enabled() and is_month_converted(conn, date_id):
+        raise ValueError(f'The month of the date {date_id} has been converted to columnar storage and can not be '
+                         f'reloaded')
+
+
+def partitions_to_convert(partitions: Iterable[Tuple[str, str, str | None]], month_id: int,
+                          access_method: str = COLUMNAR_ACCESS_METHOD) -> List[str]:
+    """
+    Return the partitions of a month not yet using the access method.
+
+    Both monthly partitions and the day partitions of the month are returned, of the tables that can be converted.
+
+    Keyword arguments:
+        partitions: the (table name, partition name, access method) of the partitions of the date partitioned tables
+        month_id: the smart date id of the month, the day may be 00
+        access_method: the access method to convert to (default: 'columnar')
+    """
+    month_partitions = []
+    for table_name, partition, partition_access_method in partitions:
+        monthly_partition = partition_name(table_name, month_id)
+        in_month = partition == monthly_partition or partition.startswith(f'{monthly_partition}_')
+        if table_name in COLUMNAR_TABLE_NAMES and in_month and partition_access_method != access_method:
+            month_partitions.append(partition)
+    return sorted(month_partitions)
+
+
+def convert_month_partitions(conn: Connection, month_id: int, access_method: str = COLUMNAR_ACCESS_METHOD) -> None:
+    """
+    Convert the partitions of a month to an access method and analyze them, recording the conversions in the audit log.
+
+    Every partition is converted and committed in its own transaction, so a failed conversion is rolled back and
+    raised without undoing the conversions before it, which are skipped when the month is converted again.
+
+    Keyword arguments:
+        conn: the database connection
+        month_id: the smart date id of the month, the day may be 00
+        access_method: the access method to convert to (default: 'columnar')
+    """
+    query = """
+        SELECT parent.relname, child.relname, am.amname FROM pg_inherits
+        JOIN pg_class parent            ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child             ON pg_inherits.inhrelid  = child.oid
+        LEFT JOIN pg_am am              ON child.relam = am.oid
+        WHERE parent.relname = ANY(:relation_names)
+    """
+    partitions = conn.execute(text(query), parameters={'relation_names': COLUMNAR_TABLE_NAMES}).all()
+    # End the transaction of the catalog query, as every conversion is committed on its own
+    conn.commit()
+
+    with open('etl/insert/sql/set_access_method.sql', 'r') as f:
+        query_template = f.read()
+
+    for partition in partitions_to_convert(partitions, month_id, access_method):
+        query = query_template.format(TABLE_NAME=partition, ACCESS_METHOD=access_method)
+        gal[ACCESS_METHODS_KEY][partition] = _convert_partition(conn, partition, query, access_method)
+
+
+def _convert_partition(conn: Connection, partition: str, query: str, access_method: str) -> str:
+    """
+    Convert and analyze a partition, returning the access method of the partition afterwards.
+
+    Keyword arguments:
+        conn: the database connection
+        partition: the name of the partition
+        query: the query converting the partition
+        access_method: the access method converted to
+    """
+    print(f"Converting partition {partition} to {access_method}")
+    try:
+        _, seconds_elapsed = measure_time(lambda: conn.execute(text(query)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    gal[TIMINGS_KEY][f'{partition}_{access_method}'] = seconds_elapsed
+    conn.execute(text(f"ANALYZE {partition}"))
+    conn.commit()
+    return access_method
+
+
+def convert_closed_month(conn: Connection, date: datetime, config) -> None:
+    """
+    Convert the partitions of the month of the date to columnar storage, if enabled and every date of it is loaded.
+
+    The month is closed by the data rather than by the date, as dates can be loaded out of order or fail to load.
+
+    Keyword arguments:
+        conn: the database connection
+        date: the loaded date
+        config: the application configuration
+    """
+    if columnar_conversion_enabled(config) and is_month_loaded(conn, date):
+        convert_month_partitions(conn, extract_smart_date_id_from_date(date))
@@ -0,0 +1,143 @@
+"""Module inserting rows in batches over a pool of connections, keeping a number of batches in flight."""
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue
+from threading import BoundedSemaphore
+from typing import Dict, Iterator, List
+
+import pandas as pd
+
+from etl.audit.logger import global_audit_logger as gal, ROWS_KEY
+from etl.helper_functions import get_connection
+from etl.insert.bulk_inserter import BulkInserter
+
+# Insert executor modes, see the insert_executor configuration
+INSERT_EXECUTOR_SEQUENTIAL = 'sequential'
+INSERT_EXECUTOR_PIPELINED = 'pipelined'
+DEFAULT_INSERT_EXECUTOR_CONNECTIONS = 2
+DEFAULT_INSERT_EXECUTOR_BATCHES_IN_FLIGHT = 4
+PIPELINED_INSERT_BATCH_SIZE = 5000
+
+
+def split_into_batches(tables: Dict[str, pd.DataFrame], batch_size: int) -> Iterator[Dict[str, pd.DataFrame]]:
+    """
+    Split rows of related tables into batches, where every batch contains the rows at the same positions of every table.
+
+    Keyword arguments:
+        tables: mapping from table names to the rows to insert into them, with the related rows at the same positions
+        batch_size: the maximum number of rows of a table in a batch
+    """
+    row_count = max(len(rows) for rows in tables.values())
+    for start in range(0, row_count, batch_size):
+        yield {table_name: rows.iloc[start:start + batch_size] for table_name, rows in tables.items()}
+
+
+def insert_pipelined(tables: Dict[str, pd.DataFrame], config) -> None:
+    """
+    Insert rows of related tables in batches, keeping a number of batches in flight over a pool of connections.
+
+    The tables of a batch are inserted in the given order and committed in a single transaction, such that rows
+    referenced by a foreign key are inserted before, or together with, the rows referencing them.
+    Rows referenced in other tables must already be committed, as the batches are inserted using separate connections.
+    New batches are only handed out once a batch in flight finishes, and no more batches are handed out when a batch
+    fails. Batches already committed are not rolled back when another batch fails, so the number of rows committed
+    is reported by the raised exception, and the day is left recorded as being loaded until it is reloaded.
+
+    Keyword arguments:
+        tables: mapping from table names to the rows to insert into them, with the related rows at the same positions
+        config: the application configuration
+    """
+    connection_count = int(config['Database'].get('insert_executor_connections', DEFAULT_INSERT_EXECUTOR_CONNECTIONS))
+    batches_in_flight = int(config['Database'].get('insert_executor_batches_in_flight',
+                                                   DEFAULT_INSERT_EXECUTOR_BATCHES_IN_FLIGHT))
+    connections = Queue()
+    for _ in range(connection_count):
+        connections.put(get_connection(config))
+
+    try:
+        futures = _submit_batches(tables, connections, connection_count, batches_in_flight)
+        _raise_partial_insert(tables, futures)
+    finally:
+        while not connections.empty():
+            connections.get().close()
+
+    _log_rows(tables)
+
+
+def _raise_partial_insert(tables: Dict[str, pd.DataFrame], futures: List[Future]) -> None:
+    """
+    Raise an exception reporting the rows committed by the other batches, if a batch failed.
+
+    Keyword arguments:
+        tables: mapping from table names to the rows to insert into them
+        futures: the futures of the handed out batches, in the order of the batches
+    """
+    failed = [future.exception() for future in futures if future.exception() is not None]
+    if not failed:
+        return
+    committed = sum(1 for future in futures if future.exception() is None)
+    row_count = max(len(rows) for rows in tables.values())
+    committed_rows = sum(min(PIPELINED_INSERT_BATCH_SIZE, row_count - position * PIPELINED_INSERT_BATCH_SIZE)
+                         for position, future in enumerate(futures) if future.exception() is None)
+    raise RuntimeError(f'{len(failed)} batches failed after {committed} batches with {committed_rows} of {row_count} '
+                       f'rows were committed, the day is partially loaded and must be reloaded') from failed[0]
+
+
+def _log_rows(tables: Dict[str, pd.DataFrame]) -> None:
+    """
+    Log the number of rows inserted into every table in the GAL.
+
+    Keyword arguments:
+        tables: mapping from table names to the rows inserted into them
+    """
+    for table_name, rows in tables.items():
+        if table_name not in gal[ROWS_KEY]:
+            gal[ROWS_KEY][table_name] = 0
+        gal[ROWS_KEY][table_name] += len(rows)
+
+
+def _submit_batches(tables: Dict[str, pd.DataFrame], connections: Queue, connection_count: int,
+                    batches_in_flight: int) -> List[Future]:
+    """
+    Hand out batches to a thread per connection, waiting for a batch to finish when enough batches are in flight.
+
+    Returns once all handed out batches have finished.
+
+    Keyword arguments:
+        tables: mapping from table names to the rows to insert into them
+        connections: the pool of connections
+        connection_count: the number of connections in the pool
+        batches_in_flight: the maximum number of batches handed out but not finished
+    """
+    in_flight = BoundedSemaphore(batches_in_flight)
+    futures: List[Future] = []
+    with ThreadPoolExecutor(max_workers=connection_count) as executor:
+        for batch in split_into_batches(tables, PIPELINED_INSERT_BATCH_SIZE):
+            # Backpressure, wait for a batch in flight to finish before handing out the next
+            in_flight.acquire()
+            if any(future.exception() is not None for future in futures if future.done()):
+                break
+            future = executor.submit(_insert_batch, batch, connections)
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append(future)
+    return futures
+
+
+def _insert_batch(batch: Dict[str, pd.DataFrame], connections: Queue) -> None:
+    """
+    Insert and commit a batch using a connection from the pool, returning the connection to the pool afterwards.
+
+    Keyword arguments:
+        batch: mapping from table names to the rows of the batch to insert into them
+        connections: the pool of connections
+    """
+    conn = connections.get()
+    try:
+        for table_name, rows in batch.items():
+            if not rows.empty:
+                BulkInserter._copy(rows, conn, table_name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        connections.put(conn)
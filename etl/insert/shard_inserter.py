@@ -0,0 +1,184 @@
+"""Module inserting rows of colocated distributed tables concurrently, grouped by the shard they belong to."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Connection
+
+from etl.audit.logger import global_audit_logger as gal, ROWS_KEY
+from etl.helper_functions import get_connection
+from etl.insert.bulk_inserter import BulkInserter
+
+# Shard insertion modes, see the shard_insertion configuration
+SHARD_INSERTION_DISABLED = 'disabled'
+SHARD_INSERTION_COORDINATOR = 'coordinator'
+SHARD_INSERTION_WORKERS = 'workers'
+DEFAULT_SHARD_INSERTION_CONNECTIONS = 8
+
+SHARD_COL = 'shard_min_value'
+
+
+def read_shard_placements(conn: Connection, table_name: str) -> pd.DataFrame:
+    """
+    Return the shards of a hash distributed table, with their hash ranges and the node they are placed on.
+
+    Keyword arguments:
+        conn: connection to the Citus coordinator
+        table_name: the distributed table to read the shards of
+    """
+    query = """
+        SELECT
+            shard_name(s.logicalrelid, s.shardid) shard_name,
+            s.shardminvalue::int shard_min_value,
+            s.shardmaxvalue::int shard_max_value,
+            n.nodename || ':' || n.nodeport node
+        FROM pg_dist_shard s
+        JOIN pg_dist_placement p ON p.shardid = s.shardid
+        JOIN pg_dist_node n ON n.groupid = p.groupid
+        WHERE s.logicalrelid = %(table_name)s::regclass AND n.isactive
+        ORDER BY s.shardminvalue::int
+    """
+    return pd.read_sql_query(query, conn, params={'table_name': table_name})
+
+
+def hash_distribution_values(conn: Connection, distribution_values: pd.Series) -> np.ndarray:
+    """
+    Return the Citus hash of integer distribution column values.
+
+    The values are hashed by the database using the same hash function as Citus, such that shard assignment is exact.
+
+    Keyword arguments:
+        conn: connection to the Citus coordinator
+        distribution_values: the integer distribution column values to hash
+    """
+    query = """
+        SELECT hashint4(value) hash
+        FROM unnest(%(values)s::int[]) WITH ORDINALITY AS v(value, ordinality)
+        ORDER BY ordinality
+    """
+    params = {'values': distribution_values.astype(int).tolist()}
+    return pd.read_sql_query(query, conn, params=params)['hash'].to_numpy()
+
+
+def assign_shards(hashes: np.ndarray, placements: pd.DataFrame) -> np.ndarray:
+    """
+    Return the minimum hash value of the shard each hash belongs to, identifying the shard.
+
+    Keyword arguments:
+        hashes: the hashes of the distribution column values
+        placements: the shard placements, as returned by read_shard_placements
+    """
+    # Shards cover consecutive hash ranges, so the shard is the last one starting at or before the hash.
+    shard_starts = np.sort(placements[SHARD_COL].unique())
+    return shard_starts[np.searchsorted(shard_starts, hashes, side='right') - 1]
+
+
+def insert_by_shard(conn: Connection, tables: Dict[str, pd.DataFrame], distribution_col: str, config,
+                    to_workers: bool = False) -> None:
+    """
+    Insert rows of colocated distributed tables concurrently, grouping the rows by shard.
+
+    The tables are inserted in the given order for every shard, so foreign keys between the colocated tables hold.
+    Every group of shards is inserted and committed in its own transaction, so rows referenced by the inserted rows
+    must already be committed.
+
+    Keyword arguments:
+        conn: connection to the Citus coordinator, used to read the shard map
+        tables: mapping from table names to the rows to insert into them, named after the table columns
+        distribution_col: the distribution column of the colocated tables
+        config: the application configuration
+        to_workers: whether to insert directly into the shards on the workers, instead of through the coordinator
+            (default: False)
+    """
+    placements = {table_name: read_shard_placements(conn, table_name) for table_name in tables}
+    first_placements = next(iter(placements.values()))
+    shards = {table_name: assign_shards(hash_distribution_values(conn, rows[distribution_col]), first_placements)
+              for table_name, rows in tables.items()}
+
+    groups = group_shards(first_placements, config, to_workers)
+    connections = int(config['Database'].get('shard_insertion_connections', DEFAULT_SHARD_INSERTION_CONNECTIONS))
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        # Consume the results to re-raise any exception from the insertions
+        list(pool.map(
+            lambda group: _insert_shard_group(group[0], group[1], tables, shards, placements, config, to_workers),
+            groups.items()
+        ))
+
+    for table_name, rows in tables.items():
+        if table_name not in gal[ROWS_KEY]:
+            gal[ROWS_KEY][table_name] = 0
+        gal[ROWS_KEY][table_name] += len(rows)
+
+
+def group_shards(placements: pd.DataFrame, config, to_workers: bool) -> Dict[str, List[int]]:
+    """
+    Group the shards to insert by the connection inserting them.
+
+    When inserting to workers, the shards are grouped by the worker they are placed on, translating the internal
+    worker host to the host reachable by the ETL. Otherwise, the shards are spread over the coordinator connections.
+
+    Keyword arguments:
+        placements: the shard placements, as returned by read_shard_placements
+        config: the application configuration
+        to_workers: whether to insert directly into the shards on the workers
+    """
+    if not to_workers:
+        connections = int(config['Database'].get('shard_insertion_connections', DEFAULT_SHARD_INSERTION_CONNECTIONS))
+        shard_starts = placements[SHARD_COL].tolist()
+        return {f'coordinator_{idx}': shard_starts[idx::connections] for idx in range(connections)}
+
+    internal_hosts = config['Database']['worker_connection_internal_hosts'].split(',')
+    hosts = config['Database']['worker_connection_hosts'].split(',')
+    host_by_internal_host = dict(zip(internal_hosts, hosts))
+    return {host_by_internal_host.get(node, node): group[SHARD_COL].tolist()
+            for node, group in placements.groupby('node')}
+
+
+def _insert_shard_group(host: str, shard_starts: List[int], tables: Dict[str, pd.DataFrame],
+                        shards: Dict[str, np.ndarray], placements: Dict[str, pd.DataFrame], config,
+                        to_workers: bool) -> None:
+    """
+    Insert the rows of a group of shards using a separate connection, and commit them.
+
+    Keyword arguments:
+        host: the worker host to connect to, not used when inserting through the coordinator
+        shard_starts: the minimum hash values of the shards in the group
+        tables: mapping from table names to the rows to insert into them
+        shards: mapping from table names to the shard of every row
+        placements: mapping from table names to their shard placements
+        config: the application configuration
+        to_workers: whether to insert directly into the shards on the workers
+    """
+    conn = get_connection(config, host=host if to_workers else None)
+    try:
+        for table_name, rows in tables.items():
+            in_group = np.isin(shards[table_name], shard_starts)
+            if not in_group.any():
+                continue
+            if to_workers:
+                _copy_into_worker_shards(conn, table_name, rows[in_group], shards[table_name][in_group],
+                                         placements[table_name])
+            else:
+                BulkInserter._copy(rows[in_group], conn, table_name)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _copy_into_worker_shards(conn: Connection, table_name: str, rows: pd.DataFrame, row_shards: np.ndarray,
+                             placements: pd.DataFrame) -> None:
+    """
+    Copy rows directly into the shard tables on a worker.
+
+    Keyword arguments:
+        conn: connection to the worker
+        table_name: the distributed table the rows belong to
+        rows: the rows to insert
+        row_shards: the shard of every row
+        placements: the shard placements of the table
+    """
+    shard_names = placements.set_index(SHARD_COL)['shard_name']
+    for shard_start in np.unique(row_shards):
+        print(f"Copying rows of {table_name} into shard {shard_names[shard_start]}...")
+        BulkInserter._copy(rows[row_shards == shard_start], conn, shard_names[shard_start])
@@ -0,0 +1,119 @@
+"""Module scheduling the download and cleaning of the next dates in the background while a date is loaded."""
+from concurrent.futures import Executor, Future
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Generator, Iterable, List, Tuple, TypeVar
+
+T = TypeVar('T')
+D = TypeVar('D')
+
+
+def pipelined_range(dates: List[datetime], download: Callable[[datetime], str], clean: Callable[[datetime, str], T],
+                    download_pool: Executor, clean_pool: Executor, download_ahead: int, clean_ahead: int) \
+        -> Generator[Tuple[datetime, T], None, None]:
+    """
+    Yield the cleaned data of every date in order, downloading and cleaning the next dates in the background.
+
+    The cleaning of a date is submitted by the download pool once the file of the date is downloaded, so the dates
+    being downloaded, cleaned and yielded overlap. While a date is yielded, at most the given number of next dates are
+    downloaded or cleaned ahead. An exception raised by the download or the cleaning of a date is raised when the date
+    is reached.
+
+    Arguments:
+        dates: the dates to yield, in order
+        download: function downloading the file of a date and returning its path
+        clean: function cleaning the file of a date, which must be picklable when the clean pool is a process pool
+        download_pool: the executor downloading the files
+        clean_pool: the executor cleaning the files
+        download_ahead: the number of dates after the yielded date that are downloaded ahead
+        clean_ahead: the number of dates after the yielded date that are cleaned ahead, at most download_ahead
+    """
+    # The downloads are kept, such that the downloads of dates already cleaned are not submitted again
+    downloads: Dict[datetime, Future] = {}
+    cleanings: Dict[datetime, Future] = {}
+    for idx, date in enumerate(dates):
+        _submit_ahead(downloads, dates[idx:idx + download_ahead + 1],
+                      lambda ahead: download_pool.submit(download, ahead))
+        _submit_ahead(cleanings, dates[idx:idx + clean_ahead + 1],
+                      lambda ahead: chain_future(downloads[ahead], partial(clean_pool.submit, clean, ahead)))
+        yield date, cleanings.pop(date).result()
+
+
+def chain_future(future: Future, submit: Callable[[D], Future]) -> Future:
+    """
+    Return a future of the work submitted with the result of a future once it is done, without waiting for it.
+
+    The exception of the future, or of submitting the work, is set on the returned future.
+
+    Arguments:
+        future: the future whose result the work is submitted with
+        submit: function submitting the work for the result and returning its future
+    """
+    chained = Future()
+    future.add_done_callback(partial(_submit_result, chained=chained, submit=submit))
+    return chained
+
+
+def _submit_result(done: Future, chained: Future, submit: Callable[[D], Future]) -> None:
+    """
+    Submit the work for the result of a done future, or set its exception on the chained future.
+
+    Arguments:
+        done: the done future
+        chained: the future of the submitted work
+        submit: function submitting the work for the result and returning its future
+    """
+    if done.exception() is not None:
+        chained.set_exception(done.exception())
+        return
+    try:
+        submit(done.result()).add_done_callback(partial(_copy_outcome, chained=chained))
+    except Exception as e:
+        chained.set_exception(e)
+
+
+def _copy_outcome(done: Future, chained: Future) -> None:
+    """
+    Set the result or the exception of a done future on the chained future.
+
+    Arguments:
+        done: the done future
+        chained: the future to set the outcome on
+    """
+    if done.exception() is not None:
+        chained.set_exception(done.exception())
+    else:
+        chained.set_result(done.result())
+
+
+def _submit_ahead(futures: Dict[datetime, Future], dates: List[datetime],
+                  submit: Callable[[datetime], Future]) -> None:
+    """
+    Submit work for the dates that have not been submitted yet.
+
+    Arguments:
+        futures: the futures of the already submitted dates, which the new futures are added to
+        dates: the dates to submit work for
+        submit: function submitting the work for a date and returning its future
+    """
+    for date in dates:
+        if date not in futures:
+            futures[date] = submit(date)
+
+
+def batch_days(days: Iterable[Tuple[datetime, D]], batch_size: int) -> Generator[List[Tuple[datetime, D]], None, None]:
+    """
+    Group consecutive cleaned days into batches of at most the given number of days.
+
+    Arguments:
+        days: the cleaned days and their data
+        batch_size: the maximum number of days in a batch
+    """
+    batch = []
+    for day in days:
+        batch.append(day)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
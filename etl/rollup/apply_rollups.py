@@ -1,170 +1,401 @@
 """Module to apply rollups after inserting."""
-import os
 from datetime import datetime
+from typing import Dict, List
 
 from etl.helper_functions import wrap_with_timings, measure_time, execute_insert_query_on_connection, \
-    extract_smart_date_id_from_date, get_staging_cell_sizes
+    extract_smart_date_id_from_date, get_staging_cell_sizes, get_config
 from etl.audit.logger import global_audit_logger as gal, TIMINGS_KEY, ROWS_KEY
+from etl.insert.day_partitions import day_partition_loading_enabled, attach_day_partitions, target_table
+from etl.rollup.cell_traversal import CELL_FACT_ENGINE_SQL, CELL_FACT_ENGINE_TRAVERSAL, CellFactTraversal, \
+    read_traversal_inputs
+from etl.rollup.heatmap_levels import HOURLY_TEMPORAL_RESOLUTION, apply_heatmap_levels
+from etl.rollup.heatmap_rasters import HEATMAP_ENGINE_SQL, HEATMAP_ENGINE_NUMPY, copy_heatmaps
+from etl.rollup.partition_lookup import SPLIT_PARTITION_ENGINE_SQL, SPLIT_PARTITION_ENGINE_LOOKUP, \
+    copy_split_trajectories
+from etl.rollup.split_partitions import split_partition_name, prepare_split_partition, drop_split_partition
+from etl.rollup.rollup_dag import ROLLUP_EXECUTOR_SEQUENTIAL, ROLLUP_EXECUTOR_DAG, RollupStep, run_rollup_dag
 from sqlalchemy import Connection, text
 
 
-def apply_rollups(conn: Connection, date: datetime) -> None:
+def apply_rollups(conn: Connection, date: datetime, date_to: datetime | None = None) -> None:
     """
     Use the open database connection to apply rollups for the given date.
 
+    Several dates can be rolled up together, paying the fixed costs of every rollup once for all of them.
+    Dates can only be rolled up together when not loading days into day partitions.
+
     Args:
         conn: The database connection
-        date: The date to apply the rollups for
+        date: The date to apply the rollups for, or the first date when rolling up several dates
+        date_to: The last date to apply the rollups for, inclusive (default: only the date)
     """
-    wrap_with_timings("Applying simplify rollup", lambda: apply_simplify_query(conn, date))
-    wrap_with_timings("Applying length calculation rollup", lambda: apply_calc_length_query(conn, date))
+    if date_to is not None and date_to != date and day_partition_loading_enabled():
+        raise ValueError('Several dates can not be rolled up together when day_partition_loading is enabled')
+
+    config = get_config()
+    if config['Database'].get('rollup_executor', ROLLUP_EXECUTOR_SEQUENTIAL) == ROLLUP_EXECUTOR_DAG:
+        # The steps are run on other connections, which must see the inserted trajectories
+        conn.commit()
+        wrap_with_timings("Running rollup steps", lambda: run_rollup_dag(rollup_steps(date, date_to), config))
+        return
+
+    wrap_with_timings("Applying simplify rollup", lambda: apply_simplify_query(conn, date, date_to))
+    wrap_with_timings("Applying length calculation rollup", lambda: apply_calc_length_query(conn, date, date_to))
 
     # Commit the changes, this is neccessary as citus does not distribute the rollup query efficiently otherwise.
     conn.commit()
 
-    wrap_with_timings("Perform cell fact rollups", lambda: apply_cell_fact_rollups(conn, date))
-    wrap_with_timings('Pre-aggregating heatmaps', lambda: apply_heatmap_aggregations(conn, date))
+    wrap_with_timings("Perform cell fact rollups", lambda: apply_cell_fact_rollups(conn, date, date_to))
+    if day_partition_loading_enabled():
+        # The heatmaps are aggregated from the partitioned tables, so the day must be attached first
+        date_smart_key = extract_smart_date_id_from_date(date)
+        wrap_with_timings("Attaching day partitions", lambda: attach_day_partitions(conn, date_smart_key))
+    wrap_with_timings('Pre-aggregating heatmaps', lambda: apply_heatmap_aggregations(conn, date, date_to))
+
+
+def date_range_params(date: datetime, date_to: datetime | None = None) -> Dict[str, int]:
+    """
+    Return the query parameters of the first and the last date smart key rolled up.
+
+    Args:
+        date: The first date rolled up
+        date_to: The last date rolled up, inclusive (default: only the date)
+    """
+    return {
+        'from_date_smart_key': extract_smart_date_id_from_date(date),
+        'to_date_smart_key': extract_smart_date_id_from_date(date_to or date),
+    }
+
+
+def rollup_steps(date: datetime, date_to: datetime | None = None) -> List[RollupStep]:
+    """
+    Return the rollup steps for the given dates, with the dependencies between them.
 
+    The length is calculated and the trajectories split from the simplified trajectories. The cell sizes are rolled
+    up independently of each other from the split trajectories, but their cells are lazy loaded from the largest to the
+    smallest cell size, as every cell references its parent cell. A heatmap of a cell size is aggregated once its cells
+    are loaded, and once the day partitions are attached when loading days into day partitions.
 
-def apply_simplify_query(conn: Connection, date: datetime) -> None:
+    Args:
+        date: The date to apply the rollups for, or the first date when rolling up several dates
+        date_to: The last date to apply the rollups for, inclusive (default: only the date)
+    """
+    steps = [
+        RollupStep('simplify', lambda conn: apply_simplify_query(conn, date, date_to)),
+        RollupStep('calc_length', lambda conn: apply_calc_length_query(conn, date, date_to), ['simplify']),
+        RollupStep('traj_split_5k', lambda conn: apply_split_query(conn, date, date_to), ['simplify']),
+        *_cell_fact_steps(date, date_to, 'traj_split_5k'),
+    ]
+    heatmap_dependencies = {size: [f'dim_cell_{size}m_lazy'] for size in get_staging_cell_sizes()}
+    if day_partition_loading_enabled():
+        date_smart_key = extract_smart_date_id_from_date(date)
+        attach_dependencies = ['calc_length', *(step.name for step in steps if step.name.startswith('dim_cell'))]
+        steps.append(RollupStep('attach_day_partitions',
+                                lambda conn: attach_day_partitions(conn, date_smart_key), attach_dependencies))
+        heatmap_dependencies = {size: ['attach_day_partitions'] for size in heatmap_dependencies}
+    return [*steps, *_heatmap_steps(date, date_to, heatmap_dependencies)]
+
+
+def _cell_fact_steps(date: datetime, date_to: datetime | None, split_step: str) -> List[RollupStep]:
+    """
+    Return the cell fact rollup and lazy load steps of every cell size.
+
+    Args:
+        date: The first date to apply the rollups for
+        date_to: The last date to apply the rollups for, inclusive, or None for only the first date
+        split_step: The name of the step splitting the trajectories
+    """
+    date_range = date_range_params(date, date_to)
+    from_key, to_key = date_range['from_date_smart_key'], date_range['to_date_smart_key']
+    staging_cell_sizes = get_staging_cell_sizes()
+    # The traversal step shares the traversal with the rollup steps, which depend on it
+    traversals: Dict[str, CellFactTraversal] = {}
+    steps = []
+    rollup_dependencies = [split_step]
+    if get_config()['Database'].get('cell_fact_engine', CELL_FACT_ENGINE_SQL) == CELL_FACT_ENGINE_TRAVERSAL:
+        def traverse(conn):
+            traversals['traversal'] = CellFactTraversal(read_traversal_inputs(conn, from_key, to_key),
+                                                        staging_cell_sizes)
+        steps.append(RollupStep('cell_traversal', traverse, [split_step]))
+        rollup_dependencies = ['cell_traversal']
+
+    for (cell_size, parent_cell_size) in zip(staging_cell_sizes, [*staging_cell_sizes[1:], None]):
+        parent_dependencies = [f'dim_cell_{parent_cell_size}m_lazy'] if parent_cell_size else []
+        steps.append(RollupStep(
+            f'fact_cell_{cell_size}m_rollup',
+            lambda conn, cell_size=cell_size: rollup_cell_facts(conn, date, cell_size, traversals.get('traversal')),
+            rollup_dependencies,
+        ))
+        steps.append(RollupStep(
+            f'dim_cell_{cell_size}m_lazy',
+            lambda conn, cell_size=cell_size, parent_cell_size=parent_cell_size: lazy_load_dim_cell(
+                cell_size, conn, parent_cell_size, from_key, to_key),
+            [f'fact_cell_{cell_size}m_rollup', *parent_dependencies],
+        ))
+    steps.append(RollupStep('drop_split_partition', lambda conn: drop_split_partition(conn, from_key),
+                            [f'fact_cell_{cell_size}m_rollup' for cell_size in staging_cell_sizes]))
+    return steps
+
+
+def _heatmap_steps(date: datetime, date_to: datetime | None, dependencies: Dict[int, List[str]]) -> List[RollupStep]:
+    """
+    Return the heatmap aggregation and level merging steps of every cell size.
+
+    Args:
+        date: The first date to pre-aggregate heatmaps for
+        date_to: The last date to pre-aggregate heatmaps for, inclusive, or None for only the first date
+        dependencies: The names of the steps the heatmaps of every cell size depend on
+    """
+    steps = []
+    for size, size_dependencies in dependencies.items():
+        steps.append(RollupStep(f'heatmap_{size}m_aggregation',
+                                lambda conn, size=size: apply_heatmap_aggregation(conn, date, size, date_to),
+                                size_dependencies))
+        steps.append(RollupStep(f'heatmap_{size}m_levels',
+                                lambda conn, size=size: apply_heatmap_levels(conn, date, size, date_to),
+                                [f'heatmap_{size}m_aggregation']))
+    return steps
+
+
+def trajectory_tables(date_smart_key: int) -> Dict[str, str]:
     """
-    Apply the simplify query for the given date.
+    Return the trajectory tables the rollups of the given date read and update, by their query template name.
+
+    Args:
+        date_smart_key: The date smart key of the rollups
+    """
+    return {
+        'FACT_TRAJECTORY_TABLE': target_table('fact_trajectory', date_smart_key),
+        'DIM_TRAJECTORY_TABLE': target_table('dim_trajectory', date_smart_key),
+    }
+
+
+def apply_simplify_query(conn: Connection, date: datetime, date_to: datetime | None = None) -> None:
+    """
+    Apply the simplify query for the given dates.
 
     Args:
         conn: The database connection
-        date: The date to apply the rollup for
+        date: The first date to apply the rollup for
+        date_to: The last date to apply the rollup for, inclusive (default: only the first date)
     """
     with open('etl/rollup/sql/simplify_trajectories.sql', 'r') as f:
         query = f.read()
 
-    date_smart_key = extract_smart_date_id_from_date(date)
-    conn.execute(text(query), {'date_smart_key': date_smart_key})
+    query = query.format(**trajectory_tables(extract_smart_date_id_from_date(date)))
+    conn.execute(text(query), date_range_params(date, date_to))
 
 
-def apply_calc_length_query(conn: Connection, date: datetime) -> None:
+def apply_calc_length_query(conn: Connection, date: datetime, date_to: datetime | None = None) -> None:
     """
-    Apply the length calculation query for the given date.
+    Apply the length calculation query for the given dates.
 
     Args:
         conn: The database connection
-        date: The date to apply the rollup for
+        date: The first date to apply the rollup for
+        date_to: The last date to apply the rollup for, inclusive (default: only the first date)
     """
     with open('etl/rollup/sql/calc_length.sql', 'r') as f:
         query = f.read()
 
-    date_smart_key = extract_smart_date_id_from_date(date)
-    conn.execute(text(query), {'date_smart_key': date_smart_key})
+    query = query.format(**trajectory_tables(extract_smart_date_id_from_date(date)))
+    conn.execute(text(query), date_range_params(date, date_to))
 
 
-def apply_heatmap_aggregations(conn, date: datetime) -> None:
+def apply_heatmap_aggregations(conn, date: datetime, date_to: datetime | None = None) -> None:
     """
-    Pre-aggregate heatmaps.
+    Pre-aggregate hourly heatmaps, and merge them into the daily and monthly heatmaps.
 
     Keyword Arguments:
         conn: The database connection
-        date: The date to pre-aggregate heatmaps for
+        date: The first date to pre-aggregate heatmaps for
+        date_to: The last date to pre-aggregate heatmaps for, inclusive (default: only the first date)
     """
-    date_smart_key = extract_smart_date_id_from_date(date)
-    staging_cell_sizes = get_staging_cell_sizes()
+    for size in get_staging_cell_sizes():
+        apply_heatmap_aggregation(conn, date, size, date_to)
+        wrap_with_timings(f'Merging heatmap levels for {size}m cells',
+                          lambda: apply_heatmap_levels(conn, date, size, date_to))
+
+
+def apply_heatmap_aggregation(conn, date: datetime, size: int, date_to: datetime | None = None) -> None:
+    """
+    Pre-aggregate the heatmaps of every heatmap type for a cell size.
+
+    The measures of all heatmap types are aggregated in a single pass over the cell facts of the size,
+    and the raster of every type is then inserted as a row of its own. The rasters are built by the database, or
+    client-side when the heatmap engine is numpy.
+
+    Keyword Arguments:
+        conn: The database connection
+        date: The first date to pre-aggregate the heatmaps for
+        size: The cell size of the heatmaps
+        date_to: The last date to pre-aggregate the heatmaps for, inclusive (default: only the first date)
+    """
+    date_range = date_range_params(date, date_to)
+    date_keys = [date_range['from_date_smart_key'], date_range['to_date_smart_key']]
+    if get_config()['Database'].get('heatmap_engine', HEATMAP_ENGINE_SQL) == HEATMAP_ENGINE_NUMPY:
+        rows, seconds_elapsed = wrap_with_timings(
+            f'Building heatmaps for {size}m cells',
+            lambda: measure_time(lambda: copy_heatmaps(conn, *date_keys, size, HOURLY_TEMPORAL_RESOLUTION))
+        )
+    else:
+        with open('etl/rollup/sql/heatmap_aggregation.sql', 'r') as f:
+            query = f.read().format(CELL_SIZE=size)
+        rows, seconds_elapsed = wrap_with_timings(
+            f'Creating heatmaps for {size}m cells',
+            lambda: _apply_heatmap_aggregation(conn,
+                                               date_keys,
+                                               query,
+                                               temporal_resolution=HOURLY_TEMPORAL_RESOLUTION,
+                                               spatial_resolution=size)
+        )
+    # Audit log the information
+    gal[TIMINGS_KEY][f'heatmap_{size}m_aggregation'] = seconds_elapsed
+    gal[ROWS_KEY][f'heatmap_{size}m_aggregation'] = rows
 
-    files = os.listdir('etl/rollup/sql/heatmaps')
-    files.sort()
-
-    for file in files:
-        with open(f'etl/rollup/sql/heatmaps/{file}', 'r') as f:
-            query_template = f.read()
-        for size in staging_cell_sizes:
-            query = query_template.format(CELL_SIZE=size)
-            rows, seconds_elapsed = wrap_with_timings(
-                f'Creating {file} heatmap for {size}m cells',
-                lambda: _apply_heatmap_aggregation(conn,
-                                                   date_smart_key,
-                                                   query,
-                                                   temporal_resolution=84600,
-                                                   spatial_resolution=size)
-            )
-            # Audit log the information
-            gal[TIMINGS_KEY][f'heatmap_{file[3:-4]}_{size}m_aggregation'] = seconds_elapsed
-            gal[ROWS_KEY][f'heatmap_{file[3:-4]}_{size}m_aggregation'] = rows
-
-
-def _apply_heatmap_aggregation(conn, date_key: int, query: str, temporal_resolution: int,
+
+def _apply_heatmap_aggregation(conn, date_keys: List[int], query: str, temporal_resolution: int,
                                spatial_resolution: int) -> None:
     """
     Pre-aggregate single heatmap.
 
     Keyword Arguments:
         conn: The database connection
-        date_key: The DW smart key for the date to apply aggregation
+        date_keys: The DW smart keys of the first and last date to apply aggregation
         query: The aggregation query
         temporal_resolution: The temporal duration in seconds the heatmap spans
         spatial_resolution: The spatial extend in units of the SRID per pixel in the heatmap
     """
     return measure_time(
         lambda: execute_insert_query_on_connection(conn, query,
-                                                   {'DATE_KEY': date_key,
+                                                   {'FROM_DATE_KEY': date_keys[0],
+                                                    'TO_DATE_KEY': date_keys[1],
                                                     'TEMPORAL_RESOLUTION': temporal_resolution,
                                                     'SPATIAL_RESOLUTION': spatial_resolution}))
 
 
-def apply_cell_fact_rollups(conn, date: datetime) -> None:
+def apply_cell_fact_rollups(conn, date: datetime, date_to: datetime | None = None) -> None:
     """
-    Apply the cell fact rollups for the given date. Includes the lazy loading of cell dimensions.
+    Apply the cell fact rollups for the given dates. Includes the lazy loading of cell dimensions.
 
     Args:
         conn: The database connection
-        date: The date to apply the rollup for
+        date: The first date to apply the rollup for
+        date_to: The last date to apply the rollup for, inclusive (default: only the first date)
     """
-    with open('etl/rollup/sql/staging_split_trajectories.sql', 'r') as f:
-        query = f.read()
-
-    date_smart_key = extract_smart_date_id_from_date(date)
-
-    (rows, seconds_elapsed) = measure_time(
-        lambda: execute_insert_query_on_connection(conn, query, {'date_smart_key': date_smart_key})
-    )
-    gal[TIMINGS_KEY]["traj_split_5k"] = seconds_elapsed
-    gal[ROWS_KEY]["traj_split_5k"] = rows
+    apply_split_query(conn, date, date_to)
 
+    date_range = date_range_params(date, date_to)
+    from_key, to_key = date_range['from_date_smart_key'], date_range['to_date_smart_key']
     staging_cell_sizes = get_staging_cell_sizes()
+    traversal = None
+    if get_config()['Database'].get('cell_fact_engine', CELL_FACT_ENGINE_SQL) == CELL_FACT_ENGINE_TRAVERSAL:
+        # The split trajectories are read and traversed once, deriving the crossings of all cell sizes
+        traversal = wrap_with_timings(
+            "Traversing split trajectories",
+            lambda: CellFactTraversal(read_traversal_inputs(conn, from_key, to_key), staging_cell_sizes)
+        )
+
     for (cell_size, parent_cell_size) in \
             reversed([*zip(staging_cell_sizes, staging_cell_sizes[1:]), (staging_cell_sizes[-1], None)]):
         wrap_with_timings(
             f"Applying {cell_size}m cell fact rollup",
-            lambda: apply_cell_fact_rollup(conn, date, cell_size, parent_cell_size)
+            lambda: apply_cell_fact_rollup(conn, date, cell_size, parent_cell_size, traversal, date_to)
         )
+    drop_split_partition(conn, from_key)
 
 
-def apply_cell_fact_rollup(conn, date: datetime, cell_size: int, parent_cell_size: int) -> None:
+def apply_cell_fact_rollup(conn, date: datetime, cell_size: int, parent_cell_size: int,
+                           traversal: CellFactTraversal | None = None, date_to: datetime | None = None) -> None:
     """
     Apply the cell fact rollup and lazy load for the given data and cell size.
 
     Args:
         conn: The database connection
-        date: The date to apply the rollup for
+        date: The first date to apply the rollup for
         cell_size: The cell size to apply the rollup for
         parent_cell_size: The parent cell size to apply the lazy load for
+        traversal: The client-side grid traversal of the dates, or None to apply the rollup query (default: None)
+        date_to: The last date to apply the rollup for, inclusive (default: only the first date)
+    """
+    rollup_cell_facts(conn, date, cell_size, traversal)
+
+    # We need to commit as we have performed a distributed query, and now need to insert into a reference table.
+    conn.commit()
+
+    date_range = date_range_params(date, date_to)
+    lazy_load_dim_cell(cell_size, conn, parent_cell_size, date_range['from_date_smart_key'],
+                       date_range['to_date_smart_key'])
+
+
+def rollup_cell_facts(conn, date: datetime, cell_size: int, traversal: CellFactTraversal | None = None) -> None:
+    """
+    Apply the cell fact rollup for the given date and cell size.
+
+    Args:
+        conn: The database connection
+        date: The date to apply the rollup for
+        cell_size: The cell size to apply the rollup for
+        traversal: The client-side grid traversal of the date, or None to apply the rollup query (default: None)
     """
     with open('etl/rollup/sql/fact_cell_rollup.sql', 'r') as f:
         cell_fact_rollup_query = f.read()
 
-    cell_fact_rollup_query = cell_fact_rollup_query.format(CELL_SIZE=cell_size)
-
     date_smart_key = extract_smart_date_id_from_date(date)
-
-    (rows, seconds_elapsed) = measure_time(
-        lambda: execute_insert_query_on_connection(conn, cell_fact_rollup_query)
-    )
+    fact_cell_table = target_table(f'fact_cell_{cell_size}m', date_smart_key)
+    split_trajectories_table = split_partition_name(date_smart_key)
+    cell_fact_rollup_query = cell_fact_rollup_query.format(CELL_SIZE=cell_size, FACT_CELL_TABLE=fact_cell_table,
+                                                           SPLIT_TRAJECTORIES_TABLE=split_trajectories_table)
+
+    if traversal is None:
+        (rows, seconds_elapsed) = measure_time(
+            lambda: execute_insert_query_on_connection(conn, cell_fact_rollup_query)
+        )
+    else:
+        (rows, seconds_elapsed) = measure_time(
+            lambda: traversal.copy_cell_facts(conn, cell_size, fact_cell_table)
+        )
     gal[TIMINGS_KEY][f"fact_cell_{cell_size}m_rollup"] = seconds_elapsed
     gal[ROWS_KEY][f"fact_cell_{cell_size}m_rollup"] = rows
 
-    # We need to commit as we have performed a distributed query, and now need to insert into a reference table.
-    conn.commit()
 
-    lazy_load_dim_cell(cell_size, conn, parent_cell_size, date_smart_key)
+def apply_split_query(conn, date: datetime, date_to: datetime | None = None) -> None:
+    """
+    Split the trajectories of the given dates into their partition of staging.split_trajectories.
+
+    The partition is created and committed first, so the dates are split and rolled up independently of other dates.
+    The pieces are assigned to their spatial partition by the database, or client-side when the split partition engine
+    is lookup.
+
+    Args:
+        conn: The database connection
+        date: The first date to split the trajectories of
+        date_to: The last date to split the trajectories of, inclusive (default: only the first date)
+    """
+    date_range = date_range_params(date, date_to)
+    from_key = date_range['from_date_smart_key']
+    prepare_split_partition(conn, from_key, date_range['to_date_smart_key'])
+    split_trajectories_table = split_partition_name(from_key)
+
+    if get_config()['Database'].get('split_partition_engine', SPLIT_PARTITION_ENGINE_SQL) == \
+            SPLIT_PARTITION_ENGINE_LOOKUP:
+        with open('etl/rollup/sql/split_trajectory_pieces.sql', 'r') as f:
+            query = f.read().format(**trajectory_tables(from_key))
+        (rows, seconds_elapsed) = measure_time(
+            lambda: copy_split_trajectories(conn, query, date_range, split_trajectories_table)
+        )
+    else:
+        with open('etl/rollup/sql/staging_split_trajectories.sql', 'r') as f:
+            query = f.read().format(**trajectory_tables(from_key), SPLIT_TRAJECTORIES_TABLE=split_trajectories_table)
+        (rows, seconds_elapsed) = measure_time(
+            lambda: execute_insert_query_on_connection(conn, query, date_range)
+        )
+    gal[TIMINGS_KEY]["traj_split_5k"] = seconds_elapsed
+    gal[ROWS_KEY]["traj_split_5k"] = rows
 
 
-def lazy_load_dim_cell(cell_size: int, conn, parent_cell_size: int, date_smart_key: int):
+def lazy_load_dim_cell(cell_size: int, conn, parent_cell_size: int, date_smart_key: int,
+                       to_date_smart_key: int | None = None):
     """
     Lazy load the dim_cell table for the given cell size.
 
@@ -172,18 +403,22 @@ def lazy_load_dim_cell(cell_size: int, conn, parent_cell_size: int, date_smart_k
         cell_size: The cell size to lazy load for
         conn: The database connection
         parent_cell_size: The parent cell size to lazy load for
-        date_smart_key: The date smart key to lazy load for
+        date_smart_key: The date smart key to lazy load for, or the first when lazy loading several dates
+        to_date_smart_key: The last date smart key to lazy load for, inclusive (default: only the date smart key)
     """
     with open('etl/rollup/sql/lazy_load_cells_from_cell_facts.sql', 'r') as f:
         lazy_dim_cell_query = f.read()
     parent_formula_x = f"cell_x/{(int)(parent_cell_size / cell_size)}" if parent_cell_size else "NULL"
     parent_formula_y = f"cell_y/{(int)(parent_cell_size / cell_size)}" if parent_cell_size else "NULL"
     lazy_dim_cell_query = lazy_dim_cell_query.format(
-        CELL_SIZE=cell_size, PARENT_FORMULA_X=parent_formula_x, PARENT_FORMULA_Y=parent_formula_y
+        CELL_SIZE=cell_size, PARENT_FORMULA_X=parent_formula_x, PARENT_FORMULA_Y=parent_formula_y,
+        FACT_CELL_TABLE=target_table(f'fact_cell_{cell_size}m', date_smart_key)
     )
     (rows, seconds_elapsed) = measure_time(
         lambda: execute_insert_query_on_connection(conn, lazy_dim_cell_query,
-                                                   {'date_smart_key': date_smart_key}, fetch_count=True),
+                                                   {'from_date_smart_key': date_smart_key,
+                                                    'to_date_smart_key': to_date_smart_key or date_smart_key},
+                                                   fetch_count=True),
     )
     gal[TIMINGS_KEY][f"dim_cell_{cell_size}m_lazy"] = seconds_elapsed
     gal[ROWS_KEY][f"dim_cell_{cell_size}m_lazy"] = rows
@@ -0,0 +1,533 @@
+"""Module computing cell facts by traversing the projected trajectories through the cell grids client-side."""
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Connection
+
+from etl.insert.bulk_inserter import BulkInserter
+from etl.insert.day_partitions import target_table
+from etl.rollup.split_partitions import split_partition_name
+
+CELL_FACT_ENGINE_SQL = 'sql'
+CELL_FACT_ENGINE_TRAVERSAL = 'traversal'
+# SRID of the projected trajectories and cell grids, whose origin is (0, 0)
+CELL_SRID = 3034
+# Distance in meters from a cell edge within which a crossing enters or exits through the edge
+EDGE_DISTANCE_THRESHOLD = 0.2
+# Cell edges in the order ties between their distances are decided in
+EDGE_DIRECTIONS = ['South', 'North', 'East', 'West']
+UNKNOWN_DIRECTION = 'Unknown'
+KNOTS_PER_METER_SECOND = 1.94
+DEGREES_UPPER_BOUND = 360
+# The unknown delta heading of trajectories without headings
+UNKNOWN_DELTA_HEADING = -1
+FACT_CELL_COLUMNS = [
+    'cell_x', 'cell_y', 'ship_id', 'entry_date_id', 'entry_time_id', 'exit_date_id', 'exit_time_id',
+    'direction_id', 'nav_status_id', 'infer_stopped', 'trajectory_sub_id',
+    'sog', 'delta_heading', 'draught', 'delta_cog', 'st_bounding_box', 'partition_id'
+]
+FACT_CELL_KEY_COLUMNS = [
+    'cell_x', 'cell_y', 'ship_id', 'entry_date_id', 'entry_time_id', 'exit_date_id', 'exit_time_id',
+    'direction_id', 'nav_status_id', 'trajectory_sub_id', 'partition_id'
+]
+PIECE_COLUMNS = ['trajectory_sub_id', 'ship_id', 'nav_status_id', 'infer_stopped', 'partition_id']
+
+
+def traverse_grid(piece: np.ndarray, x: np.ndarray, y: np.ndarray, t: np.ndarray, cell_size: int) \
+        -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Return the crossings of trajectory pieces through the cells of a grid, and the azimuths of their movements.
+
+    Every segment between two consecutive instants of a piece is cut where it crosses a grid line, after which
+    consecutive cuts of a piece in the same cell are merged into a crossing, like a DDA traversal of the grid.
+    The instants must be ordered by piece and time.
+
+    Keyword arguments:
+        piece: the piece of every instant
+        x: the projected x coordinate of every instant
+        y: the projected y coordinate of every instant
+        t: the epoch seconds of every instant
+        cell_size: the size of the cells in meters
+    """
+    cuts = _cut_segments(_segments(piece, x, y, t), cell_size)
+    crossings, crossing_of_cut = _merge_consecutive(cuts, cuts['cell_x'].to_numpy(), cuts['cell_y'].to_numpy())
+    moving = cuts['length'].to_numpy() > 0
+    azimuths = pd.DataFrame({
+        'crossing': crossing_of_cut[moving],
+        'azimuth': cuts['azimuth'].to_numpy()[moving],
+    })
+    return crossings, azimuths
+
+
+def coarsen_crossings(crossings: pd.DataFrame, azimuths: pd.DataFrame, cell_size: int, parent_cell_size: int) \
+        -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Return the crossings of a parent grid, derived from the crossings of a grid nested in it.
+
+    Consecutive crossings of a piece inside the same parent cell are merged, keeping the entry of the first and the
+    exit of the last crossing, and the azimuths of all of them.
+
+    Keyword arguments:
+        crossings: the crossings of the nested grid, ordered by piece and time
+        azimuths: the crossing and azimuth of the movements of the crossings
+        cell_size: the size of the cells of the nested grid in meters
+        parent_cell_size: the size of the cells of the parent grid in meters, a multiple of the cell size
+    """
+    if parent_cell_size % cell_size != 0:
+        raise ValueError(f'The {parent_cell_size}m grid is not a parent of the {cell_size}m grid')
+    ratio = parent_cell_size // cell_size
+    parents, parent_of_crossing = _merge_consecutive(crossings, np.floor_divide(crossings['cell_x'].to_numpy(), ratio),
+                                                     np.floor_divide(crossings['cell_y'].to_numpy(), ratio))
+    parent_azimuths = azimuths.assign(crossing=parent_of_crossing[azimuths['crossing'].to_numpy()])
+    return parents, parent_azimuths.drop_duplicates(ignore_index=True)
+
+
+def traverse_cell_sizes(piece: np.ndarray, x: np.ndarray, y: np.ndarray, t: np.ndarray, cell_sizes: List[int]) \
+        -> Dict[int, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Return the crossings and azimuths of trajectory pieces for every cell size.
+
+    The pieces are only traversed through the grid of the smallest cell size, and the crossings of every larger
+    cell size are derived from the crossings of the next smaller cell size, as the grids are nested.
+
+    Keyword arguments:
+        piece: the piece of every instant
+        x: the projected x coordinate of every instant
+        y: the projected y coordinate of every instant
+        t: the epoch seconds of every instant
+        cell_sizes: the sizes of the cells in meters, every size being a multiple of the smaller sizes
+    """
+    cell_sizes = sorted(cell_sizes)
+    traversals = {cell_sizes[0]: traverse_grid(piece, x, y, t, cell_sizes[0])}
+    for cell_size, parent_cell_size in zip(cell_sizes, cell_sizes[1:]):
+        traversals[parent_cell_size] = coarsen_crossings(*traversals[cell_size], cell_size, parent_cell_size)
+    return traversals
+
+
+def _merge_consecutive(parts: pd.DataFrame, cell_x: np.ndarray, cell_y: np.ndarray) \
+        -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Return the crossings formed by merging consecutive parts of a piece in a cell, and the crossing of every part.
+
+    Keyword arguments:
+        parts: the parts of the pieces, ordered by piece and time
+        cell_x: the x index of the cell of every part
+        cell_y: the y index of the cell of every part
+    """
+    new_crossing = np.ones(len(parts), dtype=bool)
+    new_crossing[1:] = (np.diff(parts['piece'].to_numpy()) != 0) | (np.diff(cell_x) != 0) | (np.diff(cell_y) != 0)
+    first = np.flatnonzero(new_crossing)
+    last = np.append(first[1:] - 1, len(parts) - 1)
+
+    crossings = pd.DataFrame({
+        'piece': parts['piece'].to_numpy()[first],
+        'cell_x': cell_x[first],
+        'cell_y': cell_y[first],
+        'entry_x': parts['entry_x'].to_numpy()[first],
+        'entry_y': parts['entry_y'].to_numpy()[first],
+        'exit_x': parts['exit_x'].to_numpy()[last],
+        'exit_y': parts['exit_y'].to_numpy()[last],
+        'entry_time': parts['entry_time'].to_numpy()[first],
+        'exit_time': parts['exit_time'].to_numpy()[last],
+        'length': np.add.reduceat(parts['length'].to_numpy(), first) if len(first) else np.empty(0),
+    })
+    return crossings, np.cumsum(new_crossing) - 1
+
+
+def _segments(piece: np.ndarray, x: np.ndarray, y: np.ndarray, t: np.ndarray) -> pd.DataFrame:
+    """
+    Return the segments between consecutive instants of the same piece, ordered by piece and time.
+
+    A piece of a single instant is a segment of zero length from the instant to itself, as fact_cell_rollup.sql
+    emits a crossing for a single instant contained in a cell.
+
+    Keyword arguments:
+        piece: the piece of every instant
+        x: the projected x coordinate of every instant
+        y: the projected y coordinate of every instant
+        t: the epoch seconds of every instant
+    """
+    same_as_next = np.zeros(len(piece), dtype=bool)
+    same_as_next[:-1] = piece[1:] == piece[:-1]
+    same_as_previous = np.zeros(len(piece), dtype=bool)
+    same_as_previous[1:] = same_as_next[:-1]
+    start = np.flatnonzero(same_as_next | ~same_as_previous)
+    end = np.where(same_as_next[start], start + 1, start)
+    return pd.DataFrame({
+        'piece': piece[start],
+        'x0': x[start], 'y0': y[start], 't0': t[start],
+        'x1': x[end], 'y1': y[end], 't1': t[end],
+    })
+
+
+def _grid_line_params(v0: np.ndarray, v1: np.ndarray, cell_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the segment and position along the segment, between 0 and 1, of every grid line crossed on an axis.
+
+    Keyword arguments:
+        v0: the start coordinate of every segment on the axis
+        v1: the end coordinate of every segment on the axis
+        cell_size: the size of the cells in meters
+    """
+    c0 = np.floor(v0 / cell_size)
+    c1 = np.floor(v1 / cell_size)
+    counts = np.abs(c1 - c0).astype(np.int64)
+    segment = np.repeat(np.arange(len(v0)), counts)
+    nth_line = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    lines = (np.minimum(c0, c1)[segment] + nth_line) * cell_size
+    return segment, (lines - v0[segment]) / (v1 - v0)[segment]
+
+
+def _cut_segments(segments: pd.DataFrame, cell_size: int) -> pd.DataFrame:
+    """
+    Return the segments cut at the grid lines they cross, each cut lying in a single cell.
+
+    Keyword arguments:
+        segments: the segments to cut
+        cell_size: the size of the cells in meters
+    """
+    x0, y0, t0 = segments['x0'].to_numpy(), segments['y0'].to_numpy(), segments['t0'].to_numpy()
+    dx = segments['x1'].to_numpy() - x0
+    dy = segments['y1'].to_numpy() - y0
+    dt = segments['t1'].to_numpy() - t0
+    x_segment, x_params = _grid_line_params(x0, x0 + dx, cell_size)
+    y_segment, y_params = _grid_line_params(y0, y0 + dy, cell_size)
+
+    segment = np.concatenate([np.arange(len(segments)), x_segment, y_segment])
+    start = np.concatenate([np.zeros(len(segments)), x_params, y_params])
+    order = np.lexsort((start, segment))
+    segment, start = segment[order], start[order]
+    end = np.ones(len(start))
+    continued = segment[1:] == segment[:-1]
+    end[:-1][continued] = start[1:][continued]
+    # Crossing a grid line at an end of the segment, or a grid corner, results in an empty cut
+    keep = end > start
+    segment, start, end = segment[keep], start[keep], end[keep]
+
+    middle = (start + end) / 2
+    return pd.DataFrame({
+        'piece': segments['piece'].to_numpy()[segment],
+        'cell_x': np.floor((x0[segment] + middle * dx[segment]) / cell_size).astype(np.int64),
+        'cell_y': np.floor((y0[segment] + middle * dy[segment]) / cell_size).astype(np.int64),
+        'entry_x': x0[segment] + start * dx[segment],
+        'entry_y': y0[segment] + start * dy[segment],
+        'exit_x': x0[segment] + end * dx[segment],
+        'exit_y': y0[segment] + end * dy[segment],
+        'entry_time': t0[segment] + start * dt[segment],
+        'exit_time': t0[segment] + end * dt[segment],
+        'length': (end - start) * np.hypot(dx, dy)[segment],
+        # Azimuth clockwise from north, as PostGIS
+        'azimuth': np.mod(np.degrees(np.arctan2(dx, dy)), DEGREES_UPPER_BOUND)[segment],
+    })
+
+
+def edge_directions(cell_x: np.ndarray, cell_y: np.ndarray, x: np.ndarray, y: np.ndarray,
+                    cell_size: int) -> np.ndarray:
+    """
+    Return the edge of the cell nearest to every point, or Unknown if no edge is within the threshold distance.
+
+    Keyword arguments:
+        cell_x: the x index of the cell of every point
+        cell_y: the y index of the cell of every point
+        x: the projected x coordinate of every point
+        y: the projected y coordinate of every point
+        cell_size: the size of the cells in meters
+    """
+    distances = np.stack([
+        y - cell_y * cell_size,
+        (cell_y + 1) * cell_size - y,
+        (cell_x + 1) * cell_size - x,
+        x - cell_x * cell_size,
+    ], axis=1)
+    nearest = np.argmin(distances, axis=1)
+    within = distances[np.arange(len(nearest)), nearest] <= EDGE_DISTANCE_THRESHOLD
+    return np.where(within, np.array(EDGE_DIRECTIONS)[nearest], UNKNOWN_DIRECTION)
+
+
+def segmented_delta(groups: np.ndarray, values: np.ndarray, count: int,
+                    upper_bound: float = DEGREES_UPPER_BOUND) -> np.ndarray:
+    """
+    Return the sum of differences between consecutive distinct values per group, as calculate_delta_upperbounded.
+
+    The values of a group are sorted, and every difference is the shortest way around the upper bound.
+
+    Keyword arguments:
+        groups: the group of every value, between 0 and count - 1
+        values: the values
+        count: the number of groups
+        upper_bound: the bound the values wrap around at (default: 360)
+    """
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    distinct = np.ones(len(values), dtype=bool)
+    distinct[1:] = (groups[1:] != groups[:-1]) | (values[1:] != values[:-1])
+    groups, values = groups[distinct], values[distinct]
+
+    same_group = groups[1:] == groups[:-1]
+    difference = np.mod(values[1:] - values[:-1], upper_bound)
+    delta = np.minimum(difference, np.mod(-difference, upper_bound))
+    return np.bincount(groups[1:][same_group], weights=delta[same_group], minlength=count)
+
+
+def values_in_periods(owner: np.ndarray, start: np.ndarray, end: np.ndarray,
+                      instants: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the values of stepwise temporal values during periods, as the period and value of every value.
+
+    The values during a period are the value at its start and the values of the instants within it. A period starting
+    before the first instant or in a gap between the sequences of a temporal value has no value at its start.
+
+    Keyword arguments:
+        owner: the owner of the temporal value of every period
+        start: the whole epoch seconds every period starts at
+        end: the whole epoch seconds every period ends at
+        instants: the owner, whole epoch seconds, value and whole epoch seconds of the end of the sequence of the
+            instants, ordered by owner and time
+    """
+    if instants.empty or len(owner) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    inst_owner = instants['owner'].to_numpy(dtype=np.int64)
+    inst_time = instants['time'].to_numpy(dtype=np.int64)
+    origin = min(start.min(), inst_time.min())
+    span = max(end.max(), inst_time.max()) - origin + 2
+    inst_keys = inst_owner * span + (inst_time - origin)
+
+    lo = np.searchsorted(inst_keys, owner * span + (start - origin), side='right') - 1
+    # The value at the start of the period is the last value before it, if it is a value of the same owner whose
+    # sequence has not ended before the period
+    before = np.maximum(lo, 0)
+    starts_within = (lo >= 0) & (inst_owner[before] == owner) & \
+        (instants['sequence_end'].to_numpy(dtype=np.int64)[before] >= start)
+    lo = np.where(starts_within, lo, lo + 1)
+    hi = np.searchsorted(inst_keys, owner * span + (end - origin), side='right')
+
+    counts = np.maximum(hi - lo, 0)
+    period = np.repeat(np.arange(len(owner)), counts)
+    index = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return period, instants['value'].to_numpy()[index]
+
+
+def build_cell_facts(crossings: pd.DataFrame, azimuths: pd.DataFrame, headings: pd.DataFrame,
+                     draughts: pd.DataFrame, directions: pd.DataFrame, cell_size: int) -> pd.DataFrame:
+    """
+    Return the fact_cell rows of crossings, computed like fact_cell_rollup.sql.
+
+    Keyword arguments:
+        crossings: the crossings, with the columns of the piece they are part of
+        azimuths: the crossing and azimuth of the movements of the crossings
+        headings: the heading instants of the trajectories, as read by read_temporal_instants
+        draughts: the draught instants of the trajectories, as read by read_temporal_instants
+        directions: the direction_id, from and to of the direction dimension
+        cell_size: the size of the cells in meters
+    """
+    # Truncated to the second, rounding first to not truncate interpolation errors
+    entry = np.floor(np.round(crossings['entry_time'].to_numpy(), 6)).astype(np.int64)
+    leave = np.floor(np.round(crossings['exit_time'].to_numpy(), 6)).astype(np.int64)
+    owner = crossings['trajectory_sub_id'].to_numpy(dtype=np.int64)
+    cell_x, cell_y = crossings['cell_x'].to_numpy(), crossings['cell_y'].to_numpy()
+
+    facts = crossings[['cell_x', 'cell_y', 'ship_id', 'nav_status_id', 'infer_stopped', 'trajectory_sub_id',
+                       'partition_id']].reset_index(drop=True)
+    facts = facts.assign(
+        entry_date_id=_date_ids(entry), entry_time_id=_time_ids(entry),
+        exit_date_id=_date_ids(leave), exit_time_id=_time_ids(leave),
+        sog=crossings['length'].to_numpy() / np.maximum(leave - entry, 1) * KNOTS_PER_METER_SECOND,
+        delta_heading=_delta_heading(owner, entry, leave, headings),
+        draught=_minimum_draught(owner, entry, leave, draughts),
+        delta_cog=segmented_delta(azimuths['crossing'].to_numpy(), azimuths['azimuth'].to_numpy(), len(crossings)),
+        st_bounding_box=_bounding_boxes(cell_x, cell_y, entry, leave, cell_size),
+    )
+    facts['from'] = edge_directions(cell_x, cell_y, crossings['entry_x'].to_numpy(), crossings['entry_y'].to_numpy(),
+                                    cell_size)
+    facts['to'] = edge_directions(cell_x, cell_y, crossings['exit_x'].to_numpy(), crossings['exit_y'].to_numpy(),
+                                  cell_size)
+    facts = facts.merge(directions, on=['from', 'to'], how='left')
+    return facts[FACT_CELL_COLUMNS].drop_duplicates(FACT_CELL_KEY_COLUMNS, ignore_index=True)
+
+
+def _date_ids(seconds: np.ndarray) -> np.ndarray:
+    """
+    Return the smart date ids of epoch seconds.
+
+    Keyword arguments:
+        seconds: the epoch seconds
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(seconds, unit='s'))
+    return (dates.year * 10000 + dates.month * 100 + dates.day).to_numpy()
+
+
+def _time_ids(seconds: np.ndarray) -> np.ndarray:
+    """
+    Return the smart time ids of epoch seconds.
+
+    Keyword arguments:
+        seconds: the epoch seconds
+    """
+    seconds_of_day = np.mod(seconds, 86400)
+    return seconds_of_day // 3600 * 10000 + seconds_of_day % 3600 // 60 * 100 + seconds_of_day % 60
+
+
+def _delta_heading(owner: np.ndarray, entry: np.ndarray, leave: np.ndarray, headings: pd.DataFrame) -> np.ndarray:
+    """
+    Return the delta heading of every crossing, being unknown for crossings without a heading during the crossing.
+
+    Keyword arguments:
+        owner: the trajectory of every crossing
+        entry: the whole epoch seconds of the entry of every crossing
+        leave: the whole epoch seconds of the exit of every crossing
+        headings: the heading instants of the trajectories, as read by read_temporal_instants
+    """
+    period, values = values_in_periods(owner, entry, leave, headings)
+    delta = segmented_delta(period, values, len(owner))
+    # Like the heading at the time of the crossing being null in the rollup query
+    has_heading = np.bincount(period, minlength=len(owner)) > 0
+    return np.where(has_heading, delta, UNKNOWN_DELTA_HEADING)
+
+
+def _minimum_draught(owner: np.ndarray, entry: np.ndarray, leave: np.ndarray, draughts: pd.DataFrame) -> np.ndarray:
+    """
+    Return the minimum draught during every crossing, being None without draughts.
+
+    Keyword arguments:
+        owner: the trajectory of every crossing
+        entry: the whole epoch seconds of the entry of every crossing
+        leave: the whole epoch seconds of the exit of every crossing
+        draughts: the draught instants of the trajectories, as read by read_temporal_instants
+    """
+    period, values = values_in_periods(owner, entry, leave, draughts)
+    minimum = np.full(len(owner), np.inf)
+    np.minimum.at(minimum, period, values)
+    return np.where(np.isinf(minimum), None, minimum.astype(object))
+
+
+def _bounding_boxes(cell_x: np.ndarray, cell_y: np.ndarray, entry: np.ndarray, leave: np.ndarray,
+                    cell_size: int) -> pd.Series:
+    """
+    Return the spatiotemporal boxes of the cells during the crossings, in the text format of stbox.
+
+    Keyword arguments:
+        cell_x: the x index of the cell of every crossing
+        cell_y: the y index of the cell of every crossing
+        entry: the whole epoch seconds of the entry of every crossing
+        leave: the whole epoch seconds of the exit of every crossing
+        cell_size: the size of the cells in meters
+    """
+    def timestamps(seconds):
+        return pd.Series(pd.to_datetime(seconds, unit='s').strftime('%Y-%m-%d %H:%M:%S+00'))
+
+    def coordinates(cells):
+        return pd.Series(cells * cell_size).astype(str)
+
+    return (f'SRID={CELL_SRID};STBOX XT(((' + coordinates(cell_x) + ',' + coordinates(cell_y) + '),(' +
+            coordinates(cell_x + 1) + ',' + coordinates(cell_y + 1) + ')),[' +
+            timestamps(entry) + ', ' + timestamps(leave) + '])').to_numpy()
+
+
+def read_traversal_inputs(conn: Connection, date_smart_key: int, to_date_smart_key: int | None = None) \
+        -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Return the split trajectory pieces and instants, the heading and draught instants, and the directions.
+
+    The pieces are read from the partition of staging.split_trajectories, which must have been filled for the dates.
+
+    Keyword arguments:
+        conn: the database connection
+        date_smart_key: the date smart key of the trajectories, or the first when reading several dates
+        to_date_smart_key: the last date smart key of the trajectories, inclusive (default: only the date smart key)
+    """
+    query = f"""
+        SELECT
+            st.trajectory_sub_id, st.ship_id, st.nav_status_id, st.infer_stopped, st.partition_id,
+            EXTRACT(EPOCH FROM startTimestamp(st.trajectory)) piece_start,
+            ST_X(getValue(inst)) x, ST_Y(getValue(inst)) y, EXTRACT(EPOCH FROM getTimestamp(inst)) t
+        FROM {split_partition_name(date_smart_key)} st, unnest(instants(st.trajectory)) inst
+    """
+    instants = pd.read_sql_query(query, conn)
+    piece_columns = ['trajectory_sub_id', 'partition_id', 'piece_start']
+    instants = instants.sort_values([*piece_columns, 't'], ignore_index=True)
+    instants['piece'] = instants.groupby(piece_columns, sort=False).ngroup()
+    pieces = instants.drop_duplicates('piece').set_index('piece')[PIECE_COLUMNS]
+
+    directions = pd.read_sql_query('SELECT direction_id, "from", "to" FROM dim_direction', conn)
+    return (pieces, instants[['piece', 'x', 'y', 't']],
+            read_temporal_instants(conn, 'heading', date_smart_key, to_date_smart_key),
+            read_temporal_instants(conn, 'draught', date_smart_key, to_date_smart_key), directions)
+
+
+def read_temporal_instants(conn: Connection, column: str, date_smart_key: int,
+                           to_date_smart_key: int | None = None) -> pd.DataFrame:
+    """
+    Return the instants of a temporal column of the trajectory dimension.
+
+    Every instant has its owner, whole epoch seconds and value, and the whole epoch seconds of the end of its sequence,
+    as a temporal value has no value in the gaps between its sequences.
+
+    Keyword arguments:
+        conn: the database connection
+        column: the temporal float column to read
+        date_smart_key: the date smart key of the trajectories, or the first when reading several dates
+        to_date_smart_key: the last date smart key of the trajectories, inclusive (default: only the date smart key)
+    """
+    query = f"""
+        SELECT
+            dt.trajectory_sub_id owner,
+            floor(EXTRACT(EPOCH FROM getTimestamp(inst)))::bigint "time",
+            getValue(inst) "value",
+            floor(EXTRACT(EPOCH FROM endTimestamp(seq)))::bigint sequence_end
+        FROM {target_table('dim_trajectory', date_smart_key)} dt, unnest(sequences(dt.{column})) seq,
+            unnest(instants(seq)) inst
+        WHERE dt.date_id BETWEEN %(date_smart_key)s AND %(to_date_smart_key)s
+    """
+    instants = pd.read_sql_query(query, conn, params={'date_smart_key': date_smart_key,
+                                                      'to_date_smart_key': to_date_smart_key or date_smart_key})
+    return instants.sort_values(['owner', 'time'], ignore_index=True)
+
+
+class CellFactTraversal:
+    """
+    Class computing the cell facts of the split trajectories of a date, for all cell sizes.
+
+    The split trajectories are traversed through the grid of the smallest cell size when constructed, and the
+    crossings of the larger cell sizes are derived from it.
+
+    Methods
+    -------
+    copy_cell_facts(conn, cell_size, table_name): copy the fact_cell rows of a cell size
+    """
+
+    def __init__(self, inputs: Tuple[pd.DataFrame, ...], cell_sizes: List[int]):
+        """
+        Construct an instance of the CellFactTraversal class.
+
+        Keyword arguments:
+            inputs: the inputs of the traversal, as read by read_traversal_inputs
+            cell_sizes: the sizes of the cells in meters, every size being a multiple of the smaller sizes
+        """
+        self.pieces, instants, self.headings, self.draughts, self.directions = inputs
+        self.traversals = traverse_cell_sizes(instants['piece'].to_numpy(), instants['x'].to_numpy(),
+                                              instants['y'].to_numpy(), instants['t'].to_numpy(), cell_sizes)
+
+    def cell_facts(self, cell_size: int) -> pd.DataFrame:
+        """
+        Return the fact_cell rows of a cell size.
+
+        Keyword arguments:
+            cell_size: the size of the cells in meters
+        """
+        crossings, azimuths = self.traversals[cell_size]
+        crossings = crossings.join(self.pieces, on='piece')
+        return build_cell_facts(crossings, azimuths, self.headings, self.draughts, self.directions, cell_size)
+
+    def copy_cell_facts(self, conn: Connection, cell_size: int, table_name: str) -> int:
+        """
+        Copy the fact_cell rows of a cell size, returning the number of rows.
+
+        Keyword arguments:
+            conn: the database connection
+            cell_size: the size of the cells in meters
+            table_name: the cell fact table to copy into
+        """
+        rows = self.cell_facts(cell_size)
+        BulkInserter._copy(rows, conn, table_name)
+        return len(rows)
@@ -0,0 +1,104 @@
+"""Module keeping the daily and monthly temporal levels of the heatmaps, merged from the hourly heatmaps."""
+from datetime import datetime, timedelta
+from typing import Tuple
+
+from sqlalchemy import Connection, text
+
+from etl.audit.logger import global_audit_logger as gal, TIMINGS_KEY, ROWS_KEY
+from etl.helper_functions import extract_smart_date_id_from_date, extract_date_from_smart_date_id, measure_time, \
+    execute_insert_query_on_connection
+
+# The temporal resolutions identifying the levels of fact_cell_heatmap. The hourly heatmaps keep the resolution they
+# have always been loaded with, so the heatmaps loaded before the levels were introduced remain the hourly level.
+HOURLY_TEMPORAL_RESOLUTION = 84600
+DAILY_TEMPORAL_RESOLUTION = 86400
+# The monthly level is labelled with the duration of the longest month
+MONTHLY_TEMPORAL_RESOLUTION = 31 * DAILY_TEMPORAL_RESOLUTION
+# The smart time ids of the start and the end of a day
+START_OF_DAY_TIME_ID = 0
+END_OF_DAY_TIME_ID = 235959
+
+
+def month_range(date: datetime) -> Tuple[int, int]:
+    """
+    Return the smart date ids of the first and the last day of the month of the date.
+
+    Keyword arguments:
+        date: the date
+    """
+    first_day = date.replace(day=1)
+    last_day = (first_day + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return extract_smart_date_id_from_date(first_day), extract_smart_date_id_from_date(last_day)
+
+
+def coarsest_temporal_resolution(start_date_id: int, end_date_id: int, start_time_id: int = START_OF_DAY_TIME_ID,
+                                 end_time_id: int = END_OF_DAY_TIME_ID) -> int:
+    """
+    Return the temporal resolution of the coarsest heatmap level covering the time from the start to the end.
+
+    The monthly level covers the time if it spans whole months, the daily level if it spans whole days, and the hourly
+    level covers any other time.
+
+    Keyword arguments:
+        start_date_id: the smart date id of the first date
+        end_date_id: the smart date id of the last date, inclusive
+        start_time_id: the smart time id of the start on the first date (default: the start of the day)
+        end_time_id: the smart time id of the end on the last date, inclusive (default: the end of the day)
+    """
+    if start_time_id != START_OF_DAY_TIME_ID or end_time_id < END_OF_DAY_TIME_ID:
+        return HOURLY_TEMPORAL_RESOLUTION
+    starts_month = start_date_id == month_range(extract_date_from_smart_date_id(start_date_id))[0]
+    ends_month = end_date_id == month_range(extract_date_from_smart_date_id(end_date_id))[1]
+    return MONTHLY_TEMPORAL_RESOLUTION if starts_month and ends_month else DAILY_TEMPORAL_RESOLUTION
+
+
+def apply_heatmap_levels(conn: Connection, date: datetime, cell_size: int, date_to: datetime | None = None) -> None:
+    """
+    Merge the hourly heatmaps of dates and a cell size into daily heatmaps, and their months into monthly heatmaps.
+
+    The heatmaps of a level are replaced when merged, so the levels stay correct when a date is loaded again.
+    The monthly heatmaps are merged from the daily heatmaps of the months loaded so far.
+
+    Keyword arguments:
+        conn: the database connection
+        date: the loaded date, or the first date when several dates are loaded
+        cell_size: the cell size of the heatmaps
+        date_to: the last loaded date, inclusive (default: only the date)
+    """
+    date_keys = (extract_smart_date_id_from_date(date), extract_smart_date_id_from_date(date_to or date))
+    month_keys = (month_range(date)[0], month_range(date_to or date)[1])
+    levels = [
+        # Every daily heatmap has the date of its hourly heatmaps, and every monthly heatmap the first day of the month
+        ('daily', DAILY_TEMPORAL_RESOLUTION, HOURLY_TEMPORAL_RESOLUTION, 'fch.date_id', date_keys),
+        ('monthly', MONTHLY_TEMPORAL_RESOLUTION, DAILY_TEMPORAL_RESOLUTION, 'fch.date_id / 100 * 100 + 1', month_keys),
+    ]
+    with open('etl/rollup/sql/heatmap_level.sql', 'r') as f:
+        query_template = f.read()
+
+    for name, temporal_resolution, finer_temporal_resolution, level_date_id, (start_key, end_key) in levels:
+        params = {
+            'START_DATE_KEY': start_key, 'END_DATE_KEY': end_key, 'SPATIAL_RESOLUTION': cell_size,
+            'TEMPORAL_RESOLUTION': temporal_resolution, 'FINER_TEMPORAL_RESOLUTION': finer_temporal_resolution,
+        }
+        query = query_template.format(LEVEL_DATE_ID=level_date_id)
+        rows, seconds_elapsed = measure_time(lambda: _replace_level(conn, query, params))
+        gal[TIMINGS_KEY][f'heatmap_{cell_size}m_{name}_level'] = seconds_elapsed
+        gal[ROWS_KEY][f'heatmap_{cell_size}m_{name}_level'] = rows
+
+
+def _replace_level(conn: Connection, query: str, params: dict) -> int:
+    """
+    Delete the heatmaps of a level in a date range, and merge them again from the finer level, returning the rows.
+
+    Keyword arguments:
+        conn: the database connection
+        query: the query merging the heatmaps of the finer level
+        params: the parameters of the query
+    """
+    conn.execute(text("""
+        DELETE FROM fact_cell_heatmap
+        WHERE spatial_resolution = :SPATIAL_RESOLUTION
+        AND temporal_resolution_sec = :TEMPORAL_RESOLUTION
+        AND date_id BETWEEN :START_DATE_KEY AND :END_DATE_KEY
+    """), params)
+    return execute_insert_query_on_connection(conn, query, params)
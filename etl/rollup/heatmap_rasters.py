@@ -0,0 +1,190 @@
+"""Module building the heatmap rasters of cell facts client-side, encoded in the PostGIS raster WKB format."""
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Connection, text
+
+from etl.insert.bulk_inserter import BulkInserter
+
+HEATMAP_ENGINE_SQL = 'sql'
+HEATMAP_ENGINE_NUMPY = 'numpy'
+# SRID of the cell grids, whose origin is (0, 0)
+HEATMAP_SRID = 3034
+# Size in meters of the area covered by a heatmap raster, the size of the largest cells
+HEATMAP_TILE_SIZE = 5000
+# PostGIS raster pixel type ids and the dtypes of their values, see https://postgis.net/docs/RT_ST_BandPixelType.html
+PIXEL_TYPES = {
+    '32BUI': (8, np.dtype('<u4')),
+    '32BF': (10, np.dtype('<f4')),
+}
+BAND_HAS_NODATA = 0x40
+# The measure and pixel type of every band of the heatmap types, as rasterized by the SQL heatmap aggregation
+HEATMAP_BANDS = {
+    'count': [('cnt', '32BUI')],
+    'delta_cog': [('delta_cog', '32BF'), ('cnt', '32BUI')],
+    'delta_heading': [('delta_heading', '32BF'), ('cnt', '32BUI')],
+    'max_draught': [('max_draught', '32BF')],
+    'time': [('time_sum', '32BUI')],
+}
+HEATMAP_GROUP_COLUMNS = ['partition_id', 'tile_x', 'tile_y', 'infer_stopped', 'date_id', 'entry_hour_of_day',
+                         'ship_type_id']
+
+
+def raster_wkb(bands: List[Tuple[np.ndarray, str]], upper_left_x: float, upper_left_y: float, cell_size: int) -> bytes:
+    """
+    Return the PostGIS raster WKB of north-up bands, using 0 as the nodata value of every band.
+
+    Keyword arguments:
+        bands: the pixels of every band, as rows from north to south, and the pixel type of the band
+        upper_left_x: the x coordinate of the upper left corner of the raster
+        upper_left_y: the y coordinate of the upper left corner of the raster
+        cell_size: the size of the pixels in the units of the SRID
+    """
+    height, width = bands[0][0].shape
+    # Little endian, version 0, followed by the georeference of the raster
+    wkb = [struct.pack('<BHHddddddiHH', 1, 0, len(bands), cell_size, -cell_size, upper_left_x, upper_left_y,
+                       0, 0, HEATMAP_SRID, width, height)]
+    for pixels, pixel_type in bands:
+        pixel_type_id, dtype = PIXEL_TYPES[pixel_type]
+        wkb.append(struct.pack('<B', BAND_HAS_NODATA | pixel_type_id))
+        wkb.append(np.zeros(1, dtype).tobytes())
+        wkb.append(pixels.astype(dtype).tobytes())
+    return b''.join(wkb)
+
+
+def pixel_values(values: np.ndarray, pixel_type: str) -> np.ndarray:
+    """
+    Return the measures converted to the values of a pixel type, where null measures are nodata.
+
+    Integer pixels are rounded to the nearest integer and clamped to the range of the pixel type, as when rasterizing.
+
+    Keyword arguments:
+        values: the measures
+        pixel_type: the PostGIS pixel type
+    """
+    values = np.nan_to_num(values.astype(float), nan=0)
+    dtype = PIXEL_TYPES[pixel_type][1]
+    if np.issubdtype(dtype, np.integer):
+        values = np.clip(np.floor(values + 0.5), np.iinfo(dtype).min, np.iinfo(dtype).max)
+    return values.astype(dtype)
+
+
+def heatmap_rasters(aggregates: pd.DataFrame, cell_size: int) -> pd.DataFrame:
+    """
+    Return the raster WKB of every heatmap type of the heatmaps of aggregated cell measures.
+
+    A heatmap covers the cells of a tile of the largest cell size, with a pixel per cell and one row per date, hour,
+    ship type, stopped inference and partition. Like the union of the rasterized cells, a raster covers the bounding box
+    of the cells with measures, and the pixels of other cells are nodata.
+
+    Keyword arguments:
+        aggregates: the measures of HEATMAP_BANDS, by partition, cell, stopped inference, date, hour and ship type
+        cell_size: the size of the cells in meters
+    """
+    cells = aggregates.assign(tile_x=aggregates['cell_x'] // (HEATMAP_TILE_SIZE // cell_size),
+                              tile_y=aggregates['cell_y'] // (HEATMAP_TILE_SIZE // cell_size))
+    cells = cells.sort_values(HEATMAP_GROUP_COLUMNS, ignore_index=True, kind='stable')
+    heatmaps = cells.groupby(HEATMAP_GROUP_COLUMNS, sort=False)
+    heatmap_sizes = heatmaps.size()
+    sizes = heatmap_sizes.to_numpy()
+    min_x, max_x = heatmaps['cell_x'].min().to_numpy(), heatmaps['cell_x'].max().to_numpy()
+    min_y, max_y = heatmaps['cell_y'].min().to_numpy(), heatmaps['cell_y'].max().to_numpy()
+    widths, heights = max_x - min_x + 1, max_y - min_y + 1
+    # Position of every cell in the pixels of its heatmap, rows are north-up
+    positions = (np.repeat(max_y, sizes) - cells['cell_y'].to_numpy()) * np.repeat(widths, sizes) \
+        + cells['cell_x'].to_numpy() - np.repeat(min_x, sizes)
+    values = {(measure, pixel_type): pixel_values(cells[measure].to_numpy(), pixel_type)
+              for bands in HEATMAP_BANDS.values() for measure, pixel_type in bands}
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+
+    rows = []
+    for heatmap, key in enumerate(heatmap_sizes.index):
+        cell_slice = slice(starts[heatmap], starts[heatmap + 1])
+        shape = (heights[heatmap], widths[heatmap])
+        upper_left = (min_x[heatmap] * cell_size, (max_y[heatmap] + 1) * cell_size)
+        for slug, bands in HEATMAP_BANDS.items():
+            band_pixels = [(_scatter(values[band][cell_slice], positions[cell_slice], shape), band[1])
+                           for band in bands]
+            rows.append((*key, slug, raster_wkb(band_pixels, *upper_left, cell_size).hex()))
+    return pd.DataFrame(rows, columns=[*HEATMAP_GROUP_COLUMNS, 'slug', 'rast'])
+
+
+def _scatter(values: np.ndarray, positions: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Return pixels of the given shape with the values at the positions, and nodata everywhere else.
+
+    Keyword arguments:
+        values: the values of the pixels
+        positions: the positions of the values in the flattened pixels
+        shape: the height and width of the pixels
+    """
+    pixels = np.zeros(shape[0] * shape[1], values.dtype)
+    pixels[positions] = values
+    return pixels.reshape(shape)
+
+
+def read_heatmap_aggregates(conn: Connection, date_key: int, to_date_key: int, cell_size: int) -> pd.DataFrame:
+    """
+    Return the heatmap measures of the cell facts of dates, grouped like the heatmap aggregation query.
+
+    The measures are grouped by partition, cell, stopped inference, date, entry hour and ship type.
+
+    Keyword arguments:
+        conn: the database connection
+        date_key: the DW smart key of the first date
+        to_date_key: the DW smart key of the last date, inclusive
+        cell_size: the size of the cells in meters
+    """
+    query = f"""
+        SELECT
+            fc.partition_id, fc.cell_x, fc.cell_y, fc.infer_stopped, fc.entry_date_id date_id, dt.entry_hour_of_day,
+            ds.ship_type_id,
+            COUNT(*) cnt,
+            SUM(fc.delta_cog) delta_cog,
+            SUM(fc.delta_heading) delta_heading,
+            MAX(fc.draught) max_draught,
+            EXTRACT(EPOCH FROM SUM(duration(st_bounding_box::tstzspan))) time_sum
+        FROM fact_cell_{cell_size}m fc
+        INNER JOIN dim_cell_entry_time dt ON dt.entry_time_id = fc.entry_time_id
+        INNER JOIN dim_ship ds ON ds.ship_id = fc.ship_id
+        INNER JOIN dim_cell_{cell_size}m dc
+            ON dc.x = fc.cell_x AND dc.y = fc.cell_y AND dc.partition_id = fc.partition_id
+        WHERE fc.entry_date_id BETWEEN %(date_key)s AND %(to_date_key)s
+        GROUP BY fc.partition_id, fc.cell_x, fc.cell_y, fc.infer_stopped, fc.entry_date_id, dt.entry_hour_of_day,
+            ds.ship_type_id
+    """
+    return pd.read_sql_query(query, conn, params={'date_key': date_key, 'to_date_key': to_date_key})
+
+
+def copy_heatmaps(conn: Connection, date_key: int, to_date_key: int, cell_size: int, temporal_resolution: int) -> int:
+    """
+    Build the heatmaps of every heatmap type for dates and a cell size, and copy them into fact_cell_heatmap.
+
+    Returns the number of heatmap rows.
+
+    Keyword arguments:
+        conn: the database connection
+        date_key: the DW smart key of the first date
+        to_date_key: the DW smart key of the last date, inclusive
+        cell_size: the size of the cells in meters
+        temporal_resolution: the temporal duration in seconds the heatmaps span
+    """
+    heatmap_types: Dict[str, int] = dict(conn.execute(text('SELECT slug, heatmap_type_id FROM dim_heatmap_type')).all())
+    rasters = heatmap_rasters(read_heatmap_aggregates(conn, date_key, to_date_key, cell_size), cell_size)
+    rows = pd.DataFrame({
+        'cell_x': rasters['tile_x'],
+        'cell_y': rasters['tile_y'],
+        'date_id': rasters['date_id'],
+        'time_id': rasters['entry_hour_of_day'] * 10000,
+        'ship_type_id': rasters['ship_type_id'],
+        'rast': rasters['rast'],
+        'heatmap_type_id': rasters['slug'].map(heatmap_types),
+        'spatial_resolution': cell_size,
+        'temporal_resolution_sec': temporal_resolution,
+        'infer_stopped': rasters['infer_stopped'],
+        'partition_id': rasters['partition_id'],
+    })
+    BulkInserter._copy(rows, conn, 'fact_cell_heatmap')
+    return len(rows)
@@ -0,0 +1,105 @@
+"""Module assigning the split trajectory pieces to their spatial partition client-side."""
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+from sqlalchemy import Connection, text
+
+from etl.insert.bulk_inserter import BulkInserter
+
+SPLIT_PARTITION_ENGINE_SQL = 'sql'
+SPLIT_PARTITION_ENGINE_LOOKUP = 'lookup'
+BOUND_COLUMNS = ['xmin', 'ymin', 'xmax', 'ymax']
+
+
+class SpatialPartitionLookup:
+    """
+    Class looking up the spatial partitions covering bounding boxes, using an STRtree over the partition rectangles.
+
+    A box is in a partition if the rectangle of the partition covers the box, unless the box lies on the north or east
+    edge of the rectangle, like the join of the split trajectories on spatial_partition.
+
+    Methods
+    -------
+    assign(bounds): return the position of every box and the id of the partition of the box
+    """
+
+    def __init__(self, partitions: pd.DataFrame):
+        """
+        Construct an instance of the SpatialPartitionLookup class.
+
+        Keyword arguments:
+            partitions: the partition_id and the bounds of the rectangle of every spatial partition
+        """
+        self.partition_ids = partitions['partition_id'].to_numpy()
+        self.bounds = partitions[BOUND_COLUMNS].to_numpy(dtype=float)
+        self.tree = shapely.STRtree(shapely.box(*self.bounds.T))
+
+    def assign(self, bounds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the position of every box in a partition, and the id of that partition.
+
+        A box is returned once per partition it is in, so boxes outside of all partitions are left out.
+
+        Keyword arguments:
+            bounds: the xmin, ymin, xmax and ymax of every box
+        """
+        # The tree returns the partitions whose rectangle intersects the box, which are then filtered exactly
+        boxes, candidates = self.tree.query(shapely.box(*bounds.T))
+        box_bounds, partition_bounds = bounds[boxes], self.bounds[candidates]
+        covered = np.all(partition_bounds[:, :2] <= box_bounds[:, :2], axis=1) & \
+            np.all(box_bounds[:, 2:] <= partition_bounds[:, 2:], axis=1)
+        off_edges = np.all(partition_bounds[:, 2:] != box_bounds[:, :2], axis=1)
+        matches = covered & off_edges
+        return boxes[matches], self.partition_ids[candidates[matches]]
+
+
+# The spatial partitions are loaded once per process, as they do not change after initialization
+_spatial_partition_lookup: SpatialPartitionLookup | None = None
+
+
+def get_spatial_partition_lookup(conn: Connection) -> SpatialPartitionLookup:
+    """
+    Return the lookup of the spatial partitions, loading them on first use.
+
+    Keyword arguments:
+        conn: the database connection
+    """
+    global _spatial_partition_lookup
+    if _spatial_partition_lookup is None:
+        query = """
+            SELECT partition_id, ST_XMin(geom) xmin, ST_YMin(geom) ymin, ST_XMax(geom) xmax, ST_YMax(geom) ymax
+            FROM spatial_partition
+        """
+        _spatial_partition_lookup = SpatialPartitionLookup(pd.read_sql_query(query, conn))
+    return _spatial_partition_lookup
+
+
+def assign_partitions(pieces: pd.DataFrame, lookup: SpatialPartitionLookup) -> pd.DataFrame:
+    """
+    Return the pieces tagged with the partition_id of their partition, without their bounds.
+
+    Keyword arguments:
+        pieces: the split trajectory pieces, with the bounds of their trajectory
+        lookup: the lookup of the spatial partitions
+    """
+    positions, partition_ids = lookup.assign(pieces[BOUND_COLUMNS].to_numpy(dtype=float))
+    tagged = pieces.drop(columns=BOUND_COLUMNS).iloc[positions].reset_index(drop=True)
+    return tagged.assign(partition_id=partition_ids)
+
+
+def copy_split_trajectories(conn: Connection, query: str, params: dict, split_trajectories_table: str) -> int:
+    """
+    Split the trajectories in the database, assign the pieces to partitions and copy them, returning the pieces copied.
+
+    Keyword arguments:
+        conn: the database connection
+        query: the query selecting the split trajectory pieces and the bounds of their trajectory
+        params: the parameters of the query
+        split_trajectories_table: the table the tagged pieces are copied into
+    """
+    pieces = pd.read_sql_query(text(query), conn, params=params)
+    tagged = assign_partitions(pieces, get_spatial_partition_lookup(conn))
+    BulkInserter._copy(tagged, conn, split_trajectories_table)
+    return len(tagged)
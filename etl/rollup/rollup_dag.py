@@ -0,0 +1,172 @@
+"""Module running rollup steps concurrently over a pool of connections, as soon as the steps they depend on are done."""
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from queue import Queue
+from typing import Callable, Dict, List, Set, Tuple
+
+from sqlalchemy import Connection
+
+from etl.audit.logger import global_audit_logger as gal, TIMINGS_KEY, ROLLUP_CRITICAL_PATH_KEY
+from etl.helper_functions import get_connection, measure_time, wrap_with_timings
+
+# Rollup executor modes, see the rollup_executor configuration
+ROLLUP_EXECUTOR_SEQUENTIAL = 'sequential'
+ROLLUP_EXECUTOR_DAG = 'dag'
+DEFAULT_ROLLUP_EXECUTOR_CONNECTIONS = 4
+
+
+@dataclass
+class RollupStep:
+    """
+    A rollup step, run on a connection once the steps it depends on are committed.
+
+    Attributes:
+        name: the unique name of the step, its timing is logged as rollup_step_{name}
+        run: function running the step on a connection, the step is committed afterwards
+        dependencies: the names of the steps that must be committed before the step is run
+    """
+
+    name: str
+    run: Callable[[Connection], None]
+    dependencies: List[str] = field(default_factory=list)
+
+
+def topological_order(steps: List[RollupStep]) -> List[RollupStep]:
+    """
+    Return the steps ordered such that every step comes after the steps it depends on.
+
+    Steps without an order between them keep their given order.
+    Raises a ValueError if a step depends on an unknown step, or if the dependencies are cyclic.
+
+    Keyword arguments:
+        steps: the rollup steps
+    """
+    steps_by_name = {step.name: step for step in steps}
+    for step in steps:
+        unknown = set(step.dependencies) - steps_by_name.keys()
+        if unknown:
+            raise ValueError(f'Rollup step {step.name} depends on unknown steps {sorted(unknown)}')
+
+    ordered: List[RollupStep] = []
+    done: Set[str] = set()
+    while len(ordered) < len(steps):
+        ready = [step for step in steps if step.name not in done and done.issuperset(step.dependencies)]
+        if not ready:
+            raise ValueError(f'Rollup steps {sorted(steps_by_name.keys() - done)} have cyclic dependencies')
+        ordered.extend(ready)
+        done.update(step.name for step in ready)
+    return ordered
+
+
+def critical_path(steps: List[RollupStep], durations: Dict[str, float]) -> Tuple[List[str], float]:
+    """
+    Return the chain of dependent steps taking the longest, and the seconds it takes.
+
+    The critical path bounds the duration of the rollups, however many connections the steps are run on.
+
+    Keyword arguments:
+        steps: the rollup steps
+        durations: the seconds every step took
+    """
+    finished: Dict[str, float] = {}
+    previous: Dict[str, str | None] = {}
+    for step in topological_order(steps):
+        previous[step.name] = max(step.dependencies, key=finished.get, default=None)
+        finished[step.name] = durations[step.name] + finished.get(previous[step.name], 0)
+
+    path = []
+    last = max(finished, key=finished.get, default=None)
+    seconds = finished.get(last, 0)
+    while last is not None:
+        path.append(last)
+        last = previous[last]
+    return path[::-1], seconds
+
+
+def run_rollup_dag(steps: List[RollupStep], config) -> None:
+    """
+    Run the rollup steps over a pool of connections, starting every step once the steps it depends on are committed.
+
+    Every step is run and committed in its own transaction, so steps run on separate connections only see the
+    committed work of the steps they depend on. No more steps are started once a step fails, and steps already
+    committed are not rolled back. The timing of every step and the critical path are logged in the GAL.
+
+    Keyword arguments:
+        steps: the rollup steps
+        config: the application configuration
+    """
+    topological_order(steps)
+    connection_count = int(config['Database'].get('rollup_executor_connections', DEFAULT_ROLLUP_EXECUTOR_CONNECTIONS))
+    connections = Queue()
+    for _ in range(connection_count):
+        connections.put(get_connection(config))
+
+    durations: Dict[str, float] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=connection_count) as executor:
+            _run_steps(steps, executor, connections, durations)
+    finally:
+        while not connections.empty():
+            connections.get().close()
+
+    _log_critical_path(steps, durations)
+
+
+def _run_steps(steps: List[RollupStep], executor: ThreadPoolExecutor, connections: Queue,
+               durations: Dict[str, float]) -> None:
+    """
+    Submit every step once the steps it depends on are done, until all steps are done or a step fails.
+
+    Keyword arguments:
+        steps: the rollup steps, which must not have cyclic dependencies
+        executor: the executor running the steps, with a thread per connection
+        connections: the pool of connections
+        durations: the seconds every done step took, which the steps are added to when done
+    """
+    waiting = list(steps)
+    running: Dict[Future, str] = {}
+    while waiting or running:
+        ready = [step for step in waiting if durations.keys() >= set(step.dependencies)]
+        for step in ready:
+            waiting.remove(step)
+            running[executor.submit(_run_step, step, connections)] = step.name
+
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            # Re-raise the exception of a failed step, the executor then waits for the running steps
+            durations[running.pop(future)] = future.result()
+
+
+def _run_step(step: RollupStep, connections: Queue) -> float:
+    """
+    Run and commit a step using a connection from the pool, returning the seconds it took.
+
+    Keyword arguments:
+        step: the rollup step
+        connections: the pool of connections
+    """
+    conn = connections.get()
+    try:
+        _, seconds_elapsed = measure_time(lambda: wrap_with_timings(f'Rollup step {step.name}', lambda: step.run(conn)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        connections.put(conn)
+
+    gal[TIMINGS_KEY][f'rollup_step_{step.name}'] = seconds_elapsed
+    return seconds_elapsed
+
+
+def _log_critical_path(steps: List[RollupStep], durations: Dict[str, float]) -> None:
+    """
+    Print the critical path of the rollup steps and log it in the GAL.
+
+    Keyword arguments:
+        steps: the rollup steps
+        durations: the seconds every step took
+    """
+    path, seconds = critical_path(steps, durations)
+    print(f'Rollup critical path of {seconds:.2f} seconds: {" -> ".join(path)}')
+    gal[ROLLUP_CRITICAL_PATH_KEY] = {'steps': path, 'seconds': seconds}
@@ -0,0 +1,49 @@
+"""Split the trajectories of every rolled up date range into a staging partition of its own."""
+from sqlalchemy import Connection, text
+
+from etl.insert.day_partitions import day_partition_name
+
+SPLIT_TRAJECTORIES_TABLE = 'staging.split_trajectories'
+
+
+def split_partition_name(date_id: int) -> str:
+    """
+    Return the name of the partition of the split trajectories of the date range starting at the given date.
+
+    Keyword arguments:
+        date_id: the smart date id of the first date of the range
+    """
+    return day_partition_name(SPLIT_TRAJECTORIES_TABLE, date_id)
+
+
+def prepare_split_partition(conn: Connection, date_id: int, to_date_id: int) -> None:
+    """
+    Create the empty partition of the split trajectories of a date range, and commit it.
+
+    The partition left behind by an interrupted rollup of the range is dropped. The partitions of the date ranges
+    rolled up concurrently must not overlap, as creating an overlapping partition fails.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the first date of the range
+        to_date_id: the smart date id of the last date of the range, inclusive
+    """
+    partition = split_partition_name(date_id)
+    conn.execute(text(f"DROP TABLE IF EXISTS {partition}"))
+    conn.execute(text(f"""
+        CREATE TABLE {partition} PARTITION OF {SPLIT_TRAJECTORIES_TABLE}
+        FOR VALUES FROM ({date_id}) TO ({to_date_id + 1})
+    """))
+    conn.commit()
+
+
+def drop_split_partition(conn: Connection, date_id: int) -> None:
+    """
+    Drop the partition of the split trajectories of a date range once its cell facts are rolled up, and commit it.
+
+    Keyword arguments:
+        conn: the database connection
+        date_id: the smart date id of the first date of the range
+    """
+    conn.execute(text(f"DROP TABLE IF EXISTS {split_partition_name(date_id)}"))
+    conn.commit()
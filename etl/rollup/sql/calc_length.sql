@@ -1,5 +1,5 @@
-UPDATE fact_trajectory ft
+UPDATE {FACT_TRAJECTORY_TABLE} ft
 SET length = ROUND(ST_Length(ST_Transform(ST_SetSRID(dt.trajectory::geometry,4326), 3034)))::int
-FROM dim_trajectory dt
+FROM {DIM_TRAJECTORY_TABLE} dt
 WHERE dt.trajectory_sub_id = ft.trajectory_sub_id AND dt.date_id = ft.start_date_id
-    AND ft.start_date_id = :date_smart_key;
\ No newline at end of file
+    AND ft.start_date_id BETWEEN :from_date_smart_key AND :to_date_smart_key;
\ No newline at end of file
@@ -1,4 +1,4 @@
-INSERT INTO fact_cell_{CELL_SIZE}m (
+INSERT INTO {FACT_CELL_TABLE} (
     cell_x, cell_y, ship_id,
     entry_date_id, entry_time_id, exit_date_id, exit_time_id,
     direction_id, nav_status_id, infer_stopped, trajectory_sub_id,
@@ -129,7 +129,7 @@ FROM (
                     fdt.draught draught,
                     fdt.heading heading,
                     fdt.partition_id
-                FROM staging.split_trajectories fdt
+                FROM {SPLIT_TRAJECTORIES_TABLE} fdt
                 JOIN staging.cell_{CELL_SIZE}m dc ON ST_Crosses(dc.geom, fdt.trajectory::geometry) OR ST_Contains(dc.geom, fdt.trajectory::geometry)
             ) cj
         ) cid
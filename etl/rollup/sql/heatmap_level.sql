@@ -0,0 +1,21 @@
+-- Merge the heatmaps of a finer temporal level in a date range into the heatmaps of a coarser level, using the union type of every heatmap type
+INSERT INTO fact_cell_heatmap (cell_x, cell_y, date_id, time_id, ship_type_id, rast, heatmap_type_id, spatial_resolution, temporal_resolution_sec, infer_stopped, partition_id)
+SELECT
+    fch.cell_x,
+    fch.cell_y,
+    {LEVEL_DATE_ID} AS date_id,
+    0 AS time_id,
+    fch.ship_type_id,
+    ST_Union(fch.rast, ht.union_type) AS rast,
+    fch.heatmap_type_id,
+    fch.spatial_resolution,
+    :TEMPORAL_RESOLUTION AS temporal_resolution_sec,
+    fch.infer_stopped,
+    fch.partition_id
+FROM fact_cell_heatmap fch
+INNER JOIN dim_heatmap_type ht ON ht.heatmap_type_id = fch.heatmap_type_id
+WHERE fch.spatial_resolution = :SPATIAL_RESOLUTION
+AND fch.temporal_resolution_sec = :FINER_TEMPORAL_RESOLUTION
+AND fch.date_id BETWEEN :START_DATE_KEY AND :END_DATE_KEY
+GROUP BY {LEVEL_DATE_ID}, fch.partition_id, fch.cell_x, fch.cell_y, fch.infer_stopped, fch.ship_type_id, fch.heatmap_type_id, fch.spatial_resolution, ht.union_type
+;
@@ -1,8 +1,8 @@
 WITH rows AS (
     INSERT INTO dim_cell_{CELL_SIZE}m (x, y, parent_x, parent_y, geom, partition_id)
     SELECT cell_x, cell_y, {PARENT_FORMULA_X}, {PARENT_FORMULA_Y}, st_bounding_box::geometry, partition_id
-    FROM fact_cell_{CELL_SIZE}m
-    WHERE entry_date_id = :date_smart_key
+    FROM {FACT_CELL_TABLE}
+    WHERE entry_date_id BETWEEN :from_date_smart_key AND :to_date_smart_key
     GROUP BY partition_id, cell_x, cell_y, st_bounding_box::geometry
     ON CONFLICT (x, y, partition_id) DO NOTHING
     RETURNING 1
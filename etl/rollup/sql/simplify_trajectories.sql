@@ -1,6 +1,6 @@
-UPDATE dim_trajectory dt
+UPDATE {DIM_TRAJECTORY_TABLE} dt
 SET trajectory = transform(douglasPeuckerSimplify(transform(setSrid(trajectory, 4326), 3034), 10, true), 4326)
-FROM fact_trajectory ft
+FROM {FACT_TRAJECTORY_TABLE} ft
 WHERE ft.trajectory_sub_id = dt.trajectory_sub_id AND
       ft.start_date_id = dt.date_id AND
-    ft.start_date_id = :date_smart_key;
\ No newline at end of file
+    ft.start_date_id BETWEEN :from_date_smart_key AND :to_date_smart_key;
\ No newline at end of file
@@ -0,0 +1,42 @@
+-- The split trajectory pieces, with the bounds of their trajectory to assign them to a spatial partition client-side
+SELECT
+    t2.trajectory_sub_id,
+    t2.ship_id,
+    t2.nav_status_id,
+    t2.infer_stopped,
+    t2.point,
+    t2.trajectory,
+    t2.heading,
+    t2.draught,
+    t2.date_id,
+    ST_XMin(t2.trajectory::geometry) xmin,
+    ST_YMin(t2.trajectory::geometry) ymin,
+    ST_XMax(t2.trajectory::geometry) xmax,
+    ST_YMax(t2.trajectory::geometry) ymax
+FROM (
+    SELECT
+        t.trajectory_sub_id,
+        t.ship_id,
+        t.nav_status_id,
+        t.infer_stopped,
+        (t.split).point point,
+        -- This forces lower and upper bound inclusiveness in the trajectory segments created by spaceSplit and sets linear interpolation between the points (lower, upper, linear)
+        tgeompoint_seq(INSTANTS(ROUND(UNNEST(sequences((t.split).tpoint)), 3)), 'linear', true, true) AS trajectory, -- round to 1 milimeter, to avoid floating point errors
+        t.heading,
+        t.draught,
+        t.date_id
+    FROM (
+        SELECT
+            ft.trajectory_sub_id,
+            ft.ship_id,
+            ft.nav_status_id,
+            ft.infer_stopped,
+            spaceSplit(transform(dt.trajectory, 3034), 5000) split,
+            dt.heading heading,
+            dt.draught draught,
+            ft.start_date_id date_id
+        FROM {FACT_TRAJECTORY_TABLE} ft
+        JOIN {DIM_TRAJECTORY_TABLE} dt ON ft.trajectory_sub_id = dt.trajectory_sub_id AND ft.start_date_id = dt.date_id
+        WHERE ft.start_date_id BETWEEN :from_date_smart_key AND :to_date_smart_key
+    ) t
+) t2
@@ -1,9 +1,17 @@
-TRUNCATE staging.split_trajectories;
-
-INSERT INTO staging.split_trajectories
+INSERT INTO {SPLIT_TRAJECTORIES_TABLE} (
+    trajectory_sub_id, ship_id, nav_status_id, infer_stopped, point, trajectory, heading, draught, partition_id, date_id
+)
 SELECT
-    t2.*,
-    sp.partition_id
+    t2.trajectory_sub_id,
+    t2.ship_id,
+    t2.nav_status_id,
+    t2.infer_stopped,
+    t2.point,
+    t2.trajectory,
+    t2.heading,
+    t2.draught,
+    sp.partition_id,
+    t2.date_id
 FROM (
     SELECT
         t.trajectory_sub_id,
@@ -14,7 +22,8 @@ FROM (
         -- This forces lower and upper bound inclusiveness in the trajectory segments created by spaceSplit and sets linear interpolation between the points (lower, upper, linear)
         tgeompoint_seq(INSTANTS(ROUND(UNNEST(sequences((t.split).tpoint)), 3)), 'linear', true, true) AS trajectory, -- round to 1 milimeter, to avoid floating point errors
         t.heading,
-        t.draught
+        t.draught,
+        t.date_id
     FROM (
         SELECT
             ft.trajectory_sub_id,
@@ -23,10 +32,11 @@ FROM (
             ft.infer_stopped,
             spaceSplit(transform(dt.trajectory, 3034), 5000) split,
             dt.heading heading,
-            dt.draught draught
-        FROM fact_trajectory ft
-        JOIN dim_trajectory dt ON ft.trajectory_sub_id = dt.trajectory_sub_id AND ft.start_date_id = dt.date_id
-        WHERE ft.start_date_id = :date_smart_key
+            dt.draught draught,
+            ft.start_date_id date_id
+        FROM {FACT_TRAJECTORY_TABLE} ft
+        JOIN {DIM_TRAJECTORY_TABLE} dt ON ft.trajectory_sub_id = dt.trajectory_sub_id AND ft.start_date_id = dt.date_id
+        WHERE ft.start_date_id BETWEEN :from_date_smart_key AND :to_date_smart_key
     ) t
 ) t2
 INNER JOIN spatial_partition sp ON
@@ -1,23 +1,38 @@
 """The main module."""
+import os
 import sys
 import argparse
+import multiprocessing as mp
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Generator, Tuple
+from functools import partial
+from typing import Generator, Iterable, Tuple, List
 from dotenv import load_dotenv
 load_dotenv()
 
-from etl.gatherer.file_downloader import ensure_file_for_date
+from etl.gatherer.file_downloader import ensure_file_for_date, ensure_files_for_dates
+from etl.gatherer.file_index import get_local_file_index
 from etl.helper_functions import wrap_with_timings, get_config, extract_date_from_smart_date_id
 from etl.init_database import init_database
 from etl.cleaning.clean_data import clean_data
 from etl.insert.insert_trajectories import TrajectoryInserter
 from etl.insert.insert_audit import AuditInserter
+from etl.insert.dimension_key_cache import persist_dimension_key_caches
+from etl.insert.load_state import ensure_load_state_table, finish_load, load_state_tracking_enabled
+from etl.insert.ensure_partitions import ensure_partitions_for_date_range
+from etl.insert.day_partitions import day_partition_loading_enabled
+from etl.insert.partition_lifecycle import convert_closed_month
 from etl.rollup.apply_rollups import apply_rollups
+from etl.pipeline import pipelined_range, batch_days
 from etl.trajectory.builder import build_from_geopandas
-from etl.audit.logger import global_audit_logger as gal, ROWS_KEY
+from etl.audit.logger import global_audit_logger as gal, ROWS_KEY, ROLLED_UP_DATES_KEY
 from etl.constants import ETL_STAGE_CLEAN, ETL_STAGE_TRAJECTORY, ETL_STAGE_BULK, ETL_STAGE_CELL, T_START_DATE_COL
 
+# Number of days after the day being loaded that are downloaded and cleaned ahead when pipelining
+PIPELINE_DOWNLOAD_AHEAD_DAYS = 2
+PIPELINE_CLEAN_AHEAD_DAYS = 1
+
 
 def configure_arguments():
     """Configure the program argument parser."""
@@ -32,6 +47,16 @@ def configure_arguments():
                         help='The date to load from, in the format YYYY-MM-DD, for example 2022-12-31', type=str)
     parser.add_argument('--to_date',
                         help='The date to load to, in the format YYYY-MM-DD, for example 2022-12-31', type=str)
+    parser.add_argument('--pipelined',
+                        help='Download and clean the next days in the background while the current day is loaded',
+                        action='store_true')
+    parser.add_argument('--reload',
+                        help='Replace already loaded dates, or dates left partially loaded by a failed load',
+                        action='store_true')
+    parser.add_argument('--rollup_batch_days',
+                        help='Insert the given number of days before rolling them up together, when backfilling. '
+                             'Not supported with day_partition_loading',
+                        type=int, default=1)
 
     return parser.parse_args()
 
@@ -48,10 +73,23 @@ def main(argv):  # noqa: C901
     if args.init:
         wrap_with_timings("Database init", lambda: init_database(config))
 
+    if args.rollup_batch_days > 1 and day_partition_loading_enabled(config):
+        raise ValueError('Rolling up several days together is not supported with day_partition_loading')
+
+    track_load_state = load_state_tracking_enabled(config, args.rollup_batch_days)
+    if args.load:
+        # Validate the range before the partitions of its months are created
+        _validate_range(date_from, date_to)
+        wrap_with_timings('Ensuring partitions for range',
+                          lambda: ensure_partitions_for_date_range(date_from, date_to, config))
+        if track_load_state:
+            wrap_with_timings('Ensuring load state table', lambda: ensure_load_state_table(config))
+
     if args.clean_standalone or args.load:
-        ais_gen = clean_range(date_from, date_to, config, args.clean_standalone)
-        for _, ais_data in ais_gen:
-            load_data(ais_data, config) if args.load else None
+        range_runner = pipelined_clean_range if args.pipelined else clean_range
+        ais_gen = range_runner(date_from, date_to, config, args.clean_standalone)
+        for batch in batch_days(with_audit_logs(ais_gen), args.rollup_batch_days):
+            load_data([day for _, day in batch], config, args.reload, track_load_state) if args.load else None
 
     if args.ensure_files:
         ensure_files_for_range(date_from, date_to, config)
@@ -69,13 +107,7 @@ def clean_range(date_from: datetime, date_to: datetime, config, standalone: bool
         date_to: the date to end at
         standalone: whether standalone cleaning is run (default: False)
     """
-    # ensure date_from and date_to is set
-    if not date_from or not date_to:
-        raise ValueError('Please provide both "from_date" and "to_date" when loading data')
-
-    # ensure date_from is before or equal to date_to
-    if date_from > date_to:
-        raise ValueError('"from_date" must be before or equal to "to_date"')
+    _validate_range(date_from, date_to)
 
     # loop through all dates and clean them
     while date_from <= date_to:
@@ -86,6 +118,82 @@ def clean_range(date_from: datetime, date_to: datetime, config, standalone: bool
         date_from += timedelta(days=1)
 
 
+def pipelined_clean_range(date_from: datetime, date_to: datetime, config, standalone: bool = False) -> \
+        Generator[Tuple[datetime, pd.DataFrame], None, None]:
+    """
+    Load data for all dates in the given range, preparing the next dates in the background.
+
+    While a date is yielded and loaded, the files for the next dates are downloaded and extracted in a background
+    thread, and the next date is cleaned and its trajectories constructed in a background process as soon as its file
+    is downloaded. The number of dates prepared ahead is bounded, so at most two cleaned dates are kept in memory.
+
+    Date from must be before or equal to date to.
+
+    Arguments:
+        date_from: the date to start from
+        date_to: the date to end at
+        config: the application configuration
+        standalone: whether standalone cleaning is run (default: False)
+    """
+    _validate_range(date_from, date_to)
+    dates = [date_from + timedelta(days=day) for day in range((date_to - date_from).days + 1)]
+
+    clean = partial(_clean_file_in_background, config=config, standalone=standalone)
+    index = get_local_file_index(config)
+
+    with ThreadPoolExecutor(max_workers=1) as download_pool, \
+            ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as clean_pool:
+        cleaned = pipelined_range(dates, partial(ensure_file_for_date, config=config), clean, download_pool,
+                                  clean_pool, PIPELINE_DOWNLOAD_AHEAD_DAYS, PIPELINE_CLEAN_AHEAD_DAYS)
+        while True:
+            date_cleaned = wrap_with_timings('Waiting for cleaned data', lambda: next(cleaned, None))
+            if date_cleaned is None:
+                return
+            date, (trajectories, audit_log, created_files) = date_cleaned
+            # Continue the audit log of the background process, as the cleaning statistics are logged there.
+            gal.set_logs_dict(audit_log)
+            # The files created by the background process are only in its own file index
+            index.add(*created_files)
+            yield date, trajectories
+
+
+def _clean_file_in_background(date: datetime, file_path: str, config, standalone: bool) \
+        -> Tuple[pd.DataFrame, dict, List[str]]:
+    """
+    Clean a file in a background process, returning the trajectories, the audit log and the files created.
+
+    Arguments:
+        date: the date to clean
+        file_path: the path of the file for the date
+        config: the application configuration
+        standalone: whether standalone cleaning is run
+    """
+    # The process is reused for several dates, so start from an empty audit log.
+    gal.reset_log()
+    index = get_local_file_index(config)
+    existing_files = set(index.names())
+    trajectories = wrap_with_timings(f'Cleaning data for {date}',
+                                     lambda: clean_file(date, file_path, config, standalone))
+    return trajectories, gal.get_logs_dict(), sorted(set(index.names()) - existing_files)
+
+
+def _validate_range(date_from: datetime, date_to: datetime) -> None:
+    """
+    Validate that both dates are given, and that date from is before or equal to date to.
+
+    Arguments:
+        date_from: the date to start from
+        date_to: the date to end at
+    """
+    # ensure date_from and date_to is set
+    if not date_from or not date_to:
+        raise ValueError('Please provide both "from_date" and "to_date" when loading data')
+
+    # ensure date_from is before or equal to date_to
+    if date_from > date_to:
+        raise ValueError('"from_date" must be before or equal to "to_date"')
+
+
 def clean_date(date: datetime, config, standalone: bool = False) -> pd.DataFrame:
     """
     Apply cleaning and trajectory construction.
@@ -100,6 +208,19 @@ def clean_date(date: datetime, config, standalone: bool = False) -> pd.DataFrame
         lambda: ensure_file_for_date(date, config),
     )
 
+    return clean_file(date, file_path, config, standalone)
+
+
+def clean_file(date: datetime, file_path: str, config, standalone: bool = False) -> pd.DataFrame:
+    """
+    Apply cleaning and trajectory construction to an already ensured file.
+
+    Arguments:
+        date: the date to clean
+        file_path: the path of the csv or pickle file for the date
+        config: the application configuration
+        standalone: whether standalone cleaning is run (Default: False)
+    """
     gal.log_file(file_path)  # logs the name, rows and size of the file
 
     if file_path.endswith('.pkl'):
@@ -116,49 +237,107 @@ def clean_date(date: datetime, config, standalone: bool = False) -> pd.DataFrame
     if standalone:
         pickle_path = file_path.replace('.csv', '.pkl')
         wrap_with_timings('Pickle Creation', lambda: trajectories.to_pickle(pickle_path))
+        get_local_file_index(config).add(os.path.basename(pickle_path))
 
     return trajectories
 
 
-def load_data(data: pd.DataFrame, config) -> None:
+def load_data(days: List[Tuple[pd.DataFrame, dict]], config, reload: bool = False,
+              track_load_state: bool = False) -> None:
     """
-    Insert and rollup the data into the DW.
+    Insert the data of consecutive days into the DW, and rollup the days together.
+
+    Every day is inserted and committed on its own, and logged in its own audit row. The days are rolled up once over
+    the whole date window, which is logged in the audit row of the last day with the dates rolled up. If the rollup
+    fails, the committed days are left as inserting in load_state, so they are rejected until loaded with reload.
 
     Arguments:
-        data: the dataframe containing the data
+        days: the dataframe containing the data of every day, and the audit log of its cleaning
         config: the application config
+        reload: whether an already loaded date is replaced (default: False)
+        track_load_state: whether the load state of the days is recorded in load_state (default: False)
     """
-    if data.empty:
+    days = [(data, audit_log) for data, audit_log in days if not data.empty]
+    if not days:
         print('No data to load')
         return
-    # Extract the date to rollup from the dataframe
-    smart_date_key = data[T_START_DATE_COL].iat[0]
-    date = extract_date_from_smart_date_id(smart_date_key)
-    gal.log_loaded_date(smart_date_key)
-    conn = wrap_with_timings("Inserting trajectories",
-                             lambda: TrajectoryInserter("fact_trajectory").persist(data, config),
-                             audit_etl_stage=ETL_STAGE_BULK)
-    wrap_with_timings("Applying rollups", lambda: apply_rollups(conn, date),
+    date_ids = [int(data[T_START_DATE_COL].iat[0]) for data, _ in days]
+    conn = _insert_days(days, config, reload, track_load_state)
+
+    gal[ROLLED_UP_DATES_KEY] = date_ids
+    dates = [extract_date_from_smart_date_id(date_id) for date_id in date_ids]
+    wrap_with_timings("Applying rollups", lambda: apply_rollups(conn, dates[0], dates[-1]),
                       audit_etl_stage=ETL_STAGE_CELL)
+    if track_load_state:
+        finish_load(conn, date_ids)
+    conn.commit()
+    for date in dates:
+        wrap_with_timings("Converting closed month", lambda: convert_closed_month(conn, date, config))
 
-    wrap_with_timings("Inserting audit", lambda: AuditInserter("audit_log").insert_audit(conn))
+    for _, audit_log in days:
+        gal.set_logs_dict(audit_log)
+        wrap_with_timings("Inserting audit", lambda: AuditInserter("audit_log").insert_audit(conn))
     gal.reset_log()  # reset the log for the next loop
 
     conn.commit()
+    # Only persist the dimension keys once the rows they refer to are committed
+    persist_dimension_key_caches()
+
+
+def _insert_days(days: List[Tuple[pd.DataFrame, dict]], config, reload: bool, track_load_state: bool):
+    """
+    Insert the trajectories of every day, logged in the audit log of the day, and return the connection of the last day.
+
+    The days before the last day are committed, while the last day is left uncommitted for its rollups.
+
+    Arguments:
+        days: the dataframe containing the data of every day, and the audit log of its cleaning
+        config: the application config
+        reload: whether an already loaded date is replaced
+        track_load_state: whether the load state of the days is recorded in load_state
+    """
+    conn = None
+    for data, audit_log in days:
+        if conn is not None:
+            conn.commit()
+            conn.close()
+        gal.set_logs_dict(audit_log)
+        gal.log_loaded_date(data[T_START_DATE_COL].iat[0])
+        inserter = TrajectoryInserter("fact_trajectory")
+        conn = wrap_with_timings("Inserting trajectories",
+                                 lambda: inserter.persist(data, config, reload, track_load_state),
+                                 audit_etl_stage=ETL_STAGE_BULK)
+    return conn
+
+
+def with_audit_logs(days: Iterable[Tuple[datetime, pd.DataFrame]]) \
+        -> Generator[Tuple[datetime, Tuple[pd.DataFrame, dict]], None, None]:
+    """
+    Pair every cleaned day with the audit log of its cleaning, starting a new audit log for the next day.
+
+    Arguments:
+        days: the cleaned days and their data, cleaned while logging to the global audit log
+    """
+    for date, data in days:
+        audit_log = gal.get_logs_dict()
+        gal.reset_log()
+        yield date, (data, audit_log)
 
 
 def ensure_files_for_range(date_from: datetime, date_to: datetime, config):
     """
     Ensure files are downloaded and unzipped for a given date range.
 
+    Missing archives are downloaded concurrently, see the download_workers configuration.
+
     Keyword arguments:
         date_from: the date to start from
         date_to: the date to end at
         config: the application configuration
     """
-    while date_from <= date_to:
-        wrap_with_timings(f"Ensuring files for date {date_from}", lambda: ensure_file_for_date(date_from, config))
-        date_from += timedelta(days=1)
+    dates = [date_from + timedelta(days=day) for day in range((date_to - date_from).days + 1)]
+    wrap_with_timings(f"Ensuring files for dates {date_from} to {date_to}",
+                      lambda: ensure_files_for_dates(dates, config))
 
 
 if __name__ == '__main__':
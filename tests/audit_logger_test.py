@@ -41,3 +41,28 @@ def test_audit_log_file(file_path):
     assert al._log_dict['file_name'] == file_name
     assert al._log_dict['file_size'] == file_size
     assert al._log_dict[STATS_KEY][ROWS_KEY]['file'] == file_rows
+
+
+test_data_file_rows = [
+    (b'', 0),
+    (b'a,b\n', 1),
+    (b'a,b\n1,2', 2),
+    (b'a,b\r\n1,2\r\n', 2),
+    (b'a,b\n\n1,2\n', 3),
+]
+
+
+@pytest.mark.parametrize('content, expected_rows', test_data_file_rows)
+def test_audit_log_file_rows(tmp_path, content, expected_rows):
+    file_path = tmp_path / 'file.csv'
+    file_path.write_bytes(content)
+
+    assert AuditLogger._get_file_rows(str(file_path)) == expected_rows
+
+
+def test_audit_log_file_rows_spanning_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr('etl.audit.logger.ROW_COUNT_CHUNK_SIZE', 3)
+    file_path = tmp_path / 'file.csv'
+    file_path.write_bytes(b'a,b\n1,2\n3,4')
+
+    assert AuditLogger._get_file_rows(str(file_path)) == 3
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from etl.insert.batch_sizer import AdaptiveBatchSizer, MAX_QUERY_PARAMETERS, MAX_BATCH_BYTES
+
+
+def simulate(sizer: AdaptiveBatchSizer, seconds_for_rows, batches: int = 40) -> None:
+    for _ in range(batches):
+        rows = sizer.next_size()
+        sizer.record(rows, seconds_for_rows(rows))
+
+
+def test_limit_by_parameter_count():
+    sizer = AdaptiveBatchSizer('dim_ship', 100000)
+    sizer.limit(pd.DataFrame({f'col_{i}': [1, 2] for i in range(16)}))
+    assert sizer.next_size() == MAX_QUERY_PARAMETERS // 16
+
+
+def test_limit_by_row_width():
+    sizer = AdaptiveBatchSizer('dim_ship', 100000)
+    sizer.limit(pd.DataFrame({'name': ['x' * 1024 * 1024] * 4}))
+    assert sizer.next_size() < MAX_BATCH_BYTES // (1024 * 1024)
+
+
+class RenderedValue:
+    """Value whose text rendering is much larger than the Python object, like MobilityDB values."""
+
+    renders = 0
+
+    def __str__(self):
+        """Return a rendering of 64 KiB, counting the renderings."""
+        RenderedValue.renders += 1
+        return 'x' * 64 * 1024
+
+
+def test_limit_by_rendered_row_width_once_per_table():
+    sizer = AdaptiveBatchSizer('dim_trajectory', 100000)
+    RenderedValue.renders = 0
+
+    sizer.limit(pd.DataFrame({'trajectory': [RenderedValue() for _ in range(1000)]}))
+    sizer.limit(pd.DataFrame({'trajectory': [RenderedValue() for _ in range(1000)]}))
+
+    assert sizer.next_size() == MAX_BATCH_BYTES // (64 * 1024 + 1)
+    assert RenderedValue.renders == 100
+
+
+def test_grows_while_throughput_improves():
+    sizer = AdaptiveBatchSizer('dim_ship', 10)
+    # Fixed overhead per batch, so larger batches are always faster per row
+    simulate(sizer, lambda rows: 1 + rows * 0.001, batches=20)
+    assert sizer.next_size() == MAX_QUERY_PARAMETERS
+
+
+@pytest.mark.parametrize('initial_size', [10, 5000])
+def test_converges_on_best_size(initial_size):
+    optimum = 800
+
+    def seconds_for_rows(rows):
+        # Fixed overhead per batch, and a per row cost growing once batches exceed the optimum
+        return 1 + rows * 0.001 + max(0, rows - optimum) ** 2 * 0.00001
+
+    sizer = AdaptiveBatchSizer('dim_ship', initial_size)
+    simulate(sizer, seconds_for_rows)
+
+    assert sizer.converged
+    assert optimum / 2 <= sizer.next_size() <= optimum * 2
+    assert sizer.statistics()['batch_size'] == sizer.next_size()
+
+
+def test_partial_batches_are_not_used_for_tuning():
+    sizer = AdaptiveBatchSizer('dim_ship', 100)
+    sizer.record(10, 1)
+    assert sizer.next_size() == 100
+    assert sizer.statistics()['rows_per_second'] is None
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.insert.copy_stream import CopyStream, format_copy_value
+
+test_data_format_copy_value = [
+    (None, '\\N'),
+    (pd.NA, '\\N'),
+    (pd.NaT, '\\N'),
+    (1, '1'),
+    (np.int64(42), '42'),
+    (12.0, '12'),
+    (np.float64(12.5), '12.5'),
+    (True, 'True'),
+    (np.bool_(False), 'False'),
+    ('plain', 'plain'),
+    ('tab\there', 'tab\\there'),
+    ('new\nline\r', 'new\\nline\\r'),
+    ('back\\slash', 'back\\\\slash'),
+    (timedelta(days=1, seconds=3661, microseconds=5), '1 days 3661.000005 seconds'),
+    (pd.Timedelta(minutes=5), '0 days 300.000000 seconds'),
+    (datetime(2022, 1, 2, 3, 4, 5), '2022-01-02 03:04:05'),
+    (['a==1', 'b"c'], '{"a==1","b\\\\"c"}'),
+]
+
+
+@pytest.mark.parametrize('value, expected', test_data_format_copy_value)
+def test_format_copy_value(value, expected):
+    assert format_copy_value(value) == expected
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 1024])
+def test_copy_stream_streams_all_rows(read_size):
+    df = pd.DataFrame({
+        'a': [1, 2, 3],
+        'b': ['x', None, 'z\tz'],
+        'c': [True, False, True],
+    })
+
+    stream = CopyStream(df)
+    result = b''
+    while chunk := stream.read(read_size):
+        result += chunk
+
+    assert result == b'1\tx\tTrue\n2\t\\N\tFalse\n3\tz\\tz\tTrue\n'
+
+
+def test_copy_stream_of_empty_dataframe():
+    assert CopyStream(pd.DataFrame({'a': []})).read(1024) == b''
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.insert.dimensions.date_dimension import build_date_rows, calculate_easter_holidays
+
+day_num_map = pd.DataFrame({
+    'day_num': range(8),
+    'day_name': ['sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'],
+    'weekday': ['weekend', 'weekday', 'weekday', 'weekday', 'weekday', 'weekday', 'weekend', 'weekend'],
+})
+month_num_map = pd.DataFrame({
+    'month_num': range(1, 13),
+    'month_name': ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september',
+                   'october', 'november', 'december'],
+    'season': ['winter', 'winter', 'spring', 'spring', 'spring', 'summer', 'summer', 'summer', 'autumn', 'autumn',
+               'autumn', 'winter'],
+})
+fixed_holidays = pd.DataFrame({'month': [1, 6, 12], 'day': [1, 5, 24]})
+
+
+@pytest.mark.parametrize('year, easter_sunday', [
+    (2021, (4, 4)),
+    (2022, (4, 17)),
+    (2023, (4, 9)),
+    (2024, (3, 31)),
+])
+def test_calculate_easter_sunday(year, easter_sunday):
+    assert calculate_easter_holidays(year)[0] == easter_sunday
+
+
+def test_calculate_easter_holidays_crossing_months():
+    # Easter 2024 is March 31, so Easter Monday is April 1 and Ascension Day is May 9
+    assert calculate_easter_holidays(2024) == [(3, 31), (4, 1), (3, 29), (3, 28), (3, 24), (5, 9)]
+
+
+def test_build_date_rows():
+    rows = build_date_rows(np.array([20221231, 20220101, 20220418]), day_num_map, month_num_map, fixed_holidays)
+
+    assert rows['date_id'].tolist() == [20220101, 20220418, 20221231]
+    assert rows['day_of_week'].tolist() == [6, 1, 6]
+    assert rows['day_name'].tolist() == ['saturday', 'monday', 'saturday']
+    assert rows['weekday'].tolist() == ['weekend', 'weekday', 'weekend']
+    assert rows['day_of_year'].tolist() == [1, 108, 365]
+    assert rows['week_of_year'].tolist() == [52, 16, 52]
+    assert rows['iso_year'].tolist() == [2021, 2022, 2022]
+    assert rows['quarter_of_year'].tolist() == [1, 2, 4]
+    assert rows['season'].tolist() == ['winter', 'spring', 'winter']
+    assert rows['holiday'].tolist() == ['holiday', 'holiday', 'non-holiday']
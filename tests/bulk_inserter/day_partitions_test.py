@@ -0,0 +1,115 @@
+import pytest
+
+import etl.insert.day_partitions as day_partitions
+import etl.insert.ensure_partitions as ensure_partitions
+from etl.insert.day_partitions import DAY_PARTITIONED_TABLES, attach_day_partitions, day_partition_name, \
+    prepare_day_partitions, target_table
+from etl.insert.ensure_partitions import PartitionCatalog, ensure_partitions_for_partitioned_tables
+
+DAY_LOADING_CONFIG = {'Database': {'day_partition_loading': 'true'}}
+
+
+class ScalarsResult:
+    """Result of a query returning a single column."""
+
+    def __init__(self, values):
+        """Construct a result returning the given values."""
+        self.values = values
+
+    def scalars(self):
+        """Return the values of the column."""
+        return self.values
+
+
+class FakeDayConnection:
+    """Connection returning the tables the day partitions are attached to, and recording all other statements."""
+
+    def __init__(self, attached_to):
+        """Construct a connection with the day partitions attached to the given tables."""
+        self.attached_to = attached_to
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, parameters=None):
+        """Return the attached tables for the catalog query, and record any other statement."""
+        if 'pg_inherits' in str(statement):
+            return ScalarsResult(self.attached_to)
+        self.statements.append(' '.join(str(statement).split()))
+
+    def commit(self):
+        """Count the commits."""
+        self.commits += 1
+
+
+def test_day_partition_name():
+    assert day_partition_name('fact_cell_50m', 20220105) == 'fact_cell_50m_2022_01_05'
+
+
+@pytest.mark.parametrize('config, expected', [
+    ({'Database': {}}, 'fact_trajectory'),
+    (DAY_LOADING_CONFIG, 'fact_trajectory_2022_01_05'),
+])
+def test_target_table(monkeypatch, config, expected):
+    monkeypatch.setattr(day_partitions, 'get_config', lambda: config)
+    assert target_table('fact_trajectory', 20220105) == expected
+    assert target_table('fact_cell_heatmap', 20220105) == 'fact_cell_heatmap'
+
+
+def test_prepare_creates_standalone_tables():
+    conn = FakeDayConnection([])
+
+    prepare_day_partitions(conn, 20220105)
+
+    creates = [statement for statement in conn.statements if statement.startswith('CREATE TABLE')]
+    assert len(creates) == len(DAY_PARTITIONED_TABLES)
+    assert creates[0] == 'CREATE TABLE dim_trajectory_2022_01_05 (LIKE dim_trajectory INCLUDING DEFAULTS ' \
+                         'INCLUDING GENERATED, CONSTRAINT dim_trajectory_2022_01_05_day_check ' \
+                         'CHECK (date_id >= 20220105 AND date_id < 20220106))'
+    assert not any(statement.startswith(('ALTER', 'DELETE')) for statement in conn.statements)
+    assert conn.commits == 1
+
+
+def test_prepare_rejects_loaded_day_unless_reloading():
+    with pytest.raises(ValueError):
+        prepare_day_partitions(FakeDayConnection(['dim_trajectory']), 20220105)
+
+
+def test_reload_detaches_and_drops_loaded_day():
+    conn = FakeDayConnection(['dim_trajectory', 'fact_trajectory'])
+
+    prepare_day_partitions(conn, 20220105, reload=True)
+
+    assert conn.statements[:3] == [
+        'ALTER TABLE dim_trajectory DETACH PARTITION dim_trajectory_2022_01_05',
+        'DROP TABLE IF EXISTS dim_trajectory_2022_01_05',
+        conn.statements[2],
+    ]
+    assert 'ALTER TABLE fact_cell_50m DETACH PARTITION fact_cell_50m_2022_01_05' not in conn.statements
+    assert conn.statements[-1] == 'DELETE FROM fact_cell_heatmap WHERE date_id = :date_id'
+
+
+def test_attach_attaches_dimension_before_facts():
+    conn = FakeDayConnection([])
+
+    attach_day_partitions(conn, 20220105)
+
+    attaches = [statement for statement in conn.statements if 'ATTACH PARTITION' in statement]
+    assert attaches[:2] == [
+        'ALTER TABLE dim_trajectory ATTACH PARTITION dim_trajectory_2022_01_05 '
+        'FOR VALUES FROM (20220105) TO (20220106)',
+        'ALTER TABLE fact_trajectory ATTACH PARTITION fact_trajectory_2022_01_05 '
+        'FOR VALUES FROM (20220105) TO (20220106)',
+    ]
+    assert conn.commits == 1
+
+
+def test_monthly_partitioned_month_is_not_day_loaded(monkeypatch):
+    catalog = PartitionCatalog(ensure_partitions.DATE_PARTITIONED_TABLE_NAMES)
+    catalog._partitions = {('fact_trajectory', 'fact_trajectory_2022_01'),
+                           ('fact_cell_heatmap', 'fact_cell_heatmap_2022_01')}
+    monkeypatch.setattr(ensure_partitions, '_partition_catalog', catalog)
+    monkeypatch.setattr(ensure_partitions, 'get_config', lambda: DAY_LOADING_CONFIG)
+
+    with pytest.raises(ValueError, match='fact_trajectory'):
+        ensure_partitions_for_partitioned_tables(FakeDayConnection([]), 20220105)
+    ensure_partitions_for_partitioned_tables(FakeDayConnection([]), 20220205)
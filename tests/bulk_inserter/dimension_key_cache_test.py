@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+import etl.insert.bulk_inserter as bulk_inserter
+from etl.insert.bulk_inserter import BulkInserter, DIMENSION_RESOLUTION_SELECT_INSERT, DIMENSION_RESOLUTION_STAGED
+from etl.insert.dimension_key_cache import DimensionKeyCache, hash_natural_key, KEY_HASH_COL
+
+WARM_QUERY = 'SELECT nav_status_id, nav_status FROM dim_nav_status'
+
+
+def create_warm_cache(cache_folder=None) -> DimensionKeyCache:
+    cache = DimensionKeyCache('dim_nav_status', 'nav_status_id', WARM_QUERY, cache_folder)
+    cache.entries = pd.DataFrame({'nav_status_id': [0, 1], 'nav_status': ['Unknown', 'Moored']})
+    return cache
+
+
+def test_lookup_merges_cached_ids():
+    cache = create_warm_cache()
+
+    result = cache.lookup(pd.DataFrame({'nav_status': ['Moored', 'Anchored']}))
+
+    assert result['nav_status'].tolist() == ['Moored', 'Anchored']
+    assert result['nav_status_id'].iat[0] == 1
+    assert pd.isna(result['nav_status_id'].iat[1])
+
+
+def test_add_makes_entries_available():
+    cache = create_warm_cache()
+
+    cache.add(pd.DataFrame({'nav_status': ['Anchored'], 'nav_status_id': [2]}))
+    result = cache.lookup(pd.DataFrame({'nav_status': ['Anchored']}))
+
+    assert result['nav_status_id'].tolist() == [2]
+
+
+def test_persist_round_trip(tmp_path):
+    cache = create_warm_cache(str(tmp_path / 'cache'))
+    cache.persist()
+
+    restored = DimensionKeyCache('dim_nav_status', 'nav_status_id', WARM_QUERY, str(tmp_path / 'cache'))
+
+    pd.testing.assert_frame_equal(restored._read_persisted(), cache.entries)
+
+
+def test_persist_is_disabled_without_folder(tmp_path):
+    cache = create_warm_cache(None)
+    cache.persist()
+
+    assert cache._read_persisted() is None
+
+
+@pytest.mark.parametrize('resolution, resolver', [
+    (DIMENSION_RESOLUTION_SELECT_INSERT, '_bulk_select_insert'),
+    (DIMENSION_RESOLUTION_STAGED, '_staged_upsert'),
+])
+def test_cached_select_insert_only_resolves_misses(monkeypatch, resolution, resolver):
+    cache = create_warm_cache()
+    monkeypatch.setattr(bulk_inserter, 'get_dimension_key_cache', lambda *args: cache)
+    monkeypatch.setattr(bulk_inserter, 'get_config', lambda: {'Database': {'dimension_resolution': resolution}})
+    resolved = []
+
+    def mock_resolver(entries, conn, *args):
+        resolved.append(entries['nav_status'].tolist())
+        return entries.assign(nav_status_id=range(10, 10 + len(entries)))
+
+    inserter = BulkInserter('dim_nav_status', id_col_name='nav_status_id')
+    monkeypatch.setattr(inserter, resolver, mock_resolver)
+    entries = pd.DataFrame({'nav_status': ['Unknown', 'Anchored', 'Moored']})
+
+    result = inserter._cached_select_insert(entries, None, 'insert', 'select', WARM_QUERY, {'nav_status': 'nav_status'})
+
+    assert resolved == [['Anchored']]
+    assert dict(zip(result['nav_status'], result['nav_status_id'])) == {'Unknown': 0, 'Moored': 1, 'Anchored': 10}
+    # The inserted entry is now cached
+    assert cache.lookup(pd.DataFrame({'nav_status': ['Anchored']}))['nav_status_id'].tolist() == [10]
+
+
+def test_hash_natural_key_does_not_depend_on_dtypes():
+    client = pd.DataFrame({'mmsi': [219000001, 219000002], 'name': ['A', None], 'length': [10, 20]})
+    stored = pd.DataFrame({'mmsi': [219000001.0, 219000002.0], 'name': pd.Series(['A', None], dtype=object),
+                           'length': pd.array([10, 20], dtype='Int64')})
+
+    assert hash_natural_key(client, ['mmsi', 'name', 'length']).tolist() == \
+        hash_natural_key(stored, ['mmsi', 'name', 'length']).tolist()
+    assert hash_natural_key(client, ['mmsi', 'name']).nunique() == 2
+
+
+def test_lookup_on_key_hash():
+    cache = DimensionKeyCache('dim_ship', 'ship_id', 'SELECT ship_id, mmsi, name, mid FROM dim_ship', None,
+                              ['mmsi', 'name'])
+    cache.entries = pd.DataFrame({'ship_id': [1, 2], 'mmsi': [219000001, 219000002], 'name': ['A', None],
+                                  'mid': [219, 219]})
+    cache.entries[KEY_HASH_COL] = hash_natural_key(cache.entries, cache.key_hash_columns)
+
+    entries = pd.DataFrame({'mmsi': [219000002.0, 219000003.0], 'name': [None, 'C'], 'mid': [219, 219]})
+    entries[KEY_HASH_COL] = hash_natural_key(entries, ['mmsi', 'name'])
+    result = cache.lookup(entries)
+
+    assert result['ship_id'].iat[0] == 2
+    assert pd.isna(result['ship_id'].iat[1])
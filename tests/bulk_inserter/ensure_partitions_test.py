@@ -0,0 +1,59 @@
+import pytest
+
+from etl.insert.ensure_partitions import PartitionCatalog, partition_name
+
+
+class FakeCatalogConnection:
+    """Connection returning existing partitions for the catalog query, and recording all other statements."""
+
+    def __init__(self, partitions):
+        """Construct a connection with the given existing (table, partition) pairs."""
+        self.partitions = partitions
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, statement, parameters=None):
+        """Return the partitions for the catalog query, and record any other statement."""
+        if 'pg_inherits' in str(statement):
+            return self.partitions
+        self.statements.append(' '.join(str(statement).split()))
+
+    def commit(self):
+        """Count the commits."""
+        self.commits += 1
+
+
+@pytest.mark.parametrize('date_id, expected', [
+    (20220105, 'fact_trajectory_2022_01'),
+    (20221231, 'fact_trajectory_2022_12'),
+    (20221100, 'fact_trajectory_2022_11'),
+])
+def test_partition_name(date_id, expected):
+    assert partition_name('fact_trajectory', date_id) == expected
+
+
+def test_creates_missing_partitions_for_all_months_in_one_transaction():
+    conn = FakeCatalogConnection([('fact_trajectory', 'fact_trajectory_2022_01')])
+    catalog = PartitionCatalog(['fact_trajectory', 'dim_trajectory'])
+
+    catalog.ensure(conn, [20220101, 20220131, 20220201])
+
+    creates = [statement for statement in conn.statements if statement.startswith('CREATE TABLE')]
+    assert creates == [
+        'CREATE TABLE dim_trajectory_2022_01 PARTITION OF dim_trajectory FOR VALUES FROM (20220100) TO (20220199)',
+        'CREATE TABLE fact_trajectory_2022_02 PARTITION OF fact_trajectory FOR VALUES FROM (20220200) TO (20220299)',
+        'CREATE TABLE dim_trajectory_2022_02 PARTITION OF dim_trajectory FOR VALUES FROM (20220200) TO (20220299)',
+    ]
+    assert conn.commits == 1
+
+
+def test_existing_partitions_are_checked_in_memory():
+    conn = FakeCatalogConnection([])
+    catalog = PartitionCatalog(['fact_trajectory'])
+    catalog.ensure(conn, [20220101])
+    statement_count = len(conn.statements)
+
+    catalog.ensure(conn, [20220115])
+
+    assert len(conn.statements) == statement_count
+    assert conn.commits == 1
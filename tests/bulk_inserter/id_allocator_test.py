@@ -0,0 +1,64 @@
+import numpy as np
+
+from etl.insert.id_allocator import IdAllocator, mix_ids, ID_MASK
+
+
+class FakeSequenceConnection:
+    """Connection returning consecutive sequence values, like nextval."""
+
+    def __init__(self, start: int = 0):
+        """Construct a connection whose sequence starts at start."""
+        self.value = start - 1
+        self.calls = 0
+
+    def execute(self, statement):
+        """Return the next sequence value."""
+        self.value += 1
+        self.calls += 1
+        return self
+
+    def scalar_one(self):
+        """Return the current sequence value."""
+        return self.value
+
+
+def test_mix_ids_is_a_bijection_on_a_dense_range():
+    ids = np.arange(0, 1 << 20)
+    mixed = mix_ids(ids)
+
+    assert len(np.unique(mixed)) == len(ids)
+    assert mixed.min() >= 0
+    assert mixed.max() <= ID_MASK
+
+
+def test_mix_ids_spreads_consecutive_ids():
+    mixed = mix_ids(np.arange(0, 1 << 16))
+    # Consecutive ids should cover the whole range evenly, in 16 equally sized buckets
+    counts = np.bincount(mixed.astype(np.int64) >> 27, minlength=16)
+    assert counts.min() > 0.8 * (1 << 12)
+
+
+def test_allocate_reserves_blocks_only_when_exhausted():
+    conn = FakeSequenceConnection()
+    allocator = IdAllocator('seq', block_size=10)
+
+    first = allocator.allocate(conn, 4)
+    second = allocator.allocate(conn, 4)
+    assert conn.calls == 1
+
+    third = allocator.allocate(conn, 25)
+    assert conn.calls == 4
+    ids = np.concatenate([first, second, third])
+    assert len(np.unique(ids)) == len(ids) == 33
+
+
+def test_concurrent_allocators_do_not_collide():
+    conn = FakeSequenceConnection()
+    allocators = [IdAllocator('seq', block_size=100) for _ in range(3)]
+
+    ids = np.concatenate([allocator.allocate(conn, 150) for allocator in allocators])
+    assert len(np.unique(ids)) == len(ids)
+
+
+def test_allocate_nothing():
+    assert len(IdAllocator('seq').allocate(FakeSequenceConnection(), 0)) == 0
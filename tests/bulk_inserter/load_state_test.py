@@ -0,0 +1,133 @@
+import pytest
+
+import etl.insert.load_state as load_state
+from etl.insert.load_state import LOAD_STATE_INSERTING, LOAD_STATE_LOADED, begin_load, delete_date, finish_load, \
+    load_state_tracking_enabled
+
+
+class ScalarResult:
+    """Result of a query selecting a single value."""
+
+    def __init__(self, value):
+        """Construct a result of the given value."""
+        self.value = value
+
+    def scalar(self):
+        """Return the value."""
+        return self.value
+
+    def scalars(self):
+        """Return the result, whose values are the value."""
+        return self
+
+    def all(self):
+        """Return the value, a list of values."""
+        return self.value
+
+
+class FakeLoadStateConnection:
+    """Connection returning the load state of the date, and recording all other statements."""
+
+    def __init__(self, state, later_date_ids=()):
+        """Construct a connection with the given load state of the date, and later dates of its trajectories."""
+        self.state = state
+        self.later_date_ids = list(later_date_ids)
+        self.statements = []
+        self.queries = []
+
+    def execute(self, statement, parameters=None):
+        """Return the load state or the later dates for their queries, and record any other statement."""
+        self.queries.append(str(statement))
+        if str(statement).startswith('SELECT state'):
+            return ScalarResult(self.state)
+        if 'SELECT DISTINCT' in str(statement):
+            return ScalarResult(self.later_date_ids)
+        self.statements.append((str(statement).split()[0], parameters))
+
+    def commit(self):
+        """Record the commit."""
+        self.statements.append(('COMMIT', None))
+
+
+@pytest.fixture
+def day_partitions(monkeypatch):
+    enabled = {'value': False}
+    monkeypatch.setattr(load_state, 'day_partition_loading_enabled', lambda: enabled['value'])
+    monkeypatch.setattr(load_state, 'get_staging_cell_sizes', lambda: [50, 200])
+    return enabled
+
+
+@pytest.mark.parametrize('state', [None, LOAD_STATE_LOADED])
+def test_date_is_recorded_as_inserting_and_committed(day_partitions, state):
+    conn = FakeLoadStateConnection(state)
+
+    begin_load(conn, 20220105)
+
+    assert conn.statements == [('INSERT', {'date_id': 20220105, 'state': LOAD_STATE_INSERTING}), ('COMMIT', None)]
+
+
+def test_partially_loaded_date_is_rejected(day_partitions):
+    with pytest.raises(ValueError, match='partially loaded'):
+        begin_load(FakeLoadStateConnection(LOAD_STATE_INSERTING), 20220105)
+
+
+@pytest.mark.parametrize('state', [None, LOAD_STATE_INSERTING, LOAD_STATE_LOADED])
+def test_reloaded_date_is_deleted(day_partitions, state):
+    conn = FakeLoadStateConnection(state)
+
+    begin_load(conn, 20220105, reload=True)
+
+    assert [statement for statement, _ in conn.statements] == ['DELETE'] * 5 + ['INSERT', 'COMMIT']
+
+
+def test_reloaded_date_is_not_deleted_with_day_partitions(day_partitions):
+    day_partitions['value'] = True
+    conn = FakeLoadStateConnection(LOAD_STATE_INSERTING)
+
+    begin_load(conn, 20220105, reload=True)
+
+    assert [statement for statement, _ in conn.statements] == ['INSERT', 'COMMIT']
+
+
+@pytest.mark.parametrize('reload, statements', [(False, []), (True, ['DELETE'] * 5)])
+def test_untracked_date_is_not_recorded_nor_committed(day_partitions, reload, statements):
+    conn = FakeLoadStateConnection(LOAD_STATE_INSERTING)
+
+    begin_load(conn, 20220105, reload=reload, track_load_state=False)
+
+    assert [statement for statement, _ in conn.statements] == statements
+    assert not any(query.startswith('SELECT state') for query in conn.queries)
+
+
+@pytest.mark.parametrize('database, rollup_batch_days, expected', [
+    ({}, 1, False),
+    ({'shard_insertion': 'disabled', 'insert_executor': 'sequential', 'rollup_executor': 'sequential'}, 1, False),
+    ({}, 2, True),
+    ({'shard_insertion': 'workers'}, 1, True),
+    ({'insert_executor': 'pipelined'}, 1, True),
+    ({'rollup_executor': 'dag'}, 1, True),
+    ({'columnar_closed_months': 'true'}, 1, True),
+])
+def test_load_state_is_tracked_when_dates_are_committed_in_several_transactions(database, rollup_batch_days, expected):
+    assert load_state_tracking_enabled({'Database': database}, rollup_batch_days) == expected
+
+
+def test_finish_load_is_not_committed():
+    conn = FakeLoadStateConnection(None)
+
+    finish_load(conn, [20220105, 20220106])
+
+    assert conn.statements == [('UPDATE', {'state': LOAD_STATE_LOADED, 'date_ids': [20220105, 20220106]})]
+
+
+def test_cell_facts_are_deleted_by_the_key_and_dates_of_their_trajectory(day_partitions, capsys):
+    conn = FakeLoadStateConnection(None, later_date_ids=[20220106])
+
+    delete_date(conn, 20220105)
+
+    cell_deletions = [query for query in conn.queries if 'DELETE FROM fact_cell_50m' in query]
+    assert len(cell_deletions) == 1
+    assert '(trajectory_sub_id, entry_date_id) IN' in cell_deletions[0]
+    assert 'dd.date_id BETWEEN ft.start_date_id AND ft.end_date_id' in cell_deletions[0]
+    assert 'ft.start_date_id = :date_id' in cell_deletions[0]
+    assert '[20220106]' in capsys.readouterr().out
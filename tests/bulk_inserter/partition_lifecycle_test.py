@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+
+from etl.audit.logger import global_audit_logger as gal, ACCESS_METHODS_KEY
+import etl.insert.partition_lifecycle as partition_lifecycle
+from etl.insert.partition_lifecycle import check_reloadable, convert_closed_month, convert_month_partitions, \
+    partitions_to_convert
+
+PARTITIONS = [
+    ('fact_trajectory', 'fact_trajectory_2022_01', 'heap'),
+    ('fact_trajectory', 'fact_trajectory_2022_02', 'heap'),
+    ('fact_trajectory', 'fact_trajectory_2022_01_05', 'heap'),
+    ('fact_cell_50m', 'fact_cell_50m_2022_01_05', 'heap'),
+    ('fact_cell_5000m', 'fact_cell_5000m_2022_01', 'columnar'),
+    ('dim_trajectory', 'dim_trajectory_2022_01', 'heap'),
+]
+
+
+class AllResult:
+    """Result of a query returning all rows at once."""
+
+    def __init__(self, rows):
+        """Construct a result returning the given rows."""
+        self.rows = rows
+
+    def all(self):
+        """Return the rows."""
+        return self.rows
+
+
+class ScalarResult:
+    """Result of a query selecting a single value."""
+
+    def __init__(self, value):
+        """Construct a result of the given value."""
+        self.value = value
+
+    def scalar(self):
+        """Return the value."""
+        return self.value
+
+
+class FakeLifecycleConnection:
+    """Connection returning partitions for the catalog query, and failing the conversion of some partitions."""
+
+    def __init__(self, failing=(), loaded_days=0, access_method='heap'):
+        """Construct a connection failing the conversion of the given partitions, with the given loaded days."""
+        self.failing = failing
+        self.loaded_days = loaded_days
+        self.access_method = access_method
+        self.statements = []
+        self.rollbacks = 0
+
+    def execute(self, statement, parameters=None):
+        """Return the partitions, loaded days or access method for the catalog queries, and record or fail the rest."""
+        if 'pg_inherits' in str(statement):
+            return AllResult(PARTITIONS)
+        if 'load_state' in str(statement):
+            return ScalarResult(self.loaded_days)
+        if 'pg_am' in str(statement):
+            return ScalarResult(self.access_method)
+        if any(f"'{partition}'" in str(statement) for partition in self.failing):
+            raise DBAPIError(str(statement), None, Exception('unsupported index'))
+        self.statements.append(str(statement))
+
+    def commit(self):
+        """Commit nothing."""
+
+    def rollback(self):
+        """Count the rollbacks."""
+        self.rollbacks += 1
+
+
+def test_partitions_to_convert_includes_day_partitions_and_skips_unsupported_tables():
+    assert partitions_to_convert(PARTITIONS, 20220131) == ['fact_trajectory_2022_01', 'fact_trajectory_2022_01_05']
+
+
+def test_convert_records_conversions():
+    gal.reset_log()
+    conn = FakeLifecycleConnection()
+
+    convert_month_partitions(conn, 20220131)
+
+    assert gal[ACCESS_METHODS_KEY] == {'fact_trajectory_2022_01': 'columnar', 'fact_trajectory_2022_01_05': 'columnar'}
+    assert "SELECT alter_table_set_access_method('fact_trajectory_2022_01', 'columnar');" in conn.statements
+    assert 'ANALYZE fact_trajectory_2022_01' in conn.statements
+    gal.reset_log()
+
+
+def test_failed_conversion_is_rolled_back_and_raised():
+    gal.reset_log()
+    conn = FakeLifecycleConnection(failing=['fact_trajectory_2022_01_05'])
+
+    with pytest.raises(DBAPIError):
+        convert_month_partitions(conn, 20220131)
+
+    assert conn.rollbacks == 1
+    assert gal[ACCESS_METHODS_KEY] == {'fact_trajectory_2022_01': 'columnar'}
+    gal.reset_log()
+
+
+@pytest.mark.parametrize('loaded_days, converted', [(31, True), (30, False)])
+def test_month_is_converted_once_every_date_is_loaded(loaded_days, converted):
+    gal.reset_log()
+    conn = FakeLifecycleConnection(loaded_days=loaded_days)
+
+    # The last day of the month may be loaded before the other days
+    convert_closed_month(conn, datetime(2022, 1, 31), {'Database': {'columnar_closed_months': 'true'}})
+
+    assert bool(gal[ACCESS_METHODS_KEY]) == converted
+    gal.reset_log()
+
+
+@pytest.mark.parametrize('day_partitions, access_method, reloadable', [
+    (False, 'heap', True),
+    (False, 'columnar', False),
+    (True, 'columnar', True),
+])
+def test_converted_month_is_only_reloadable_with_day_partitions(monkeypatch, day_partitions, access_method,
+                                                                reloadable):
+    monkeypatch.setattr(partition_lifecycle, 'day_partition_loading_enabled', lambda: day_partitions)
+    conn = FakeLifecycleConnection(access_method=access_method)
+
+    if reloadable:
+        check_reloadable(conn, 20220105)
+    else:
+        with pytest.raises(ValueError, match='columnar'):
+            check_reloadable(conn, 20220105)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from etl.insert import pipelined_inserter
+from etl.insert.pipelined_inserter import split_into_batches, insert_pipelined
+
+
+class FakeConnection:
+    """Connection recording the rows copied by committed transactions."""
+
+    def __init__(self, copied):
+        """Construct a connection appending the rows of committed transactions to copied."""
+        self.copied = copied
+        self.pending = []
+
+    def commit(self):
+        """Record the pending rows as copied."""
+        self.copied.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        """Discard the pending rows."""
+        self.pending = []
+
+    def close(self):
+        """Close the connection."""
+
+
+@pytest.fixture
+def tables():
+    return {
+        'dim_trajectory': pd.DataFrame({'trajectory_sub_id': range(12)}),
+        'fact_trajectory': pd.DataFrame({'trajectory_sub_id': range(12), 'duration': range(12)}),
+    }
+
+
+def test_split_into_batches_keeps_related_rows_together(tables):
+    batches = list(split_into_batches(tables, 5))
+
+    assert [len(batch['dim_trajectory']) for batch in batches] == [5, 5, 2]
+    for batch in batches:
+        assert batch['dim_trajectory']['trajectory_sub_id'].tolist() == \
+            batch['fact_trajectory']['trajectory_sub_id'].tolist()
+
+
+def test_insert_pipelined_limits_batches_in_flight_and_orders_tables(tables, monkeypatch):
+    copied = []
+    in_flight = []
+    max_in_flight = [0]
+    lock = threading.Lock()
+
+    def copy(rows, conn, table_name):
+        with lock:
+            in_flight.append(table_name)
+            max_in_flight[0] = max(max_in_flight[0], len(in_flight))
+        time.sleep(0.01)
+        conn.pending.append((table_name, rows['trajectory_sub_id'].tolist()))
+        with lock:
+            in_flight.remove(table_name)
+
+    monkeypatch.setattr(pipelined_inserter, 'get_connection', lambda config: FakeConnection(copied))
+    monkeypatch.setattr(pipelined_inserter.BulkInserter, '_copy', staticmethod(copy))
+    monkeypatch.setattr(pipelined_inserter, 'PIPELINED_INSERT_BATCH_SIZE', 3)
+    config = {'Database': {'insert_executor_connections': '2', 'insert_executor_batches_in_flight': '2'}}
+
+    insert_pipelined(tables, config)
+
+    assert max_in_flight[0] <= 2
+    assert sorted(sum((ids for table, ids in copied if table == 'fact_trajectory'), [])) == list(range(12))
+    # Every batch commits its dimension rows before, or with, its facts
+    for position, (table_name, ids) in enumerate(copied):
+        if table_name == 'fact_trajectory':
+            assert ('dim_trajectory', ids) in copied[:position]
+
+
+def test_insert_pipelined_reports_committed_rows_when_a_batch_fails(tables, monkeypatch):
+    copied = []
+
+    def copy(rows, conn, table_name):
+        if table_name == 'fact_trajectory' and 7 in rows['trajectory_sub_id'].tolist():
+            raise IOError('copy failed')
+        conn.pending.append((table_name, rows['trajectory_sub_id'].tolist()))
+
+    monkeypatch.setattr(pipelined_inserter, 'get_connection', lambda config: FakeConnection(copied))
+    monkeypatch.setattr(pipelined_inserter.BulkInserter, '_copy', staticmethod(copy))
+    monkeypatch.setattr(pipelined_inserter, 'PIPELINED_INSERT_BATCH_SIZE', 5)
+    config = {'Database': {'insert_executor_connections': '1', 'insert_executor_batches_in_flight': '1'}}
+
+    with pytest.raises(RuntimeError, match='after 1 batches with 5 of 12 rows were committed') as raised:
+        insert_pipelined(tables, config)
+
+    assert isinstance(raised.value.__cause__, IOError)
+    assert copied == [('dim_trajectory', [0, 1, 2, 3, 4]), ('fact_trajectory', [0, 1, 2, 3, 4])]
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.insert.shard_inserter import assign_shards, group_shards
+
+INT32_MIN = -2147483648
+INT32_MAX = 2147483647
+
+placements = pd.DataFrame({
+    'shard_name': ['fact_trajectory_1', 'fact_trajectory_2', 'fact_trajectory_3', 'fact_trajectory_4'],
+    'shard_min_value': [INT32_MIN, -1073741824, 0, 1073741824],
+    'shard_max_value': [-1073741825, -1, 1073741823, INT32_MAX],
+    'node': ['db-2:5432', 'db-3:5432', 'db-2:5432', 'db-3:5432'],
+})
+
+test_data_assign_shards = [
+    (INT32_MIN, INT32_MIN),
+    (-1073741825, INT32_MIN),
+    (-1073741824, -1073741824),
+    (-1, -1073741824),
+    (0, 0),
+    (1073741823, 0),
+    (1073741824, 1073741824),
+    (INT32_MAX, 1073741824),
+]
+
+
+@pytest.mark.parametrize('hash_value, expected_shard', test_data_assign_shards)
+def test_assign_shards(hash_value, expected_shard):
+    assert assign_shards(np.array([hash_value]), placements)[0] == expected_shard
+
+
+def test_assign_shards_keeps_order():
+    hashes = np.array([5, INT32_MIN, 1073741824, -5])
+    assert assign_shards(hashes, placements).tolist() == [0, INT32_MIN, 1073741824, -1073741824]
+
+
+def test_group_shards_by_worker_uses_reachable_hosts():
+    config = {'Database': {
+        'worker_connection_internal_hosts': 'db-2:5432,db-3:5432',
+        'worker_connection_hosts': 'localhost:54322,localhost:54323',
+    }}
+    assert group_shards(placements, config, to_workers=True) == {
+        'localhost:54322': [INT32_MIN, 0],
+        'localhost:54323': [-1073741824, 1073741824],
+    }
+
+
+def test_group_shards_over_coordinator_connections_covers_all_shards():
+    config = {'Database': {'shard_insertion_connections': '3'}}
+    groups = group_shards(placements, config, to_workers=False)
+    assert len(groups) == 3
+    assert sorted(shard for group in groups.values() for shard in group) == sorted(placements['shard_min_value'])
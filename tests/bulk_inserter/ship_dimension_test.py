@@ -0,0 +1,10 @@
+import pandas as pd
+
+from etl.insert.dimensions.ship_dimension import extract_mid
+
+
+def test_extract_mid_takes_first_three_digits():
+    mmsi = pd.Series([219000001, 2190001, 111219000, 970123456, 12, 0, 1000000000])
+    expected = [int(str(value)[:3]) for value in mmsi]
+
+    assert extract_mid(mmsi).tolist() == expected
@@ -0,0 +1,31 @@
+-- The rasters heatmap_aggregation.sql builds for the cells of REFERENCE_CELLS in tests/rollup/heatmap_rasters_test.py,
+-- as hex WKB comparable with REFERENCE_RASTERS. Run on a PostGIS database to capture the reference rasters.
+SELECT
+    reference,
+    encode(ST_AsBinary(ST_Union(ST_AsRaster(
+        geom, ST_MakeEmptyRaster (795000, 420000, 3600000, 3055000, 1000, 1000, 0, 0, 3034),
+        '32BUI'::text, cnt::int
+    ))), 'hex') AS count_rast,
+    encode(ST_AsBinary(ST_Union(ST_AsRaster(
+        geom, ST_MakeEmptyRaster (795000, 420000, 3600000, 3055000, 1000, 1000, 0, 0, 3034),
+        ARRAY['32BF','32BUI'], ARRAY[delta_heading, cnt::int], nodataval := ARRAY[0, 0]
+    ))), 'hex') AS delta_heading_rast,
+    encode(ST_AsBinary(ST_Union(ST_AsRaster(
+        geom, ST_MakeEmptyRaster (795000, 420000, 3600000, 3055000, 1000, 1000, 0, 0, 3034),
+        '32BUI'::text, EXTRACT(EPOCH FROM time_sum)
+    ))), 'hex') AS time_rast
+FROM (
+    SELECT
+        reference, cnt, delta_heading, time_sum,
+        ST_MakeEnvelope(cell_x * 1000, cell_y * 1000, (cell_x + 1) * 1000, (cell_y + 1) * 1000, 3034) AS geom
+    FROM (
+        VALUES
+            ('inner', 15, 21, 4, NULL::float, interval '42.4 seconds'),
+            ('inner', 16, 20, 1, NULL::float, interval '2.5 seconds'),
+            ('inner', 17, 20, 1, NULL::float, interval '10.6 seconds'),
+            ('corners', 15, 20, 1, NULL::float, interval '0.4 seconds'),
+            ('corners', 19, 24, 2, NULL::float, interval '7.5 seconds')
+    ) cells (reference, cell_x, cell_y, cnt, delta_heading, time_sum)
+) i1
+GROUP BY reference
+;
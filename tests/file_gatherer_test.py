@@ -1,8 +1,14 @@
+import os
+import threading
 from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 
-from etl.gatherer.file_downloader import date_from_filename
+import etl.gatherer.file_downloader as file_downloader
+from etl.gatherer.file_downloader import date_from_filename, download_file, PARTIAL_DOWNLOAD_SUFFIX, AisFile, \
+    get_cached_file_names, rename_extracted_files
+from etl.gatherer.file_index import LocalFileIndex
 
 
 def test_it_transforms_file_name_to_datetime():
@@ -25,3 +31,178 @@ def test_it_transforms_file_name_to_datetime():
     # assert it raises an exception
     with pytest.raises(Exception):
         date_from_filename(file_name)
+
+
+FILE_CONTENT = os.urandom(100000)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve FILE_CONTENT on every path, honouring range requests if the server supports them."""
+
+    def do_GET(self):
+        """Serve the file content, or the requested range of it."""
+        range_header = self.headers.get('Range')
+        if range_header is None or not self.server.supports_range:
+            self._send(200, FILE_CONTENT)
+            return
+
+        offset = int(range_header.replace('bytes=', '').split('-')[0])
+        self.server.requested_offsets.append(offset)
+        if offset >= len(FILE_CONTENT):
+            self._send(416, b'', f'bytes */{len(FILE_CONTENT)}')
+            return
+        self._send(206, FILE_CONTENT[offset:], f'bytes {offset}-{len(FILE_CONTENT) - 1}/{len(FILE_CONTENT)}')
+
+    def _send(self, status, body, content_range=None):
+        """Send a response with the given status and body, closing the connection early if the server truncates."""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if content_range is not None:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        truncated = self.server.truncate_bodies.pop(0) if self.server.truncate_bodies else None
+        self.wfile.write(body[:truncated])
+
+    def log_message(self, format, *args):
+        """Silence request logging."""
+        pass
+
+
+@pytest.fixture(params=[True, False], ids=['range', 'no_range'])
+def http_server(request):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    server.supports_range = request.param
+    server.requested_offsets = []
+    # The number of bytes of the next bodies written before the connection is closed
+    server.truncate_bodies = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_file(tmp_path, http_server):
+    path = str(tmp_path / 'aisdk-2022-01-01.zip')
+
+    download_file(f'http://127.0.0.1:{http_server.server_port}/aisdk-2022-01-01.zip', path)
+
+    assert open(path, 'rb').read() == FILE_CONTENT
+    assert not os.path.exists(path + PARTIAL_DOWNLOAD_SUFFIX)
+    assert http_server.requested_offsets == []
+
+
+@pytest.mark.parametrize('offset', [1, 5000, len(FILE_CONTENT)])
+def test_download_file_resumes_partial_file(tmp_path, http_server, offset):
+    path = str(tmp_path / 'aisdk-2022-01-01.zip')
+    with open(path + PARTIAL_DOWNLOAD_SUFFIX, 'wb') as f:
+        f.write(FILE_CONTENT[:offset])
+
+    download_file(f'http://127.0.0.1:{http_server.server_port}/aisdk-2022-01-01.zip', path, chunk_size=1024)
+
+    assert open(path, 'rb').read() == FILE_CONTENT
+    assert not os.path.exists(path + PARTIAL_DOWNLOAD_SUFFIX)
+    assert http_server.requested_offsets == ([offset] if http_server.supports_range else [])
+
+
+def test_download_file_keeps_truncated_body_as_partial_file(tmp_path, http_server):
+    path = str(tmp_path / 'aisdk-2022-01-01.zip')
+    url = f'http://127.0.0.1:{http_server.server_port}/aisdk-2022-01-01.zip'
+    http_server.truncate_bodies = [30000]
+
+    with pytest.raises(IOError, match='Incomplete download'):
+        download_file(url, path)
+
+    assert not os.path.exists(path)
+    assert open(path + PARTIAL_DOWNLOAD_SUFFIX, 'rb').read() == FILE_CONTENT[:30000]
+
+    download_file(url, path)
+
+    assert open(path, 'rb').read() == FILE_CONTENT
+    assert http_server.requested_offsets == ([30000] if http_server.supports_range else [])
+
+
+AIS_URL = 'http://127.0.0.1/aisdata/'
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_downloader, '_remote_index_cache', {})
+    monkeypatch.setattr('etl.gatherer.file_index._local_file_indices', {})
+    return {'DataSource': {'ais_path': str(tmp_path), 'ais_url': AIS_URL, 'index_cache_ttl_seconds': '60'}}
+
+
+@pytest.fixture
+def fetch_counter(monkeypatch):
+    fetches = []
+
+    def mock_get_file_names(ais_url):
+        fetches.append(ais_url)
+        return {datetime(2022, 1, 1): AisFile('aisdk-2022-01-01.zip', ais_url + 'aisdk-2022-01-01.zip')}
+
+    monkeypatch.setattr(file_downloader, 'get_file_names', mock_get_file_names)
+    return fetches
+
+
+def test_cached_file_names_fetches_once(config, fetch_counter):
+    first = get_cached_file_names(config)
+    second = get_cached_file_names(config)
+
+    assert fetch_counter == [AIS_URL]
+    assert first == second
+    assert first[datetime(2022, 1, 1)].name == 'aisdk-2022-01-01.zip'
+
+
+def test_cached_file_names_are_read_from_disk(config, fetch_counter, monkeypatch):
+    get_cached_file_names(config)
+    # Simulate a new process by clearing the in-process cache
+    monkeypatch.setattr(file_downloader, '_remote_index_cache', {})
+
+    result = get_cached_file_names(config)
+
+    assert fetch_counter == [AIS_URL]
+    assert result[datetime(2022, 1, 1)].url == AIS_URL + 'aisdk-2022-01-01.zip'
+
+
+def test_cached_file_names_expire(config, fetch_counter, monkeypatch):
+    get_cached_file_names(config)
+    monkeypatch.setattr(file_downloader, '_remote_index_cache', {})
+    config['DataSource']['index_cache_ttl_seconds'] = '-1'
+
+    get_cached_file_names(config)
+
+    assert fetch_counter == [AIS_URL, AIS_URL]
+
+
+def test_cached_file_names_refresh(config, fetch_counter):
+    get_cached_file_names(config)
+    get_cached_file_names(config, refresh=True)
+
+    assert fetch_counter == [AIS_URL, AIS_URL]
+
+
+def test_rename_extracted_files_updates_index(tmp_path, config):
+    (tmp_path / 'aisdk_20220101.csv').write_text('')
+    (tmp_path / 'aisdk-2022-01.zip').write_text('')
+
+    rename_extracted_files(config)
+
+    assert sorted(os.listdir(tmp_path)) == ['aisdk-2022-01-01.csv', 'aisdk-2022-01.zip']
+    index = file_downloader.get_local_file_index(config)
+    assert sorted(index.names()) == ['aisdk-2022-01-01.csv', 'aisdk-2022-01.zip']
+
+
+def test_local_file_index_lists_folder_once(tmp_path):
+    (tmp_path / 'aisdk-2022-01-01.csv').write_text('')
+    index = LocalFileIndex(str(tmp_path))
+    assert index.contains('aisdk-2022-01-01.csv')
+
+    # Files created after the folder was listed are only known when added or refreshed
+    (tmp_path / 'aisdk-2022-01-02.csv').write_text('')
+    assert not index.contains('aisdk-2022-01-02.csv')
+    index.add('aisdk-2022-01-02.csv')
+    assert index.contains('aisdk-2022-01-02.csv')
+
+    (tmp_path / 'aisdk-2022-01-03.csv').write_text('')
+    index.refresh()
+    assert index.contains('aisdk-2022-01-03.csv')
@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from etl.pipeline import batch_days, pipelined_range
+
+DATES = [datetime(2022, 1, 1) + timedelta(days=day) for day in range(5)]
+TIMEOUT_SECONDS = 5
+
+
+class RecordingStages:
+    """Download and clean stages recording the dates they are started for."""
+
+    def __init__(self, fail=None, blocked_download=None):
+        """Construct stages raising for the (stage, date) given to fail, and blocking the download of a date."""
+        self.downloaded = []
+        self.cleaned = []
+        self.fail = fail
+        self.blocked_download = blocked_download
+        self.unblock = threading.Event()
+
+    def download(self, date):
+        """Record and return the path of the date, waiting to be unblocked for the blocked date."""
+        self.downloaded.append(date)
+        if date == self.blocked_download:
+            assert self.unblock.wait(TIMEOUT_SECONDS)
+        if self.fail == ('download', date):
+            raise IOError(f'download {date}')
+        return f'aisdk-{date:%Y-%m-%d}.csv'
+
+    def clean(self, date, file_path):
+        """Record and return the date and the path cleaned."""
+        self.cleaned.append(date)
+        if self.fail == ('clean', date):
+            raise ValueError(f'clean {date}')
+        return date, file_path
+
+
+def run(stages, download_ahead=2, clean_ahead=1):
+    """Return the cleaned dates, and the downloads and cleanings started when every date was yielded."""
+    yielded = []
+    with ThreadPoolExecutor(max_workers=1) as download_pool, ThreadPoolExecutor(max_workers=1) as clean_pool:
+        for date, cleaned in pipelined_range(DATES, stages.download, stages.clean, download_pool, clean_pool,
+                                             download_ahead, clean_ahead):
+            yielded.append((date, cleaned, list(stages.downloaded), list(stages.cleaned)))
+    return yielded
+
+
+def test_dates_are_yielded_in_order():
+    yielded = run(RecordingStages())
+
+    assert [(date, cleaned) for date, cleaned, _, _ in yielded] == \
+        [(date, (date, f'aisdk-{date:%Y-%m-%d}.csv')) for date in DATES]
+
+
+def test_read_ahead_is_bounded():
+    for idx, (_, _, downloaded, cleaned) in enumerate(run(RecordingStages())):
+        assert downloaded == DATES[:len(downloaded)] and len(downloaded) <= idx + 3
+        assert cleaned == DATES[:len(cleaned)] and idx + 1 <= len(cleaned) <= idx + 2
+
+
+def test_date_is_yielded_while_next_date_is_downloaded():
+    stages = RecordingStages(blocked_download=DATES[1])
+    with ThreadPoolExecutor(max_workers=1) as download_pool, ThreadPoolExecutor(max_workers=1) as clean_pool:
+        cleaned = pipelined_range(DATES, stages.download, stages.clean, download_pool, clean_pool, 2, 1)
+
+        assert next(cleaned)[0] == DATES[0]
+        assert DATES[1] not in stages.cleaned
+        stages.unblock.set()
+        assert [date for date, _ in cleaned] == DATES[1:]
+
+
+@pytest.mark.parametrize('stage, error', [('download', IOError), ('clean', ValueError)])
+def test_failure_is_raised_when_date_is_reached(stage, error):
+    stages = RecordingStages(fail=(stage, DATES[2]))
+    yielded = []
+    with pytest.raises(error, match=f'{stage} 2022-01-03'):
+        with ThreadPoolExecutor(max_workers=1) as download_pool, \
+                ThreadPoolExecutor(max_workers=1) as clean_pool:
+            for date, _ in pipelined_range(DATES, stages.download, stages.clean, download_pool, clean_pool, 2, 1):
+                yielded.append(date)
+
+    assert yielded == DATES[:2]
+    # The dates after the failed date are neither downloaded nor cleaned beyond the read-ahead
+    assert DATES[4] not in stages.cleaned
+
+
+@pytest.mark.parametrize('batch_size, expected', [
+    (1, [[0], [1], [2], [3], [4]]),
+    (2, [[0, 1], [2, 3], [4]]),
+    (5, [[0, 1, 2, 3, 4]]),
+    (7, [[0, 1, 2, 3, 4]]),
+])
+def test_batch_days(batch_size, expected):
+    days = [(date, idx) for idx, date in enumerate(DATES)]
+
+    assert [[data for _, data in batch] for batch in batch_days(days, batch_size)] == expected
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.rollup.cell_traversal import CellFactTraversal, build_cell_facts, coarsen_crossings, edge_directions, \
+    segmented_delta, traverse_cell_sizes, traverse_grid, values_in_periods
+
+DIRECTIONS = ['North', 'South', 'East', 'West', 'Unknown']
+# The rows of fact_cell_rollup.sql for the 1000m cells of the trajectories of test_cell_facts_match_fact_cell_rollup
+FACT_CELL_ROLLUP_ROWS = 'tests/data/fact_cell_rollup_1000m.csv'
+
+
+@pytest.fixture
+def directions():
+    pairs = [(from_direction, to_direction) for from_direction in DIRECTIONS for to_direction in DIRECTIONS]
+    return pd.DataFrame([(idx + 1, *pair) for idx, pair in enumerate(pairs)], columns=['direction_id', 'from', 'to'])
+
+
+def temporal_instants(owner, time, value, sequence_end=None):
+    """Return temporal instants, by default in a single sequence per owner."""
+    instants = pd.DataFrame({'owner': owner, 'time': time, 'value': value}, dtype=float).astype({'owner': int})
+    if sequence_end is None:
+        sequence_end = instants.groupby('owner')['time'].transform('max')
+    return instants.assign(sequence_end=sequence_end)
+
+
+def east_then_north():
+    # Moves east through three 1000m cells, and turns north into the cell above the third
+    piece = np.array([0, 0, 0])
+    x = np.array([10.0, 2500.0, 2500.0])
+    y = np.array([10.0, 10.0, 1500.0])
+    t = np.array([0.0, 249.0, 399.0])
+    return piece, x, y, t
+
+
+def test_traverse_grid_merges_cuts_in_the_same_cell():
+    crossings, azimuths = traverse_grid(*east_then_north(), 1000)
+
+    assert list(zip(crossings['cell_x'], crossings['cell_y'])) == [(0, 0), (1, 0), (2, 0), (2, 1)]
+    assert crossings['entry_time'].tolist() == pytest.approx([0, 99, 199, 249 + 150 * 990 / 1490])
+    assert crossings['length'].tolist() == pytest.approx([990, 1000, 1490, 500])
+    assert azimuths[azimuths['crossing'] == 2]['azimuth'].tolist() == pytest.approx([90, 0])
+
+
+def test_traverse_grid_keeps_stationary_pieces_in_their_cell():
+    crossings, azimuths = traverse_grid(np.array([0, 0]), np.array([-5.0, -5.0]), np.array([5.0, 5.0]),
+                                        np.array([0.0, 60.0]), 50)
+
+    assert list(zip(crossings['cell_x'], crossings['cell_y'])) == [(-1, 0)]
+    assert crossings['length'].tolist() == [0]
+    assert azimuths.empty
+
+
+def test_traverse_grid_keeps_single_instant_pieces_in_their_cell():
+    crossings, azimuths = traverse_grid(np.array([0, 1, 1]), np.array([1200.0, 10.0, 20.0]),
+                                        np.array([300.0, 10.0, 10.0]), np.array([500.0, 0.0, 1.0]), 1000)
+
+    assert list(zip(crossings['piece'], crossings['cell_x'], crossings['cell_y'])) == [(0, 1, 0), (1, 0, 0)]
+    assert crossings['entry_time'].tolist() == [500, 0]
+    assert crossings['exit_time'].tolist() == [500, 1]
+    assert crossings['length'].tolist() == pytest.approx([0, 10])
+    assert azimuths['crossing'].tolist() == [1]
+
+
+def test_edge_directions():
+    directions = edge_directions(np.array([0, 0, 0, 0, 0]), np.array([0, 0, 0, 0, 0]),
+                                 np.array([500, 500, 1000, 0.1, 500]), np.array([0, 999.9, 500, 500, 500]), 1000)
+    assert directions.tolist() == ['South', 'North', 'East', 'West', 'Unknown']
+
+
+def test_segmented_delta_matches_calculate_delta_upperbounded():
+    groups = np.array([0, 0, 0, 0, 1, 2, 2])
+    values = np.array([350.0, 10.0, 10.0, 20.0, 5.0, 0.0, 180.0])
+    # Group 0 has the distinct values 10, 20 and 350, and 350 is 30 degrees from 20 around the bound
+    assert segmented_delta(groups, values, 4).tolist() == pytest.approx([40, 0, 180, 0])
+
+
+def test_values_in_periods_include_the_value_at_the_start():
+    instants = temporal_instants([1, 1, 1, 2], [0, 100, 300, 50], [90.0, 91.0, 0.0, 7.0])
+
+    period, values = values_in_periods(np.array([1, 1, 2, 3]), np.array([150, 0, 0, 0]), np.array([350, 99, 40, 10]),
+                                       instants)
+
+    assert period.tolist() == [0, 0, 1]
+    assert values.tolist() == [91.0, 0.0, 90.0]
+
+
+def test_values_in_periods_exclude_the_value_before_a_gap():
+    # The first sequence ends at 100, and the second starts at 300
+    instants = temporal_instants([1, 1, 1], [0, 100, 300], [90.0, 91.0, 0.0], sequence_end=[100, 100, 300])
+
+    period, values = values_in_periods(np.array([1, 1, 1]), np.array([50, 150, 150]), np.array([60, 200, 300]),
+                                       instants)
+
+    assert period.tolist() == [0, 2]
+    assert values.tolist() == [90.0, 0.0]
+
+
+def test_crossings_without_a_heading_have_an_unknown_delta_heading(directions):
+    crossings, azimuths = traverse_grid(*east_then_north(), 1000)
+    crossings = crossings.assign(trajectory_sub_id=5, ship_id=1, nav_status_id=2, infer_stopped=False, partition_id=3)
+    # The headings start during the second crossing, and have a gap during the third crossing
+    headings = temporal_instants([5, 5, 5], [120, 150, 380], [90.0, 92.0, 0.0], sequence_end=[150, 150, 380])
+
+    facts = build_cell_facts(crossings, azimuths, headings, headings, directions, 1000)
+
+    assert facts['delta_heading'].tolist() == pytest.approx([-1, 2, -1, 0])
+    assert facts['draught'].tolist() == [None, 90.0, None, 0.0]
+
+
+def test_build_cell_facts(directions):
+    crossings, azimuths = traverse_grid(*east_then_north(), 1000)
+    crossings = crossings.assign(trajectory_sub_id=5, ship_id=1, nav_status_id=2, infer_stopped=False, partition_id=3)
+    # The headings and draughts last until the end of the trajectory at 399
+    headings = temporal_instants([5, 5, 5], [0, 100, 300], [90.0, 91.0, 0.0], sequence_end=399)
+    draughts = temporal_instants([5, 5], [0, 200], [5.0, 4.0], sequence_end=399)
+
+    facts = build_cell_facts(crossings, azimuths, headings, draughts, directions, 1000)
+
+    from_to = dict(zip(directions['direction_id'], zip(directions['from'], directions['to'])))
+    assert [from_to[direction_id] for direction_id in facts['direction_id']] == \
+        [('Unknown', 'East'), ('West', 'East'), ('West', 'North'), ('South', 'Unknown')]
+    assert facts['entry_time_id'].tolist() == [0, 139, 319, 548]
+    assert facts['entry_date_id'].tolist() == [19700101] * 4
+    assert facts['sog'].tolist() == pytest.approx([990 / 99 * 1.94, 10 * 1.94, 1490 / 149 * 1.94, 500 / 51 * 1.94])
+    assert facts['delta_heading'].tolist() == pytest.approx([0, 1, 91, 0])
+    assert facts['delta_cog'].tolist() == pytest.approx([0, 0, 90, 0])
+    assert facts['draught'].tolist() == [5.0, 5.0, 4.0, 4.0]
+    assert facts['st_bounding_box'].iat[1] == \
+        'SRID=3034;STBOX XT(((1000,0),(2000,1000)),[1970-01-01 00:01:39+00, 1970-01-01 00:03:19+00])'
+
+
+def test_build_cell_facts_without_headings_or_draughts(directions):
+    crossings, azimuths = traverse_grid(*east_then_north(), 5000)
+    crossings = crossings.assign(trajectory_sub_id=5, ship_id=1, nav_status_id=2, infer_stopped=False, partition_id=3)
+    no_instants = temporal_instants([], [], [])
+
+    facts = build_cell_facts(crossings, azimuths, no_instants, no_instants, directions, 5000)
+
+    assert facts['delta_heading'].tolist() == [-1]
+    assert facts['draught'].tolist() == [None]
+    assert facts['delta_cog'].tolist() == pytest.approx([90])
+
+
+def random_walks(seed: int):
+    rng = np.random.default_rng(seed)
+    piece = np.repeat(np.arange(20), 30)
+    x = np.cumsum(rng.normal(0, 700, len(piece))) + 100000
+    y = np.cumsum(rng.normal(0, 700, len(piece))) + 100000
+    t = np.tile(np.arange(30) * 60.0, 20)
+    return piece, x, y, t
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_coarsened_crossings_match_traversing_the_coarse_grid(seed):
+    traversals = traverse_cell_sizes(*random_walks(seed), [5000, 50, 1000, 200])
+    crossings, azimuths = traverse_grid(*random_walks(seed), 5000)
+    derived, derived_azimuths = traversals[5000]
+
+    assert derived[['piece', 'cell_x', 'cell_y']].equals(crossings[['piece', 'cell_x', 'cell_y']])
+    for column in ['entry_x', 'entry_y', 'exit_x', 'exit_y', 'entry_time', 'exit_time', 'length']:
+        assert derived[column].tolist() == pytest.approx(crossings[column].tolist())
+    assert segmented_delta(derived_azimuths['crossing'].to_numpy(), derived_azimuths['azimuth'].to_numpy(),
+                           len(derived)) == pytest.approx(
+        segmented_delta(azimuths['crossing'].to_numpy(), azimuths['azimuth'].to_numpy(), len(crossings)))
+
+
+def test_coarsen_requires_nested_grids():
+    crossings, azimuths = traverse_grid(*east_then_north(), 200)
+    with pytest.raises(ValueError):
+        coarsen_crossings(crossings, azimuths, 200, 500)
+
+
+def test_cell_facts_match_fact_cell_rollup(directions):
+    piece, x, y, t = east_then_north()
+    # Trajectory 5 moves through four cells, and trajectory 6 is a single instant
+    pieces = pd.DataFrame({'trajectory_sub_id': [5, 6], 'ship_id': [1, 2], 'nav_status_id': [2, 2],
+                           'infer_stopped': [False, False], 'partition_id': [3, 3]})
+    instants = pd.DataFrame({'piece': [*piece, 1], 'x': [*x, 1200.0], 'y': [*y, 300.0], 't': [*t, 500.0]})
+    # The headings and draughts last until the end of the trajectory at 399
+    headings = temporal_instants([5, 5, 5], [0, 100, 300], [90.0, 91.0, 0.0], sequence_end=399)
+    draughts = temporal_instants([5, 5], [0, 200], [5.0, 4.0], sequence_end=399)
+
+    facts = CellFactTraversal((pieces, instants, headings, draughts, directions), [1000]).cell_facts(1000)
+
+    expected = pd.read_csv(FACT_CELL_ROLLUP_ROWS)
+    expected = expected.merge(directions, on=['from', 'to'], how='left')
+    key_columns = ['trajectory_sub_id', 'cell_x', 'cell_y', 'entry_date_id', 'entry_time_id', 'exit_date_id',
+                   'exit_time_id', 'direction_id', 'st_bounding_box']
+    assert facts[key_columns].astype(str).values.tolist() == expected[key_columns].astype(str).values.tolist()
+    for column in ['sog', 'delta_heading', 'draught', 'delta_cog']:
+        assert facts[column].astype(float).tolist() == pytest.approx(expected[column].tolist(), nan_ok=True)
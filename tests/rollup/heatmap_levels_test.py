@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from etl.rollup.heatmap_levels import DAILY_TEMPORAL_RESOLUTION, HOURLY_TEMPORAL_RESOLUTION, \
+    MONTHLY_TEMPORAL_RESOLUTION, apply_heatmap_levels, coarsest_temporal_resolution, month_range
+
+
+class RowCountResult:
+    """Result of a statement modifying rows."""
+
+    rowcount = 3
+
+
+class FakeLevelConnection:
+    """Connection recording the statements and parameters executed."""
+
+    def __init__(self):
+        """Construct a connection without executed statements."""
+        self.executed = []
+
+    def execute(self, statement, parameters=None):
+        """Record the first word of the statement and the parameters."""
+        self.executed.append((str(statement).split()[0], parameters))
+        return RowCountResult()
+
+
+@pytest.mark.parametrize('date, expected', [
+    (datetime(2021, 2, 14), (20210201, 20210228)),
+    (datetime(2020, 2, 1), (20200201, 20200229)),
+    (datetime(2021, 12, 31), (20211201, 20211231)),
+])
+def test_month_range(date, expected):
+    assert month_range(date) == expected
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    (20210228, 20210228, DAILY_TEMPORAL_RESOLUTION),
+    (20210601, 20210630, MONTHLY_TEMPORAL_RESOLUTION),
+    (20210101, 20211231, MONTHLY_TEMPORAL_RESOLUTION),
+    (20210101, 20210130, DAILY_TEMPORAL_RESOLUTION),
+    (20210102, 20210131, DAILY_TEMPORAL_RESOLUTION),
+])
+def test_coarsest_temporal_resolution(start, end, expected):
+    assert coarsest_temporal_resolution(start, end) == expected
+
+
+@pytest.mark.parametrize('start_time_id, end_time_id', [(60000, 235959), (0, 175959), (120000, 130000)])
+def test_coarsest_temporal_resolution_of_partial_days_is_hourly(start_time_id, end_time_id):
+    assert coarsest_temporal_resolution(20210601, 20210630, start_time_id, end_time_id) == HOURLY_TEMPORAL_RESOLUTION
+
+
+def test_hourly_temporal_resolution_matches_heatmaps_loaded_before_the_levels():
+    assert HOURLY_TEMPORAL_RESOLUTION == 84600
+
+
+def test_levels_are_replaced_from_finer_levels():
+    conn = FakeLevelConnection()
+
+    apply_heatmap_levels(conn, datetime(2021, 6, 14), 200)
+
+    assert [statement for statement, _ in conn.executed] == ['DELETE', '--', 'DELETE', '--']
+    daily, monthly = conn.executed[1][1], conn.executed[3][1]
+    assert (daily['START_DATE_KEY'], daily['END_DATE_KEY']) == (20210614, 20210614)
+    assert (daily['TEMPORAL_RESOLUTION'], daily['FINER_TEMPORAL_RESOLUTION']) == \
+        (DAILY_TEMPORAL_RESOLUTION, HOURLY_TEMPORAL_RESOLUTION)
+    assert (monthly['START_DATE_KEY'], monthly['END_DATE_KEY']) == (20210601, 20210630)
+    assert monthly['FINER_TEMPORAL_RESOLUTION'] == DAILY_TEMPORAL_RESOLUTION
+    assert monthly['SPATIAL_RESOLUTION'] == 200
+
+
+def test_levels_of_several_dates_are_merged_together():
+    conn = FakeLevelConnection()
+
+    apply_heatmap_levels(conn, datetime(2021, 6, 28), 200, datetime(2021, 7, 2))
+
+    assert len(conn.executed) == 4
+    daily, monthly = conn.executed[1][1], conn.executed[3][1]
+    assert (daily['START_DATE_KEY'], daily['END_DATE_KEY']) == (20210628, 20210702)
+    assert (monthly['START_DATE_KEY'], monthly['END_DATE_KEY']) == (20210601, 20210731)
@@ -0,0 +1,142 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.rollup.heatmap_rasters import HEATMAP_BANDS, heatmap_rasters, pixel_values, raster_wkb
+
+HEADER_FORMAT = '<BHHddddddiHH'
+# Cells with (cell_x, cell_y, cnt, time_sum) of 1000m cells in tile (3, 4) and no delta headings. The inner cells are
+# inside the tile, and the corner cells on its south west and north east corners, one with less than half a second
+REFERENCE_CELLS = {
+    'inner': [(15, 21, 4, 42.4), (16, 20, 1, 2.5), (17, 20, 1, 10.6)],
+    'corners': [(15, 20, 1, 0.4), (19, 24, 2, 7.5)],
+}
+# The rasters of heatmap_aggregation.sql for REFERENCE_CELLS, as hex WKB split into the header and the bands. They are
+# written out by hand from the raster WKB format and the ST_AsRaster semantics, and can be captured from a PostGIS
+# database using tests/data/heatmap_reference_rasters.sql
+REFERENCE_RASTERS = {
+    ('inner', 'time'): (
+        # Little endian, version 0, 1 band, scale (1000, -1000), upper left (15000, 22000), no skew, SRID 3034, 3x2
+        '01' '0000' '0100' '0000000000408f40' '0000000000408fc0' '00000000004ccd40' '00000000007cd540'
+        '0000000000000000' '0000000000000000' 'da0b0000' '0300' '0200'
+        # 32BUI with nodata 0, the time sums rounded half up to whole seconds, north-up
+        '48' '00000000' '2a000000' '00000000' '00000000' '00000000' '03000000' '0b000000'
+    ),
+    ('inner', 'delta_heading'): (
+        '01' '0000' '0200' '0000000000408f40' '0000000000408fc0' '00000000004ccd40' '00000000007cd540'
+        '0000000000000000' '0000000000000000' 'da0b0000' '0300' '0200'
+        # 32BF with nodata 0, the null delta headings being nodata
+        '4a' '00000000' '00000000' '00000000' '00000000' '00000000' '00000000' '00000000'
+        # 32BUI with nodata 0, the counts
+        '48' '00000000' '04000000' '00000000' '00000000' '00000000' '01000000' '01000000'
+    ),
+    ('corners', 'count'): (
+        # Upper left (15000, 25000), 5x5 covering the whole tile, as the cells lie exactly on the grid
+        '01' '0000' '0100' '0000000000408f40' '0000000000408fc0' '00000000004ccd40' '00000000006ad840'
+        '0000000000000000' '0000000000000000' 'da0b0000' '0500' '0500'
+        '48' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '02000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '01000000' '00000000' '00000000' '00000000' '00000000'
+    ),
+    ('corners', 'time'): (
+        '01' '0000' '0100' '0000000000408f40' '0000000000408fc0' '00000000004ccd40' '00000000006ad840'
+        '0000000000000000' '0000000000000000' 'da0b0000' '0500' '0500'
+        # The time sum of 0.4 seconds is rounded to 0 and is nodata, but the raster still covers its cell
+        '48' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '08000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+        '00000000' '00000000' '00000000' '00000000' '00000000'
+    ),
+}
+
+
+def decode_raster(wkb_hex):
+    """Return the header and the pixels of every band of a PostGIS raster WKB."""
+    wkb = bytes.fromhex(wkb_hex)
+    header = struct.unpack_from(HEADER_FORMAT, wkb)
+    width, height = header[-2:]
+    offset = struct.calcsize(HEADER_FORMAT)
+    bands = []
+    for _ in range(header[2]):
+        flags = wkb[offset]
+        dtype = {8: '<u4', 10: '<f4'}[flags & 0x0F]
+        offset += 1 + np.dtype(dtype).itemsize
+        pixels = np.frombuffer(wkb, dtype, width * height, offset)
+        bands.append((flags, pixels.reshape(height, width)))
+        offset += pixels.nbytes
+    assert offset == len(wkb)
+    return header, bands
+
+
+def aggregates(cells):
+    """Return aggregates of the given (cell_x, cell_y, cnt) cells in the same heatmap."""
+    rows = pd.DataFrame(cells, columns=['cell_x', 'cell_y', 'cnt'])
+    return rows.assign(partition_id=1, infer_stopped=False, date_id=20210614, entry_hour_of_day=13, ship_type_id=2,
+                       delta_cog=rows['cnt'] * 1.5, delta_heading=np.nan, max_draught=4.25, time_sum=rows['cnt'] * 10.6)
+
+
+def test_raster_wkb_header():
+    header, bands = decode_raster(raster_wkb([(np.array([[1, 2, 3]]), '32BUI')], 795000, 420000, 50).hex())
+
+    assert header == (1, 0, 1, 50, -50, 795000, 420000, 0, 0, 3034, 3, 1)
+    assert bands[0][0] == 0x40 | 8
+    assert bands[0][1].tolist() == [[1, 2, 3]]
+
+
+def test_pixel_values_round_integers_and_use_nodata_for_nulls():
+    assert pixel_values(np.array([1.4, 1.5, np.nan, -3]), '32BUI').tolist() == [1, 2, 0, 0]
+    assert pixel_values(np.array([1.25, np.nan]), '32BF').tolist() == [1.25, 0]
+
+
+def test_heatmap_covers_bounding_box_of_cells_north_up():
+    # 1000m cells, so five cells per tile side, in tile (3, 4)
+    rasters = heatmap_rasters(aggregates([(15, 21, 4), (17, 20, 1)]), 1000)
+
+    assert rasters['slug'].tolist() == list(HEATMAP_BANDS)
+    assert rasters[['tile_x', 'tile_y']].drop_duplicates().values.tolist() == [[3, 4]]
+    header, (count, ) = decode_raster(rasters.loc[rasters['slug'] == 'count', 'rast'].iat[0])
+    assert header[3:7] == (1000, -1000, 15000, 22000)
+    assert header[-2:] == (3, 2)
+    assert count[1].tolist() == [[4, 0, 0], [0, 0, 1]]
+
+
+def test_heatmap_bands_of_types():
+    rasters = heatmap_rasters(aggregates([(15, 21, 4)]), 1000).set_index('slug')['rast']
+
+    _, (delta_cog, count) = decode_raster(rasters['delta_cog'])
+    assert delta_cog[1].tolist() == [[6.0]] and count[1].tolist() == [[4]]
+    _, (delta_heading, _) = decode_raster(rasters['delta_heading'])
+    assert delta_heading[1].tolist() == [[0.0]]
+    assert decode_raster(rasters['max_draught'])[1][0][1].tolist() == [[4.25]]
+    assert decode_raster(rasters['time'])[1][0][1].tolist() == [[42]]
+
+
+@pytest.mark.parametrize('column, value', [
+    ('ship_type_id', 3), ('date_id', 20210615), ('entry_hour_of_day', 14), ('cell_x', 20),
+])
+def test_heatmaps_are_split_by_group(column, value):
+    cells = aggregates([(15, 21, 4), (16, 21, 1)])
+    cells.loc[1, column] = value
+
+    rasters = heatmap_rasters(cells, 1000)
+
+    assert len(rasters) == 2 * len(HEATMAP_BANDS)
+    for rast in rasters.loc[rasters['slug'] == 'count', 'rast']:
+        assert decode_raster(rast)[0][-2:] == (1, 1)
+
+
+@pytest.mark.parametrize('reference, slug', list(REFERENCE_RASTERS))
+def test_heatmaps_match_heatmap_aggregation_rasters(reference, slug):
+    cells = aggregates([cell[:3] for cell in REFERENCE_CELLS[reference]])
+    cells['time_sum'] = [cell[3] for cell in REFERENCE_CELLS[reference]]
+
+    rasters = heatmap_rasters(cells, 1000).set_index('slug')['rast']
+
+    assert rasters[slug] == REFERENCE_RASTERS[(reference, slug)]
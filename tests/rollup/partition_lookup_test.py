@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from etl.rollup.partition_lookup import SpatialPartitionLookup, assign_partitions
+
+# Two partitions side by side, and a partition north of both
+PARTITIONS = pd.DataFrame({
+    'partition_id': [1, 2, 3],
+    'xmin': [0, 5000, 0], 'ymin': [0, 0, 5000], 'xmax': [5000, 10000, 10000], 'ymax': [5000, 5000, 10000],
+})
+
+
+def assigned(bounds):
+    """Return the (box, partition id) pairs the boxes are assigned to."""
+    boxes, partition_ids = SpatialPartitionLookup(PARTITIONS).assign(np.array(bounds, dtype=float))
+    return sorted(zip(boxes.tolist(), partition_ids.tolist()))
+
+
+def test_boxes_are_assigned_to_covering_partition():
+    assert assigned([[100, 100, 4900, 4900], [5000, 100, 6000, 200], [0, 5000, 10000, 6000]]) == \
+        [(0, 1), (1, 2), (2, 3)]
+
+
+def test_boxes_on_north_or_east_edge_are_assigned_to_neighbour():
+    # A piece along the edge of two partitions is only in the partition it does not lie on the max edge of
+    assert assigned([[5000, 100, 5000, 200], [100, 5000, 200, 5000], [5000, 5000, 5000, 5000]]) == \
+        [(0, 2), (1, 3), (2, 3)]
+
+
+def test_boxes_outside_or_across_partitions_are_left_out():
+    assert assigned([[20000, 100, 20100, 200], [4000, 100, 6000, 200]]) == []
+
+
+def test_assign_partitions_tags_pieces():
+    pieces = pd.DataFrame({
+        'trajectory_sub_id': [7, 8, 9], 'trajectory': ['a', 'b', 'c'],
+        'xmin': [100, 20000, 6000], 'ymin': [100, 100, 100], 'xmax': [200, 20100, 6100], 'ymax': [200, 200, 200],
+    })
+
+    tagged = assign_partitions(pieces, SpatialPartitionLookup(PARTITIONS))
+
+    assert tagged.columns.tolist() == ['trajectory_sub_id', 'trajectory', 'partition_id']
+    assert tagged.values.tolist() == [[7, 'a', 1], [9, 'c', 2]]
@@ -0,0 +1,128 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import etl.rollup.apply_rollups as apply_rollups
+from etl.audit.logger import global_audit_logger as gal, TIMINGS_KEY, ROLLUP_CRITICAL_PATH_KEY
+from etl.rollup import rollup_dag
+from etl.rollup.rollup_dag import RollupStep, critical_path, run_rollup_dag, topological_order
+
+ROLLUP_CONFIG = {'Database': {'rollup_executor_connections': '2', 'staging_cell_sizes_to_insert': '50,200,1000'}}
+
+
+class FakeConnection:
+    """Connection recording the steps committed by its transactions."""
+
+    def __init__(self, committed):
+        """Construct a connection appending the steps of committed transactions to committed."""
+        self.committed = committed
+        self.pending = []
+
+    def commit(self):
+        """Record the pending steps as committed."""
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        """Discard the pending steps."""
+        self.pending = []
+
+    def close(self):
+        """Close the connection."""
+
+
+def step(name, dependencies=(), seconds=0.01, running=None, fail=False):
+    """Return a step sleeping for the given seconds, recording the steps running at the same time."""
+    def run(conn):
+        running['now'].add(name)
+        running['max'] = max(running['max'], len(running['now']))
+        time.sleep(seconds)
+        running['now'].remove(name)
+        if fail:
+            raise RuntimeError(name)
+        conn.pending.append(name)
+    return RollupStep(name, run, list(dependencies))
+
+
+@pytest.fixture
+def running():
+    return {'now': set(), 'max': 0}
+
+
+@pytest.fixture
+def committed(monkeypatch):
+    committed = []
+    monkeypatch.setattr(rollup_dag, 'get_connection', lambda config: FakeConnection(committed))
+    gal.reset_log()
+    return committed
+
+
+def test_topological_order_rejects_unknown_and_cyclic_dependencies():
+    with pytest.raises(ValueError, match='unknown'):
+        topological_order([RollupStep('a', print, ['b'])])
+    with pytest.raises(ValueError, match='cyclic'):
+        topological_order([RollupStep('a', print, ['b']), RollupStep('b', print, ['a'])])
+
+
+def test_critical_path_follows_the_longest_chain():
+    steps = [RollupStep('a', print), RollupStep('b', print, ['a']), RollupStep('c', print, ['a']),
+             RollupStep('d', print, ['b', 'c'])]
+
+    assert critical_path(steps, {'a': 1, 'b': 5, 'c': 2, 'd': 1}) == (['a', 'b', 'd'], 7)
+
+
+def test_steps_run_concurrently_after_their_dependencies(committed, running):
+    steps = [step('simplify', running=running), step('length', ['simplify'], running=running),
+             step('split', ['simplify'], running=running), step('rollup_1', ['split'], running=running),
+             step('rollup_2', ['split'], running=running), step('heatmap', ['rollup_1', 'rollup_2'], running=running)]
+
+    run_rollup_dag(steps, ROLLUP_CONFIG)
+
+    assert sorted(committed) == sorted(s.name for s in steps)
+    for s in steps:
+        assert all(committed.index(dependency) < committed.index(s.name) for dependency in s.dependencies)
+    assert running['max'] == 2
+    assert set(gal[TIMINGS_KEY]) >= {f'rollup_step_{s.name}' for s in steps}
+    assert gal[ROLLUP_CRITICAL_PATH_KEY]['steps'][0] == 'simplify'
+    assert gal[ROLLUP_CRITICAL_PATH_KEY]['steps'][-1] == 'heatmap'
+
+
+def test_no_steps_start_after_a_failure(committed, running):
+    steps = [step('simplify', running=running), step('split', ['simplify'], running=running, fail=True),
+             step('rollup', ['split'], running=running)]
+
+    with pytest.raises(RuntimeError, match='split'):
+        run_rollup_dag(steps, ROLLUP_CONFIG)
+
+    assert committed == ['simplify']
+
+
+@pytest.mark.parametrize('day_partitions', [False, True])
+def test_rollup_steps_load_parent_cells_first(monkeypatch, day_partitions):
+    monkeypatch.setattr(apply_rollups, 'get_config', lambda: ROLLUP_CONFIG)
+    monkeypatch.setattr(apply_rollups, 'get_staging_cell_sizes', lambda: [50, 200, 1000])
+    monkeypatch.setattr(apply_rollups, 'day_partition_loading_enabled', lambda: day_partitions)
+
+    steps = {s.name: s.dependencies for s in apply_rollups.rollup_steps(datetime(2022, 1, 5))}
+
+    assert steps['fact_cell_50m_rollup'] == ['traj_split_5k']
+    assert steps['dim_cell_50m_lazy'] == ['fact_cell_50m_rollup', 'dim_cell_200m_lazy']
+    assert steps['dim_cell_1000m_lazy'] == ['fact_cell_1000m_rollup']
+    assert steps['drop_split_partition'] == ['fact_cell_50m_rollup', 'fact_cell_200m_rollup', 'fact_cell_1000m_rollup']
+    heatmap_dependency = 'attach_day_partitions' if day_partitions else 'dim_cell_200m_lazy'
+    assert steps['heatmap_200m_aggregation'] == [heatmap_dependency]
+
+
+def test_date_range_params_default_to_a_single_date():
+    assert apply_rollups.date_range_params(datetime(2022, 1, 5)) == \
+        {'from_date_smart_key': 20220105, 'to_date_smart_key': 20220105}
+    assert apply_rollups.date_range_params(datetime(2022, 1, 5), datetime(2022, 1, 9)) == \
+        {'from_date_smart_key': 20220105, 'to_date_smart_key': 20220109}
+
+
+def test_several_dates_are_not_rolled_up_with_day_partitions(monkeypatch):
+    monkeypatch.setattr(apply_rollups, 'day_partition_loading_enabled', lambda: True)
+
+    with pytest.raises(ValueError, match='day_partition_loading'):
+        apply_rollups.apply_rollups(None, datetime(2022, 1, 5), datetime(2022, 1, 6))
@@ -0,0 +1,42 @@
+from etl.rollup.split_partitions import drop_split_partition, prepare_split_partition, split_partition_name
+
+
+class FakePartitionConnection:
+    """Connection recording the statements executed and committed."""
+
+    def __init__(self):
+        """Construct a connection without executed statements."""
+        self.executed = []
+
+    def execute(self, statement, parameters=None):
+        """Record the whitespace normalized statement."""
+        self.executed.append(' '.join(str(statement).split()))
+
+    def commit(self):
+        """Record the commit."""
+        self.executed.append('COMMIT')
+
+
+def test_split_partition_name():
+    assert split_partition_name(20210614) == 'staging.split_trajectories_2021_06_14'
+
+
+def test_prepare_split_partition_replaces_leftover_partition_of_range():
+    conn = FakePartitionConnection()
+
+    prepare_split_partition(conn, 20210628, 20210702)
+
+    assert conn.executed == [
+        'DROP TABLE IF EXISTS staging.split_trajectories_2021_06_28',
+        'CREATE TABLE staging.split_trajectories_2021_06_28 PARTITION OF staging.split_trajectories '
+        'FOR VALUES FROM (20210628) TO (20210703)',
+        'COMMIT',
+    ]
+
+
+def test_drop_split_partition():
+    conn = FakePartitionConnection()
+
+    drop_split_partition(conn, 20210614)
+
+    assert conn.executed == ['DROP TABLE IF EXISTS staging.split_trajectories_2021_06_14', 'COMMIT']